@@ -0,0 +1,229 @@
+"""share system letter templates across tenants
+
+Revision ID: 9906eef37d86
+Revises: 89ab809b9669
+Create Date: 2026-10-19 09:00:00.000000+00:00
+
+"""
+import uuid
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9906eef37d86"
+down_revision: Union[str, None] = "89ab809b9669"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The system templates as of this revision. Later edits to the runtime seed in
+# app.services.letter_templates_seed do not change what this migration writes.
+letter_templates = sa.table(
+    "letter_templates",
+    sa.column("id", postgresql.UUID(as_uuid=True)),
+    sa.column("tenant_id", postgresql.UUID(as_uuid=True)),
+    sa.column("name", sa.String()),
+    sa.column("slug", sa.String()),
+    sa.column("category", postgresql.ENUM(name="letter_template_category", create_type=False)),
+    sa.column("channel", postgresql.ENUM(name="letter_delivery_channel", create_type=False)),
+    sa.column("version", sa.Integer()),
+    sa.column("locale", sa.String()),
+    sa.column("subject", sa.String()),
+    sa.column("preview_text", sa.String()),
+    sa.column("body", sa.Text()),
+    sa.column("is_active", sa.Boolean()),
+)
+
+SYSTEM_TEMPLATES = [
+    {
+        "slug": "bureau-reinvestigation",
+        "name": "Bureau Reinvestigation",
+        "subject": "Request for Reinvestigation of Reported Information",
+        "preview_text": "Challenges inaccurate bureau reporting and requests reinvestigation.",
+        "category": "dispute",
+        "channel": "mail",
+        "body": "# Request for Reinvestigation\n\n{{ current_date }}\n\n{{ bureaus.address_line | default('') }}\n\nRe: Reinvestigation Request for {{ client.full_name }}\n\nTo Whom It May Concern,\n\nI am disputing the accuracy of the items listed below. Please complete a reinvestigation within 30 days and provide written confirmation of the outcome.\n\n{% for item in items %}## {{ item.furnisher }} - {{ item.account_number | default('N/A') }}\n- Issue: {{ item.issue }}\n- Requested Resolution: {{ item.requested_resolution }}\n{% endfor %}\n\nAttached you will find supporting identification and documentation.\n\nSincerely,\n\n{{ client.full_name }}\n{{ client.address_line1 }}\n{% if client.address_line2 %}{{ client.address_line2 }}\n{% endif %}{{ client.city }}, {{ client.state }} {{ client.postal_code }}\n",
+    },
+    {
+        "slug": "furnisher-investigation",
+        "name": "Furnisher Investigation",
+        "subject": "Formal Investigation Request",
+        "preview_text": "Direct dispute letter to the furnishing creditor.",
+        "category": "dispute",
+        "channel": "mail",
+        "body": "# Investigation Request\n\n{{ current_date }}\n\n{{ furnisher.name }}\n{{ furnisher.address_line | default('') }}\n\nRe: {{ account.account_number | default('Account') }}\n\nTo Whom It May Concern,\n\nI request a reasonable investigation into the information furnished for the above account. Please provide documentation validating the reporting or update the bureaus to reflect the correct status.\n\n- Reported Status: {{ account.reported_status | default('Unknown') }}\n- Claimed Issue: {{ account.issue }}\n- Requested Outcome: {{ account.requested_resolution | default('Correct or remove the tradeline') }}\n\nPlease respond within 30 days as required by the FCRA.\n\nRegards,\n\n{{ client.full_name }}\n{{ client.address_line1 }}\n{% if client.address_line2 %}{{ client.address_line2 }}\n{% endif %}{{ client.city }}, {{ client.state }} {{ client.postal_code }}\n",
+    },
+    {
+        "slug": "identity-mismatch",
+        "name": "Identity Mismatch",
+        "subject": "Incorrect Personal Information",
+        "preview_text": "Highlights personal data mismatches on the credit file.",
+        "category": "compliance",
+        "channel": "mail",
+        "body": "# Identity Information Does Not Match\n\n{{ current_date }}\n\nTo Whom It May Concern,\n\nThe credit file associated with my Social Security number contains personal information that does not belong to me.\n\n{% for mismatch in mismatches %}- Field: {{ mismatch.field }} - Reported: {{ mismatch.reported }} - Correct: {{ mismatch.expected }}\n{% endfor %}\n\nPlease correct these items immediately and provide written confirmation once the updates are complete.\n\nThank you,\n\n{{ client.full_name }}\n{{ client.address_line1 }}\n{% if client.address_line2 %}{{ client.address_line2 }}\n{% endif %}{{ client.city }}, {{ client.state }} {{ client.postal_code }}\n",
+    },
+    {
+        "slug": "obsolete-information",
+        "name": "Obsolete Information",
+        "subject": "Removal of Obsolete Information",
+        "preview_text": "Requests deletion of accounts past the reporting period.",
+        "category": "dispute",
+        "channel": "mail",
+        "body": "# Removal of Obsolete Information\n\n{{ current_date }}\n\nTo Whom It May Concern,\n\nThe following accounts are older than the maximum reporting period allowed by the Fair Credit Reporting Act and should be removed from my credit file:\n\n{% for account in accounts %}- {{ account.furnisher }} - {{ account.account_number }} (DOFD: {{ account.dofd }})\n{% endfor %}\n\nPlease delete these obsolete entries and send updated copies of my report.\n\nSincerely,\n\n{{ client.full_name }}\n{{ client.address_line1 }}\n{% if client.address_line2 %}{{ client.address_line2 }}\n{% endif %}{{ client.city }}, {{ client.state }} {{ client.postal_code }}\n",
+    },
+    {
+        "slug": "incorrect-balance-limit",
+        "name": "Incorrect Balance/Limit",
+        "subject": "Incorrect Balance or Credit Limit Reporting",
+        "preview_text": "Challenges discrepancies between reported balances and limits.",
+        "category": "dispute",
+        "channel": "mail",
+        "body": "# Incorrect Balance or Credit Limit Reporting\n\n{{ current_date }}\n\nTo Whom It May Concern,\n\nI dispute the accuracy of the balance and/or credit limit reported for the accounts listed below:\n\n{% for account in accounts %}## {{ account.furnisher }} - {{ account.account_number }}\n- Reported Balance: {{ account.reported_balance }}\n- Actual Balance: {{ account.actual_balance }}\n- Reported Limit: {{ account.reported_limit }}\n- Actual Limit: {{ account.actual_limit }}\n{% endfor %}\n\nPlease correct these figures with all bureaus and confirm the updates in writing.\n\nRespectfully,\n\n{{ client.full_name }}\n{{ client.address_line1 }}\n{% if client.address_line2 %}{{ client.address_line2 }}\n{% endif %}{{ client.city }}, {{ client.state }} {{ client.postal_code }}\n",
+    },
+    {
+        "slug": "dofd-mismatch",
+        "name": "DOFD Mismatch",
+        "subject": "Incorrect Date of First Delinquency",
+        "preview_text": "Requests correction of the date of first delinquency.",
+        "category": "dispute",
+        "channel": "mail",
+        "body": "# Incorrect Date of First Delinquency\n\n{{ current_date }}\n\nTo Whom It May Concern,\n\nThe Date of First Delinquency reported for the account(s) below is inaccurate:\n\n{% for account in accounts %}- {{ account.furnisher }} - {{ account.account_number }}: Reported {{ account.reported_dofd }}, Actual {{ account.actual_dofd }}\n{% endfor %}\n\nPlease investigate and update the credit bureaus with the correct DOFD.\n\nThank you,\n\n{{ client.full_name }}\n{{ client.address_line1 }}\n{% if client.address_line2 %}{{ client.address_line2 }}\n{% endif %}{{ client.city }}, {{ client.state }} {{ client.postal_code }}\n",
+    },
+]
+
+
+def upgrade() -> None:
+    op.alter_column(
+        "letter_templates",
+        "tenant_id",
+        existing_type=postgresql.UUID(as_uuid=True),
+        nullable=True,
+    )
+    op.add_column(
+        "letter_templates",
+        sa.Column(
+            "source_template_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("letter_templates.id"),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        "ix_letter_templates_system_slug",
+        "letter_templates",
+        ["slug"],
+        unique=True,
+        postgresql_where=sa.text("tenant_id IS NULL"),
+    )
+    op.create_index(
+        "ix_letter_templates_tenant_source",
+        "letter_templates",
+        ["tenant_id", "source_template_id"],
+    )
+
+    op.bulk_insert(
+        letter_templates,
+        [
+            {
+                "id": uuid.uuid4(),
+                "tenant_id": None,
+                "version": 1,
+                "locale": "en-US",
+                "is_active": True,
+                **definition,
+            }
+            for definition in SYSTEM_TEMPLATES
+        ],
+    )
+
+    # Per-tenant copies that were never edited collapse onto the shared row.
+    op.execute(
+        """
+        UPDATE generated_letters AS gl
+        SET template_id = sys.id
+        FROM letter_templates AS t
+        JOIN letter_templates AS sys
+          ON sys.tenant_id IS NULL AND sys.slug = t.slug
+        WHERE gl.template_id = t.id
+          AND t.tenant_id IS NOT NULL
+          AND t.deleted_at IS NULL
+          AND t.name = sys.name
+          AND t.body = sys.body
+          AND t.subject IS NOT DISTINCT FROM sys.subject
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM letter_templates AS t
+        USING letter_templates AS sys
+        WHERE sys.tenant_id IS NULL
+          AND sys.slug = t.slug
+          AND t.tenant_id IS NOT NULL
+          AND t.deleted_at IS NULL
+          AND t.name = sys.name
+          AND t.body = sys.body
+          AND t.subject IS NOT DISTINCT FROM sys.subject
+        """
+    )
+    # Anything left under a system slug was edited or archived: keep it as the
+    # tenant's private copy so it keeps shadowing the shared row.
+    op.execute(
+        """
+        UPDATE letter_templates AS t
+        SET source_template_id = sys.id
+        FROM letter_templates AS sys
+        WHERE sys.tenant_id IS NULL
+          AND sys.slug = t.slug
+          AND t.tenant_id IS NOT NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    # Materialise a per-tenant copy of every system template the tenant has not
+    # already forked, then drop the shared rows.
+    op.execute(
+        """
+        INSERT INTO letter_templates (
+            id, tenant_id, name, slug, category, channel, version, locale,
+            subject, preview_text, body, variables, is_active, created_at, updated_at
+        )
+        SELECT
+            gen_random_uuid(), tn.id, sys.name, sys.slug, sys.category, sys.channel,
+            sys.version, sys.locale, sys.subject, sys.preview_text, sys.body,
+            sys.variables, sys.is_active, now(), now()
+        FROM letter_templates AS sys
+        CROSS JOIN tenants AS tn
+        WHERE sys.tenant_id IS NULL
+          AND NOT EXISTS (
+            SELECT 1 FROM letter_templates AS own
+            WHERE own.tenant_id = tn.id AND own.slug = sys.slug
+          )
+        """
+    )
+    op.execute(
+        """
+        UPDATE generated_letters AS gl
+        SET template_id = own.id
+        FROM letter_templates AS sys
+        JOIN letter_templates AS own
+          ON own.slug = sys.slug AND own.tenant_id IS NOT NULL
+        WHERE gl.template_id = sys.id
+          AND sys.tenant_id IS NULL
+          AND own.tenant_id = gl.tenant_id
+        """
+    )
+    op.execute("DELETE FROM letter_templates WHERE tenant_id IS NULL")
+
+    op.drop_index("ix_letter_templates_tenant_source", table_name="letter_templates")
+    op.drop_index("ix_letter_templates_system_slug", table_name="letter_templates")
+    op.drop_column("letter_templates", "source_template_id")
+    op.alter_column(
+        "letter_templates",
+        "tenant_id",
+        existing_type=postgresql.UUID(as_uuid=True),
+        nullable=False,
+    )
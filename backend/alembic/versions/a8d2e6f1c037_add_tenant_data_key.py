@@ -0,0 +1,40 @@
+"""add per-tenant document data key
+
+Revision ID: a8d2e6f1c037
+Revises: f5c19a7e3d42
+Create Date: 2026-10-19 15:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a8d2e6f1c037"
+down_revision: Union[str, None] = "f5c19a7e3d42"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    try:
+        return column in [c["name"] for c in insp.get_columns(table)]
+    except Exception:
+        return False
+
+
+def upgrade() -> None:
+    if not _has_column("tenants", "data_key_id"):
+        op.add_column("tenants", sa.Column("data_key_id", sa.String(), nullable=True))
+    # Documents uploaded before encryption are stored in plaintext; the column
+    # defaulted to true, so make it reflect reality.
+    if _has_column("documents", "is_encrypted"):
+        op.execute("UPDATE documents SET is_encrypted = false WHERE encryption_key_id IS NULL")
+
+
+def downgrade() -> None:
+    if _has_column("tenants", "data_key_id"):
+        op.drop_column("tenants", "data_key_id")
@@ -0,0 +1,124 @@
+"""partition compliance log tables by month
+
+Revision ID: b3f91c5d2e48
+Revises: a8d2e6f1c037
+Create Date: 2026-10-19 16:00:00.000000+00:00
+
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b3f91c5d2e48"
+down_revision: Union[str, None] = "a8d2e6f1c037"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Frozen at this revision; later changes to app.services.partitioning do not
+# change what this migration runs.
+TABLES = ("audit_logs", "data_access_logs", "compliance_events")
+
+FOREIGN_KEYS = {
+    "audit_logs": (("tenant_id", "tenants"), ("user_id", "users")),
+    "data_access_logs": (("tenant_id", "tenants"), ("user_id", "users")),
+    "compliance_events": (("tenant_id", "tenants"), ("client_id", "clients"), ("user_id", "users")),
+}
+
+INDEXES = (("created_at", "created_at"), ("tenant_created", "tenant_id, created_at"))
+
+PREMAKE_MONTHS = 3
+
+
+def _has_table(table: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month: date) -> str:
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def _partition(table: str) -> None:
+    default = f"{table}_default"
+    op.execute(f"ALTER TABLE {table} RENAME TO {default}")
+    op.execute(f"ALTER INDEX IF EXISTS ix_{table}_created_at RENAME TO ix_{default}_created_at")
+    op.execute(
+        f"CREATE TABLE {table} (LIKE {default} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        f"PARTITION BY RANGE (created_at)"
+    )
+    op.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+    op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)")
+    for column, referenced in FOREIGN_KEYS[table]:
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT fk_{table}_{column} "
+            f"FOREIGN KEY ({column}) REFERENCES {referenced} (id)"
+        )
+    for suffix, columns in INDEXES:
+        op.execute(f"CREATE INDEX ix_{table}_{suffix} ON {table} ({columns})")
+
+
+def _carve(table: str, month: date) -> None:
+    default = f"{table}_default"
+    suffix = f"y{month.year:04d}m{month.month:02d}"
+    name = f"{table}_{suffix}"
+    lower, upper = _bound(month), _bound(_add_months(month, 1))
+    in_range = f"created_at >= {lower} AND created_at < {upper}"
+
+    op.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    op.execute(f"LOCK TABLE {default} IN SHARE ROW EXCLUSIVE MODE")
+    op.execute(
+        f"WITH moved AS (DELETE FROM {default} WHERE {in_range} RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    )
+    op.execute(f"ALTER TABLE {name} ADD CONSTRAINT {name}_range CHECK ({in_range})")
+    op.execute(f"ALTER TABLE {default} ADD CONSTRAINT {default}_not_{suffix} CHECK (NOT ({in_range})) NOT VALID")
+    op.execute(f"ALTER TABLE {default} VALIDATE CONSTRAINT {default}_not_{suffix}")
+    op.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ({lower}) TO ({upper})")
+    op.execute(f"ALTER TABLE {name} DROP CONSTRAINT {name}_range")
+    op.execute(f"ALTER TABLE {default} DROP CONSTRAINT {default}_not_{suffix}")
+
+
+def _unpartition(table: str) -> None:
+    plain = f"{table}_unpartitioned"
+    op.execute(f"CREATE TABLE {plain} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    op.execute(f"INSERT INTO {plain} SELECT * FROM {table}")
+    op.execute(f"DROP TABLE {table}")
+    op.execute(f"ALTER TABLE {plain} RENAME TO {table}")
+    op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+    for column, referenced in FOREIGN_KEYS[table]:
+        op.execute(f"ALTER TABLE {table} ADD FOREIGN KEY ({column}) REFERENCES {referenced} (id)")
+    op.execute(f"CREATE INDEX ix_{table}_created_at ON {table} (created_at)")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    today = datetime.now(timezone.utc)
+    current = date(today.year, today.month, 1)
+    # Existing rows stay in each table's default partition; move them into
+    # monthly partitions afterwards with `manage.py partitions backfill`.
+    # The current month is left there too, so only upcoming months are made.
+    for table in TABLES:
+        if _has_table(table):
+            _partition(table)
+            for offset in range(1, PREMAKE_MONTHS + 1):
+                _carve(table, _add_months(current, offset))
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    for table in TABLES:
+        if _has_table(table):
+            _unpartition(table)
@@ -0,0 +1,36 @@
+"""add content_sha256 to documents
+
+Revision ID: c41d7e2a9b10
+Revises: 9906eef37d86
+Create Date: 2026-10-19 10:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c41d7e2a9b10"
+down_revision: Union[str, None] = "9906eef37d86"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    try:
+        return column in [c["name"] for c in insp.get_columns(table)]
+    except Exception:
+        return False
+
+
+def upgrade() -> None:
+    if not _has_column("documents", "content_sha256"):
+        op.add_column("documents", sa.Column("content_sha256", sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    if _has_column("documents", "content_sha256"):
+        op.drop_column("documents", "content_sha256")
@@ -0,0 +1,70 @@
+"""add daily compliance rollups and created_at indexes
+
+Revision ID: c6e2a1f94b07
+Revises: b3f91c5d2e48
+Create Date: 2026-10-19 17:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c6e2a1f94b07"
+down_revision: Union[str, None] = "b3f91c5d2e48"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The rollup refresh reads each log table by created_at range across tenants
+_LOG_TABLES = ("audit_logs", "data_access_logs", "compliance_events")
+
+
+def _has_table(table: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade() -> None:
+    if not _has_table("compliance_daily_rollups"):
+        op.create_table(
+            "compliance_daily_rollups",
+            sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True, nullable=False),
+            sa.Column("tenant_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("tenants.id"), nullable=False),
+            sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=True),
+            sa.Column("day", sa.Date(), nullable=False),
+            sa.Column("reads", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("writes", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("logins", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("sensitive_accesses", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("gdpr_requests", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index(
+            "ix_compliance_daily_rollups_tenant_day_user",
+            "compliance_daily_rollups",
+            ["tenant_id", "day", "user_id"],
+            unique=True,
+        )
+    if not _has_table("compliance_rollup_watermarks"):
+        op.create_table(
+            "compliance_rollup_watermarks",
+            sa.Column("source", sa.String(), primary_key=True, nullable=False),
+            sa.Column("processed_through", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+    for table in _LOG_TABLES:
+        if _has_table(table):
+            op.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_created_at ON {table} (created_at)")
+
+
+def downgrade() -> None:
+    for table in _LOG_TABLES:
+        if _has_table(table):
+            op.execute(f"DROP INDEX IF EXISTS ix_{table}_created_at")
+    if _has_table("compliance_rollup_watermarks"):
+        op.drop_table("compliance_rollup_watermarks")
+    if _has_table("compliance_daily_rollups"):
+        op.drop_index("ix_compliance_daily_rollups_tenant_day_user", table_name="compliance_daily_rollups")
+        op.drop_table("compliance_daily_rollups")
@@ -0,0 +1,45 @@
+"""index documents for content-hash dedup
+
+Revision ID: d7a3f05b2c61
+Revises: c41d7e2a9b10
+Create Date: 2026-10-19 11:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d7a3f05b2c61"
+down_revision: Union[str, None] = "c41d7e2a9b10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_INDEXES = {
+    "ix_documents_tenant_content_sha256": ["tenant_id", "content_sha256"],
+    "ix_documents_tenant_s3_key": ["tenant_id", "s3_key"],
+}
+
+
+def _existing_indexes(table: str) -> set:
+    insp = sa.inspect(op.get_bind())
+    try:
+        return {ix["name"] for ix in insp.get_indexes(table)}
+    except Exception:
+        return set()
+
+
+def upgrade() -> None:
+    existing = _existing_indexes("documents")
+    for name, columns in _INDEXES.items():
+        if name not in existing:
+            op.create_index(name, "documents", columns)
+
+
+def downgrade() -> None:
+    existing = _existing_indexes("documents")
+    for name in _INDEXES:
+        if name in existing:
+            op.drop_index(name, table_name="documents")
@@ -0,0 +1,42 @@
+"""add text_extraction_status to documents
+
+Revision ID: e2b8c4d19f07
+Revises: d7a3f05b2c61
+Create Date: 2026-10-19 12:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e2b8c4d19f07"
+down_revision: Union[str, None] = "d7a3f05b2c61"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    try:
+        return column in [c["name"] for c in insp.get_columns(table)]
+    except Exception:
+        return False
+
+
+def upgrade() -> None:
+    if not _has_column("documents", "text_extraction_status"):
+        op.add_column("documents", sa.Column("text_extraction_status", sa.String(length=20), nullable=True))
+        op.create_index(
+            "ix_documents_text_extraction_status",
+            "documents",
+            ["text_extraction_status", "mime_type"],
+        )
+
+
+def downgrade() -> None:
+    if _has_column("documents", "text_extraction_status"):
+        op.drop_index("ix_documents_text_extraction_status", table_name="documents")
+        op.drop_column("documents", "text_extraction_status")
@@ -0,0 +1,60 @@
+"""add full-text search vectors for documents and letters
+
+Revision ID: f5c19a7e3d42
+Revises: e2b8c4d19f07
+Create Date: 2026-10-19 13:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f5c19a7e3d42"
+down_revision: Union[str, None] = "e2b8c4d19f07"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# tsvector values are limited to 1 MB, and an over-long one fails the write
+# that produced it. Unique one-character words in a three-byte script cost
+# about 6 bytes of tsvector per input character, so only this many characters
+# of extracted text are indexed (app.services.search.SEARCH_TEXT_CHARS).
+SEARCH_TEXT_CHARS = 100_000
+
+# Generated columns keep the vectors in sync with every insert and update, so
+# there are no triggers or backfill jobs to maintain. Not mapped on the ORM
+# models: app.services.search queries them with raw SQL on PostgreSQL only.
+_VECTORS = {
+    "documents": (
+        "setweight(to_tsvector('english', "
+        f"left(coalesce(extracted_text, ''), {SEARCH_TEXT_CHARS})), 'A') || "
+        "setweight(to_tsvector('english', coalesce(original_filename, '')), 'B')"
+    ),
+    "generated_letters": (
+        "setweight(to_tsvector('english', coalesce(subject, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(body, '')), 'B')"
+    ),
+}
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    for table, expression in _VECTORS.items():
+        op.execute(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({expression}) STORED"
+        )
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector "
+            f"ON {table} USING gin (search_vector)"
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    for table in _VECTORS:
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_search_vector")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
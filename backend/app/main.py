@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
 from .routers import (
@@ -20,8 +20,17 @@ from .routers import (
     documents,
     billing,
     compliance,
+    search,
+    storage,
     websocket,
 )
+from .middleware.audit import AuditMiddleware
+from .middleware.performance import CacheMiddleware, CompressionMiddleware, RateLimitMiddleware
+from .middleware.security import InputValidationMiddleware, SecurityHeadersMiddleware
+from .models.user import User
+from .security import get_current_active_user
+from .services.rate_limit import rate_limiter
+from .services.response_cache import response_cache
 
 app = FastAPI(
     title="CredKit CRM API",
@@ -56,6 +65,17 @@ app = FastAPI(
     },
 )
 
+# Added innermost first. Compression sits outside the response cache, which
+# stores identity bodies; rate limiting and input validation turn requests
+# away before they reach auditing or any router; CORS wraps everything so
+# those refusals still carry CORS headers.
+app.add_middleware(CacheMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(SecurityHeadersMiddleware)
+app.add_middleware(AuditMiddleware)
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+app.add_middleware(InputValidationMiddleware)
+
 # This would be configured more securely for production
 app.add_middleware(
     CORSMiddleware,
@@ -63,6 +83,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # keyset pagination cursors
 )
 
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
@@ -83,9 +104,19 @@ app.include_router(automations.router, prefix="/api/v1/automations", tags=["auto
 app.include_router(documents.router, prefix="/api/v1/documents", tags=["documents"])
 app.include_router(billing.router, prefix="/api/v1/billing", tags=["billing"])
 app.include_router(compliance.router, prefix="/api/v1/compliance", tags=["compliance"])
+app.include_router(search.router, prefix="/api/v1/search", tags=["search"])
+app.include_router(storage.router, prefix="/api/v1/storage", tags=["storage"])
 app.include_router(websocket.router, prefix="/api/v1", tags=["ws"])
 
 
 @app.get("/api/v1/health")
 def health_check():
     return {"status": "ok"}
+
+
+@app.get("/api/v1/cache/metrics")
+def cache_metrics(current_user: User = Depends(get_current_active_user)):
+    """Report response cache hit ratios and lookup latency per tier"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {"response_cache": response_cache.stats()}
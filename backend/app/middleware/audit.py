@@ -1,20 +1,43 @@
 import time
 import asyncio
 import logging
+from typing import Optional
 
 from fastapi import Request
 
-from ..models.audit_log import AuditLog, AuditAction, AuditResourceType
+from ..models.audit_log import AuditAction, AuditResourceType
+from .asgi import token_identity
 from ..database import SessionLocal
+from ..services.audit_writer import audit_event, audit_log_writer
 
 logger = logging.getLogger(__name__)
 
 
+def _content_length(scope) -> Optional[int]:
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
 class AuditMiddleware:
-    def __init__(self, app):
+    """Record an audit event per request.
+
+    Events are handed to a background :class:`AuditLogWriter` that bulk-inserts
+    them, so the request path never waits on the database.
+    """
+
+    def __init__(self, app, writer=None):
         self.app = app
+        self.writer = writer or audit_log_writer
 
     async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.app(scope, receive, self._lifespan_send(send))
+            return
         if scope["type"] == "http":
             request = Request(scope, receive)
             
@@ -25,31 +48,32 @@ class AuditMiddleware:
             
             # Capture request details
             start_time = time.time()
-            request_body = None
             
-            # Capture request body for audit
-            if request.method in ["POST", "PUT", "PATCH"]:
-                try:
-                    body = await request.body()
-                    if body:
-                        request_body = body.decode('utf-8')
-                except Exception:
-                    request_body = None
-            
-            # Process request
-            response_body = None
+            # Sizes are counted as bodies stream through; nothing is buffered
+            # or decoded, so uploads and downloads stay streaming.
+            request_size = _content_length(scope)
+            received = 0
+            response_size = 0
             status_code = 200
             
+            async def receive_wrapper():
+                nonlocal received
+                message = await receive()
+                if message["type"] == "http.request":
+                    received += len(message.get("body", b""))
+                return message
+            
             async def send_wrapper(message):
-                nonlocal response_body, status_code
+                nonlocal response_size, status_code
                 if message["type"] == "http.response.start":
                     status_code = message["status"]
                 elif message["type"] == "http.response.body":
-                    if message.get("body"):
-                        response_body = message["body"].decode('utf-8')
+                    response_size += len(message.get("body", b""))
                 await send(message)
             
-            await self.app(scope, receive, send_wrapper)
+            await self.app(
+                scope, receive if request_size is not None else receive_wrapper, send_wrapper
+            )
             
             # Log the request
             processing_time = time.time() - start_time
@@ -57,19 +81,29 @@ class AuditMiddleware:
                 request=request,
                 status_code=status_code,
                 processing_time=processing_time,
-                request_body=request_body,
-                response_body=response_body
+                request_size=request_size if request_size is not None else received,
+                response_size=response_size
             )
         else:
             await self.app(scope, receive, send)
 
+    def _lifespan_send(self, send):
+        async def lifespan_send(message):
+            if message["type"] == "lifespan.startup.complete":
+                self.writer.start()
+            elif message["type"] == "lifespan.shutdown.complete":
+                # Flush queued events before the process exits
+                await self.writer.stop()
+            await send(message)
+        return lifespan_send
+
     async def _log_request(
         self,
         request: Request,
         status_code: int,
         processing_time: float,
-        request_body: str = None,
-        response_body: str = None
+        request_size: int = 0,
+        response_size: int = 0
     ):
         """Log request details for audit purposes"""
         try:
@@ -86,6 +120,9 @@ class AuditMiddleware:
                 user_email = user.email
                 user_role = user.role
                 tenant_id = str(user.tenant_id)
+            else:
+                # Nothing upstream resolves the user, so read the bearer token
+                tenant_id, user_email = token_identity(request.scope)
             
             # Determine action and resource type from path
             action, resource_type, resource_id = self._parse_request_path(
@@ -93,40 +130,29 @@ class AuditMiddleware:
                 request.url.path
             )
             
-            # Create audit log entry
-            db = SessionLocal()
-            try:
-                audit_log = AuditLog(
-                    tenant_id=tenant_id,
-                    action=action,
-                    resource_type=resource_type,
-                    resource_id=resource_id,
-                    user_id=user_id,
-                    user_email=user_email,
-                    user_role=user_role,
-                    ip_address=request.client.host if request.client else None,
-                    user_agent=request.headers.get("user-agent"),
-                    request_method=request.method,
-                    request_path=request.url.path,
-                    description=f"{request.method} {request.url.path} - {status_code}",
-                    event_metadata={
-                        "status_code": status_code,
-                        "processing_time": processing_time,
-                        "query_params": dict(request.query_params),
-                        "request_size": len(request_body) if request_body else 0,
-                        "response_size": len(response_body) if response_body else 0
-                    },
-                    is_sensitive=self._is_sensitive_endpoint(request.url.path)
-                )
-                
-                db.add(audit_log)
-                db.commit()
-                
-            except Exception as e:
-                logger.error(f"Failed to create audit log: {str(e)}")
-                db.rollback()
-            finally:
-                db.close()
+            # Queue the audit log entry; the writer inserts it in a batch
+            self.writer.submit(audit_event(
+                tenant_id=tenant_id,
+                action=action,
+                resource_type=resource_type,
+                resource_id=resource_id,
+                user_id=user_id,
+                user_email=user_email,
+                user_role=user_role,
+                ip_address=request.client.host if request.client else None,
+                user_agent=request.headers.get("user-agent"),
+                request_method=request.method,
+                request_path=request.url.path,
+                description=f"{request.method} {request.url.path} - {status_code}",
+                event_metadata={
+                    "status_code": status_code,
+                    "processing_time": processing_time,
+                    "query_params": dict(request.query_params),
+                    "request_size": request_size,
+                    "response_size": response_size
+                },
+                is_sensitive=self._is_sensitive_endpoint(request.url.path)
+            ))
                 
         except Exception as e:
             logger.error(f"Audit middleware error: {str(e)}")
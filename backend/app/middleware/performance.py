@@ -1,207 +1,427 @@
+import os
 import time
 import logging
-from fastapi import Request, Response
-from fastapi.middleware.base import BaseHTTPMiddleware
-import json
-from typing import Callable
+import zlib
+from functools import lru_cache
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import QueryParams
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.rate_limit import (
+    RATE_LIMIT_EXEMPT_PATHS,
+    PlanCache,
+    RateLimit,
+    RateLimiter,
+    plan_rate_limit,
+    retry_after_header,
+)
+from app.services.response_cache import (
+    RESPONSE_CACHE_TTL,
+    CachedResponse,
+    ResponseCache,
+    resource_for_path,
+    response_cache,
+)
+
+from .asgi import header_value, on_response_start, send_json, set_response_headers, token_identity
+
+try:
+    import brotli
+except ImportError:  # optional; without it only gzip is offered
+    brotli = None
 
 logger = logging.getLogger(__name__)
 
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 5))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 4))
+
+# Media types worth compressing; entries ending in "/" match a whole family
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
 
-class PerformanceMiddleware(BaseHTTPMiddleware):
+AVAILABLE_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+class PerformanceMiddleware:
     """Middleware for performance monitoring and optimization"""
-    
-    def __init__(self, app, redis_client=None):
-        super().__init__(app)
+
+    def __init__(self, app: ASGIApp, redis_client=None):
+        self.app = app
         self.redis_client = redis_client
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # Start timing
         start_time = time.time()
-        
-        # Add performance headers
-        response = await call_next(request)
-        
-        # Calculate processing time
-        process_time = time.time() - start_time
-        
-        # Add performance headers
-        response.headers["X-Process-Time"] = str(process_time)
-        response.headers["X-Timestamp"] = str(int(time.time()))
-        
-        # Log slow requests (> 1 second)
-        if process_time > 1.0:
-            logger.warning(
-                f"Slow request: {request.method} {request.url.path} "
-                f"took {process_time:.2f}s"
-            )
-        
-        return response
-
-
-class CacheMiddleware(BaseHTTPMiddleware):
-    """Redis-based caching middleware for GET requests"""
-    
-    def __init__(self, app, redis_client=None):
-        super().__init__(app)
-        self.redis_client = redis_client
-        self.cache_ttl = 300  # 5 minutes default TTL
-        
-        # Cacheable endpoints
-        self.cacheable_patterns = [
-            "/api/v1/clients",
-            "/api/v1/tasks",
-            "/api/v1/disputes",
-            "/api/v1/stages",
-            "/api/v1/tags"
-        ]
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Only cache GET requests
-        if request.method != "GET" or not self.redis_client:
-            return await call_next(request)
-        
-        # Check if endpoint is cacheable
-        path = request.url.path
-        if not any(pattern in path for pattern in self.cacheable_patterns):
-            return await call_next(request)
-        
+        def add_headers(message: Message) -> None:
+            # Processing time is measured up to the response headers
+            process_time = time.time() - start_time
+            set_response_headers(message, [
+                (b"x-process-time", str(process_time).encode()),
+                (b"x-timestamp", str(int(time.time())).encode()),
+            ])
+
+            # Log slow requests (> 1 second)
+            if process_time > 1.0:
+                logger.warning(
+                    f"Slow request: {scope['method']} {scope['path']} "
+                    f"took {process_time:.2f}s"
+                )
+
+        await self.app(scope, receive, on_response_start(send, add_headers))
+
+
+class CacheMiddleware:
+    """Two-tier (in-process LRU, then Redis) cache for GET requests
+
+    Entries are keyed on the tenant's version tag for the resource (see
+    :mod:`app.services.response_cache`). A successful write under a cached
+    prefix bumps that tag, so entries can live for ``RESPONSE_CACHE_TTL``
+    without being served stale. Without a ``redis_client`` the shared
+    :data:`response_cache` is used.
+    """
+
+    def __init__(self, app: ASGIApp, redis_client=None, cache_ttl: Optional[int] = None, cache=None):
+        self.app = app
+        if cache is None:
+            if redis_client is None:
+                cache = response_cache
+            else:
+                cache = ResponseCache(redis_client, ttl=RESPONSE_CACHE_TTL if cache_ttl is None else cache_ttl)
+        self.cache = cache
+        self.versions = cache.versions
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.cache.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        # Only authenticated requests under a cached prefix are considered;
+        # everything else goes straight through
+        resource = resource_for_path(scope["path"])
+        tenant_id, user_id = token_identity(scope) if resource else (None, None)
+        if tenant_id is None:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] != "GET":
+            if scope["method"] in ("HEAD", "OPTIONS"):
+                await self.app(scope, receive, send)
+            else:
+                await self.app(scope, receive, self._invalidate_on_success(send, tenant_id, resource))
+            return
+
         # Generate cache key
-        cache_key = self._generate_cache_key(request)
-        
         try:
-            # Try to get from cache
-            cached_response = self.redis_client.get(cache_key)
-            if cached_response:
-                logger.info(f"Cache hit for {path}")
-                cached_data = json.loads(cached_response)
-                
-                response = Response(
-                    content=cached_data["content"],
-                    status_code=cached_data["status_code"],
-                    headers=cached_data["headers"]
-                )
-                response.headers["X-Cache"] = "HIT"
-                return response
-        
+            cache_key = self._generate_cache_key(scope, tenant_id, user_id, resource)
         except Exception as e:
-            logger.error(f"Cache read error: {str(e)}")
-        
-        # Cache miss - execute request
-        response = await call_next(request)
-        
-        # Cache successful responses
-        if response.status_code == 200:
-            try:
-                # Read response body
-                response_body = b""
-                async for chunk in response.body_iterator:
-                    response_body += chunk
-                
-                # Cache the response
-                cache_data = {
-                    "content": response_body.decode(),
-                    "status_code": response.status_code,
-                    "headers": dict(response.headers)
-                }
-                
-                self.redis_client.setex(
-                    cache_key,
-                    self.cache_ttl,
-                    json.dumps(cache_data)
-                )
-                
-                # Recreate response
-                response = Response(
-                    content=response_body,
-                    status_code=response.status_code,
-                    headers=response.headers
-                )
-                response.headers["X-Cache"] = "MISS"
-                
-            except Exception as e:
-                logger.error(f"Cache write error: {str(e)}")
-        
-        return response
-
-    def _generate_cache_key(self, request: Request) -> str:
+            logger.error(f"Cache version read error: {str(e)}")
+            await self.app(scope, receive, send)
+            return
+
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            await self._send_cached(send, cached)
+            return
+
+        # Cache miss - chunks go out as they are produced and are copied
+        # aside only for successful responses that fit in an entry
+        status_code = 200
+        headers: list = []
+        chunks: Optional[List[bytes]] = []
+        size = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, headers, chunks, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", ()))
+                if status_code == 200:
+                    set_response_headers(message, [(b"x-cache", b"MISS")])
+            elif message["type"] == "http.response.body" and status_code == 200 and chunks is not None:
+                body = message.get("body", b"")
+                size += len(body)
+                if size > self.cache.max_entry_bytes:
+                    chunks = None
+                else:
+                    chunks.append(body)
+                    if not message.get("more_body", False):
+                        self.cache.set(cache_key, CachedResponse(status_code, headers, b"".join(chunks)))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _invalidate_on_success(self, send: Send, tenant_id: str, resource: str) -> Send:
+        def bump(message: Message) -> None:
+            # Bumped before the response goes out, so a client that reads
+            # right after its write never sees the old entry
+            if message["status"] < 400:
+                self.versions.bump(tenant_id, resource)
+        return on_response_start(send, bump)
+
+    @staticmethod
+    async def _send_cached(send: Send, cached: CachedResponse) -> None:
+        message = {"type": "http.response.start", "status": cached.status, "headers": cached.headers}
+        set_response_headers(message, [
+            (b"content-length", str(len(cached.body)).encode()),
+            (b"x-cache", b"HIT"),
+        ])
+        await send(message)
+        await send({"type": "http.response.body", "body": cached.body})
+
+    def _generate_cache_key(self, scope: Scope, tenant_id: str, user_id: str, resource: str) -> str:
         """Generate cache key from request"""
-        # Include user context for tenant isolation
-        user_id = getattr(request.state, 'user_id', 'anonymous')
-        tenant_id = getattr(request.state, 'tenant_id', 'default')
-        
+        # Include the resource's current version so a write invalidates every
+        # entry for it at once
+        version = self.versions.current(tenant_id, resource)
+
         # Include query parameters
-        query_string = str(request.query_params)
-        
-        return f"cache:{tenant_id}:{request.url.path}:{query_string}:{user_id}"
+        query_string = str(QueryParams(scope["query_string"]))
 
+        return f"cache:{tenant_id}:{resource}:v{version}:{scope['path']}:{query_string}:{user_id}"
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """Rate limiting middleware using Redis"""
-    
-    def __init__(self, app, redis_client=None):
-        super().__init__(app)
-        self.redis_client = redis_client
-        
-        # Rate limit configuration
+
+class RateLimitMiddleware:
+    """Token-bucket rate limiting (see :mod:`app.services.rate_limit`)
+
+    Authenticated requests draw from their tenant's bucket, sized by the
+    tenant's plan. The auth endpoints and anonymous requests are limited per
+    client IP by ``rate_limits``. Buckets live in Redis when a client is
+    given and in process memory otherwise, or while Redis is unreachable.
+    Requests to ``exempt_paths`` pass straight through.
+    """
+
+    def __init__(self, app: ASGIApp, redis_client=None, limiter=None, plans=None,
+                 exempt_paths=RATE_LIMIT_EXEMPT_PATHS):
+        self.app = app
+        self.limiter = limiter or RateLimiter(redis_client)
+        self.plans = plans or PlanCache()
+        self.exempt_paths = frozenset(exempt_paths)
+
+        # Per-IP limits for requests without a tenant
         self.rate_limits = {
             "/api/v1/auth/token": {"requests": 5, "window": 60},  # 5 requests per minute
             "/api/v1/auth/register": {"requests": 3, "window": 300},  # 3 requests per 5 minutes
             "default": {"requests": 100, "window": 60}  # 100 requests per minute default
         }
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        if not self.redis_client:
-            return await call_next(request)
-        
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        key, limit = await self._bucket_for(scope)
+        decision = self.limiter.hit(key, limit)
+        headers = [
+            (b"x-ratelimit-limit", str(decision.limit).encode()),
+            (b"x-ratelimit-remaining", str(decision.remaining).encode()),
+            (b"x-ratelimit-reset", str(int(time.time() + decision.reset_after)).encode()),
+        ]
+
+        if not decision.allowed:
+            logger.warning(f"Rate limit exceeded for {key}")
+            await send_json(send, 429, {"detail": "Rate limit exceeded"}, headers=[
+                *headers, (b"retry-after", retry_after_header(decision.retry_after).encode())
+            ])
+            return
+
+        def add_headers(message: Message) -> None:
+            set_response_headers(message, headers)
+
+        await self.app(scope, receive, on_response_start(send, add_headers))
+
+    async def _bucket_for(self, scope: Scope):
+        endpoint = scope["path"]
+        tenant_id, _ = token_identity(scope)
+        if endpoint not in self.rate_limits and tenant_id is not None:
+            known, plan = self.plans.cached(tenant_id)
+            if not known:
+                plan = await run_in_threadpool(self.plans.load, tenant_id)
+            return f"rate_limit:tenant:{tenant_id}", plan_rate_limit(plan)
+
         # Get client identifier
-        client_ip = request.client.host if request.client else "unknown"
-        user_id = getattr(request.state, 'user_id', client_ip)
-        
-        # Get rate limit for endpoint
-        endpoint = request.url.path
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
         rate_limit = self.rate_limits.get(endpoint, self.rate_limits["default"])
-        
-        # Generate rate limit key
-        rate_key = f"rate_limit:{endpoint}:{user_id}"
-        
-        try:
-            # Check current request count
-            current_requests = self.redis_client.get(rate_key)
-            
-            if current_requests is None:
-                # First request in window
-                self.redis_client.setex(rate_key, rate_limit["window"], 1)
-            else:
-                current_count = int(current_requests)
-                
-                if current_count >= rate_limit["requests"]:
-                    # Rate limit exceeded
-                    logger.warning(f"Rate limit exceeded for {user_id} on {endpoint}")
-                    return Response(
-                        content=json.dumps({"detail": "Rate limit exceeded"}),
-                        status_code=429,
-                        headers={"Content-Type": "application/json"}
-                    )
+        scope_name = endpoint if endpoint in self.rate_limits else "ip"
+        return f"rate_limit:{scope_name}:{client_ip}", RateLimit(rate_limit["requests"], rate_limit["window"])
+
+
+class _GzipEncoder:
+    encoding = b"gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def compress(self, data: bytes, more: bool) -> bytes:
+        # A sync flush per chunk lets a slow client start parsing early
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH if more else zlib.Z_FINISH
+        )
+
+
+class _BrotliEncoder:
+    encoding = b"br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality, mode=brotli.MODE_TEXT)
+
+    def compress(self, data: bytes, more: bool) -> bytes:
+        output = self._compressor.process(data)
+        return output + (self._compressor.flush() if more else self._compressor.finish())
+
+
+@lru_cache(maxsize=128)
+def negotiate_encoding(accept_encoding: bytes) -> Optional[str]:
+    """Pick ``br`` or ``gzip`` from an Accept-Encoding header, honouring q-values"""
+    preferences = {}
+    for part in accept_encoding.decode("latin-1").split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        preferences[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in AVAILABLE_ENCODINGS:
+        quality = preferences.get(encoding, preferences.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """Streaming gzip/brotli response compression
+
+    The encoding is negotiated from Accept-Encoding (brotli preferred on a
+    tie, when the optional ``brotli`` package is installed). Only responses
+    whose content type is in ``content_types`` and whose body reaches
+    ``minimum_size`` are compressed; streaming bodies are compressed chunk
+    by chunk as they pass. Install it outside CacheMiddleware so cached
+    entries stay uncompressed.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY,
+        content_types=COMPRESSIBLE_TYPES
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.content_types = tuple(content_types)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        accept_encoding = header_value(scope, b"accept-encoding") if scope["type"] == "http" else None
+        encoding = negotiate_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        encoder = None
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                if self._compressible(message):
+                    # Held back until the first chunk shows whether it is worth it
+                    start = message
                 else:
-                    # Increment counter
-                    self.redis_client.incr(rate_key)
-        
-        except Exception as e:
-            logger.error(f"Rate limiting error: {str(e)}")
-            # Continue without rate limiting if Redis fails
-        
-        return await call_next(request)
-
-
-class CompressionMiddleware(BaseHTTPMiddleware):
-    """Response compression middleware"""
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        response = await call_next(request)
-        
-        # Add compression headers for large responses
-        if hasattr(response, 'body') and len(response.body) > 1024:  # > 1KB
-            response.headers["Content-Encoding"] = "gzip"
-        
-        return response
\ No newline at end of file
+                    passthrough = True
+                    await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+            if start is not None:
+                first, start = start, None
+                if message["type"] != "http.response.body" or self._too_small(first, message):
+                    passthrough = True
+                    set_response_headers(first, [_vary(first)])
+                    await send(first)
+                    await send(message)
+                    return
+                encoder = self._encoder(encoding)
+                body = encoder.compress(message.get("body", b""), message.get("more_body", False))
+                headers = [(b"content-encoding", encoder.encoding), _vary(first)]
+                if not message.get("more_body", False):
+                    headers.append((b"content-length", str(len(body)).encode()))
+                first["headers"] = [
+                    (name, value) for name, value in first.get("headers", ())
+                    if name.lower() != b"content-length"
+                ]
+                set_response_headers(first, headers)
+                await send(first)
+                await send({"type": "http.response.body", "body": body, "more_body": message.get("more_body", False)})
+                return
+            more = message.get("more_body", False)
+            body = encoder.compress(message.get("body", b""), more)
+            if body or not more:
+                await send({"type": "http.response.body", "body": body, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _encoder(self, encoding: str):
+        if encoding == "br":
+            return _BrotliEncoder(self.brotli_quality)
+        return _GzipEncoder(self.gzip_level)
+
+    def _compressible(self, message: Message) -> bool:
+        # A 206 body is a byte range of the identity representation; encoding
+        # it would break the ranges the client stitches together
+        if message["status"] < 200 or message["status"] in (204, 206, 304):
+            return False
+        content_type = b""
+        for name, value in message.get("headers", ()):
+            name = name.lower()
+            if name in (b"content-encoding", b"content-range"):
+                return False
+            if name == b"cache-control" and b"no-transform" in value.lower():
+                return False
+            if name == b"content-type":
+                content_type = value
+        media_type = content_type.split(b";", 1)[0].strip().lower().decode("latin-1")
+        if not media_type or media_type == "text/event-stream":
+            return False
+        return media_type.startswith(self.content_types) or media_type.endswith(("+json", "+xml"))
+
+    def _too_small(self, start: Message, message: Message) -> bool:
+        if not message.get("more_body", False):
+            return len(message.get("body", b"")) < self.minimum_size
+        for name, value in start.get("headers", ()):
+            if name.lower() == b"content-length":
+                return value.isdigit() and int(value) < self.minimum_size
+        return False
+
+
+def _vary(message: Message):
+    """Vary header for ``message`` that includes Accept-Encoding"""
+    for name, value in message.get("headers", ()):
+        if name.lower() == b"vary":
+            if b"accept-encoding" in value.lower() or value.strip() == b"*":
+                return (b"vary", value)
+            return (b"vary", value + b", Accept-Encoding")
+    return (b"vary", b"Accept-Encoding")
@@ -1,203 +1,292 @@
 import os
 import time
-from fastapi import Request, Response, HTTPException
-from fastapi.middleware.base import BaseHTTPMiddleware
 import logging
-from typing import Callable
 import re
+from functools import lru_cache
+from urllib.parse import parse_qsl
+
+from fastapi import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .asgi import encode_headers, header_value, on_response_start, send_json, set_response_headers
 
 logger = logging.getLogger(__name__)
 
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+class SecurityHeadersMiddleware:
     """Add security headers to all responses"""
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        response = await call_next(request)
-        
-        # Security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
-        
-        # Content Security Policy
-        csp = (
-            "default-src 'self'; "
-            "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
-            "style-src 'self' 'unsafe-inline'; "
-            "img-src 'self' data: https:; "
-            "font-src 'self' https:; "
-            "connect-src 'self' https:; "
-            "frame-ancestors 'none';"
-        )
-        response.headers["Content-Security-Policy"] = csp
-        
-        return response
-
-
-class InputValidationMiddleware(BaseHTTPMiddleware):
+
+    # Content Security Policy
+    csp = (
+        "default-src 'self'; "
+        "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
+        "style-src 'self' 'unsafe-inline'; "
+        "img-src 'self' data: https:; "
+        "font-src 'self' https:; "
+        "connect-src 'self' https:; "
+        "frame-ancestors 'none';"
+    )
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+        # Security headers, encoded once
+        self.headers = encode_headers({
+            "X-Content-Type-Options": "nosniff",
+            "X-Frame-Options": "DENY",
+            "X-XSS-Protection": "1; mode=block",
+            "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
+            "Referrer-Policy": "strict-origin-when-cross-origin",
+            "Permissions-Policy": "geolocation=(), microphone=(), camera=()",
+            "Content-Security-Policy": self.csp,
+        })
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        def add_headers(message: Message) -> None:
+            set_response_headers(message, self.headers)
+
+        await self.app(scope, receive, on_response_start(send, add_headers))
+
+
+# Dangerous patterns to block, matched against lowercased text. SQL keywords
+# only count in statement form: on their own they are ordinary API values
+# (request_type=delete, /clients/bulk-update). Statement forms all start at a
+# word boundary and share one \b in the combined pattern, which lets the
+# regex engine skip most positions in a single check.
+SQL_STATEMENT_PATTERNS = [
+    r"select\b.*?\bfrom\b",
+    r"insert\s+into\b",
+    r"update\s+\w+\s+set\b",
+    r"delete\s+from\b",
+    r"(?:drop|create|alter|truncate)\s+(?:table|database|schema|user|role|function)\b",
+    r"exec(?:ute)?\s+\w",
+    r"union(?:\s+all)?\s+select\b",
+    r"(?:or|and)\s+\d+\s*=\s*\d+",
+]
+
+SQL_INJECTION_PATTERNS = [
+    r";\s*(?:select|insert|update|delete|drop|create|alter|truncate|exec)\b",
+    r"--|/\*|\*/",
+]
+
+XSS_PATTERNS = [
+    r"<script[^>]*>.*?</script>",
+    r"javascript:",
+    r"on\w+\s*=",
+    r"<iframe[^>]*>.*?</iframe>"
+]
+
+# Every pattern in one alternation, so each string is scanned once
+MALICIOUS_PATTERN = re.compile(
+    r"\b(?:" + "|".join(SQL_STATEMENT_PATTERNS) + ")|" + "|".join(SQL_INJECTION_PATTERNS + XSS_PATTERNS)
+)
+
+# Letters that re.IGNORECASE would also match but str.lower() leaves alone
+_CASE_FOLDS = str.maketrans({"\u017f": "s", "\u0131": "i"})
+
+# Only short strings are memoised, to bound the memory held by the caches
+_CACHED_LENGTH = 256
+
+
+def contains_malicious_patterns(text: str) -> bool:
+    """Check if text contains malicious patterns"""
+    text = text.lower()
+    if not text.isascii():
+        text = text.translate(_CASE_FOLDS)
+    return MALICIOUS_PATTERN.search(text) is not None
+
+
+# Paths (a few dozen routes) and query values such as page sizes, statuses
+# and sort keys repeat heavily, so their verdicts are kept
+_cached_verdict = lru_cache(maxsize=8192)(contains_malicious_patterns)
+
+
+def _is_malicious(text: str) -> bool:
+    if len(text) <= _CACHED_LENGTH:
+        return _cached_verdict(text)
+    return contains_malicious_patterns(text)
+
+
+class InputValidationMiddleware:
     """Validate and sanitize input data"""
-    
-    def __init__(self, app):
-        super().__init__(app)
-        
-        # Dangerous patterns to block
-        self.sql_injection_patterns = [
-            r"(\b(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|UNION)\b)",
-            r"(--|#|/\*|\*/)",
-            r"(\b(OR|AND)\s+\d+\s*=\s*\d+)",
-            r"(\bUNION\s+SELECT\b)"
-        ]
-        
-        self.xss_patterns = [
-            r"<script[^>]*>.*?</script>",
-            r"javascript:",
-            r"on\w+\s*=",
-            r"<iframe[^>]*>.*?</iframe>"
-        ]
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # Validate request path
-        if self._contains_malicious_patterns(request.url.path):
-            logger.warning(f"Blocked malicious request path: {request.url.path}")
-            raise HTTPException(status_code=400, detail="Invalid request")
-        
+        if _is_malicious(scope["path"]):
+            logger.warning(f"Blocked malicious request path: {scope['path']}")
+            await send_json(send, 400, {"detail": "Invalid request"})
+            return
+
         # Validate query parameters
-        for key, value in request.query_params.items():
-            if self._contains_malicious_patterns(value):
-                logger.warning(f"Blocked malicious query parameter: {key}={value}")
-                raise HTTPException(status_code=400, detail="Invalid query parameter")
-        
-        return await call_next(request)
-
-    def _contains_malicious_patterns(self, text: str) -> bool:
-        """Check if text contains malicious patterns"""
-        text_lower = text.lower()
-        
-        # Check SQL injection patterns
-        for pattern in self.sql_injection_patterns:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                return True
-        
-        # Check XSS patterns
-        for pattern in self.xss_patterns:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                return True
-        
-        return False
-
-
-class IPWhitelistMiddleware(BaseHTTPMiddleware):
+        if scope["query_string"]:
+            # Decoded as QueryParams does, without building the multidict
+            for key, value in parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True):
+                if _is_malicious(value):
+                    logger.warning(f"Blocked malicious query parameter: {key}={value}")
+                    await send_json(send, 400, {"detail": "Invalid query parameter"})
+                    return
+
+        await self.app(scope, receive, send)
+
+
+class IPWhitelistMiddleware:
     """IP whitelist middleware for admin endpoints"""
-    
-    def __init__(self, app):
-        super().__init__(app)
-        
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
         # Admin endpoints that require IP whitelisting
         self.admin_endpoints = [
             "/api/v1/compliance/",
             "/api/v1/tenants/",
             "/admin/"
         ]
-        
+
         # Allowed IP addresses (from environment)
         allowed_ips = os.getenv('ADMIN_ALLOWED_IPS', '').split(',')
         self.allowed_ips = [ip.strip() for ip in allowed_ips if ip.strip()]
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.allowed_ips:
+            await self.app(scope, receive, send)
+            return
+
         # Check if this is an admin endpoint
-        path = request.url.path
-        is_admin_endpoint = any(endpoint in path for endpoint in self.admin_endpoints)
-        
-        if is_admin_endpoint and self.allowed_ips:
-            client_ip = request.client.host if request.client else "unknown"
-            
+        path = scope["path"]
+        if any(endpoint in path for endpoint in self.admin_endpoints):
+            client = scope.get("client")
+            client_ip = client[0] if client else "unknown"
+
             # Check if IP is whitelisted
             if client_ip not in self.allowed_ips:
                 logger.warning(f"Blocked admin access from non-whitelisted IP: {client_ip}")
-                raise HTTPException(status_code=403, detail="Access denied from this IP address")
-        
-        return await call_next(request)
+                await send_json(send, 403, {"detail": "Access denied from this IP address"})
+                return
 
+        await self.app(scope, receive, send)
 
-class RequestSizeMiddleware(BaseHTTPMiddleware):
+
+class RequestSizeMiddleware:
     """Limit request body size to prevent DoS attacks"""
-    
-    def __init__(self, app, max_size: int = 10 * 1024 * 1024):  # 10MB default
-        super().__init__(app)
+
+    def __init__(self, app: ASGIApp, max_size: int = 10 * 1024 * 1024):  # 10MB default
+        self.app = app
         self.max_size = max_size
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # Check Content-Length header
-        content_length = request.headers.get("content-length")
-        
-        if content_length:
-            content_length = int(content_length)
-            if content_length > self.max_size:
-                logger.warning(f"Blocked oversized request: {content_length} bytes")
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"Request too large. Maximum size: {self.max_size} bytes"
-                )
-        
-        return await call_next(request)
-
-
-class WebhookSecurityMiddleware(BaseHTTPMiddleware):
+        content_length = header_value(scope, b"content-length")
+
+        if content_length is not None:
+            try:
+                size = int(content_length)
+            except ValueError:
+                await send_json(send, 400, {"detail": "Invalid Content-Length header"})
+                return
+            if size > self.max_size:
+                logger.warning(f"Blocked oversized request: {size} bytes")
+                await send_json(send, 413, {"detail": self._detail})
+                return
+            await self.app(scope, receive, send)
+            return
+
+        # Without a Content-Length (chunked uploads) the body is counted as
+        # the endpoint reads it
+        received = 0
+
+        async def receive_wrapper() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    logger.warning(f"Blocked oversized request: over {received} bytes")
+                    raise HTTPException(status_code=413, detail=self._detail)
+            return message
+
+        await self.app(scope, receive_wrapper, send)
+
+    @property
+    def _detail(self) -> str:
+        return f"Request too large. Maximum size: {self.max_size} bytes"
+
+
+class WebhookSecurityMiddleware:
     """Verify webhook signatures for external integrations"""
-    
-    def __init__(self, app):
-        super().__init__(app)
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
         self.webhook_secrets = {
             "stripe": os.getenv('STRIPE_WEBHOOK_SECRET'),
             "docusign": os.getenv('DOCUSIGN_WEBHOOK_SECRET')
         }
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        path = request.url.path
-        
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+
         # Verify Stripe webhooks
-        if "/billing/webhook" in path:
-            await self._verify_stripe_signature(request)
-        
+        if "/billing/webhook" in path and not self._verify_stripe_signature(scope):
+            await send_json(send, 400, {"detail": "Missing webhook signature"})
+            return
+
         # Verify DocuSign webhooks
-        elif "/docusign/webhook" in path:
-            await self._verify_docusign_signature(request)
-        
-        return await call_next(request)
+        if "/docusign/webhook" in path and not self._verify_docusign_signature(scope):
+            await send_json(send, 400, {"detail": "Missing webhook signature"})
+            return
 
-    async def _verify_stripe_signature(self, request: Request):
+        await self.app(scope, receive, send)
+
+    def _verify_stripe_signature(self, scope: Scope) -> bool:
         """Verify Stripe webhook signature"""
-        signature = request.headers.get("stripe-signature")
+        signature = header_value(scope, b"stripe-signature")
         secret = self.webhook_secrets.get("stripe")
-        
-        if not signature or not secret:
-            raise HTTPException(status_code=400, detail="Missing webhook signature")
-        
+
         # Stripe signature verification would be handled in the webhook endpoint
         # This is a placeholder for additional security checks
+        return bool(signature and secret)
 
-    async def _verify_docusign_signature(self, request: Request):
+    def _verify_docusign_signature(self, scope: Scope) -> bool:
         """Verify DocuSign webhook signature"""
         # DocuSign webhook verification logic
-        pass
+        return True
 
 
-class DatabaseConnectionPoolMiddleware(BaseHTTPMiddleware):
+class DatabaseConnectionPoolMiddleware:
     """Monitor and optimize database connections"""
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # Add database connection monitoring
         start_time = time.time()
-        
-        response = await call_next(request)
-        
+
+        await self.app(scope, receive, send)
+
         # Log database operation time
         db_time = time.time() - start_time
         if db_time > 0.5:  # Log slow database operations
-            logger.warning(f"Slow database operation: {request.url.path} took {db_time:.2f}s")
-        
-        return response
\ No newline at end of file
+            logger.warning(f"Slow database operation: {scope['path']} took {db_time:.2f}s")
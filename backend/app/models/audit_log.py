@@ -1,6 +1,6 @@
 import uuid
 import enum
-from sqlalchemy import Column, String, DateTime, ForeignKey, Enum, Text, JSON, Boolean
+from sqlalchemy import Column, String, DateTime, Date, ForeignKey, Enum, Text, JSON, Boolean, Integer, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -35,6 +35,7 @@ class AuditResourceType(enum.Enum):
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    # Range-partitioned by created_at month on PostgreSQL (app.services.partitioning)
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
@@ -69,7 +70,7 @@ class AuditLog(Base):
     retention_date = Column(DateTime(timezone=True))  # When this log can be purged
     
     # Immutable timestamp
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
 
     # Relationships
     tenant = relationship("Tenant", back_populates="audit_logs")
@@ -78,6 +79,7 @@ class AuditLog(Base):
 
 class DataAccessLog(Base):
     __tablename__ = "data_access_logs"
+    # Range-partitioned by created_at month on PostgreSQL (app.services.partitioning)
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
@@ -99,7 +101,7 @@ class DataAccessLog(Base):
     is_authorized = Column(Boolean, default=True)
     consent_given = Column(Boolean, default=False)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
 
     # Relationships
     tenant = relationship("Tenant")
@@ -108,6 +110,7 @@ class DataAccessLog(Base):
 
 class ComplianceEvent(Base):
     __tablename__ = "compliance_events"
+    # Range-partitioned by created_at month on PostgreSQL (app.services.partitioning)
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
@@ -133,10 +136,44 @@ class ComplianceEvent(Base):
     # Metadata
     event_data = Column(JSON)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     # Relationships
     tenant = relationship("Tenant")
     client = relationship("Client")
     user = relationship("User")
+
+
+class ComplianceDailyRollup(Base):
+    """Daily activity counts per tenant and user (app.services.compliance_rollups).
+
+    ``user_id`` is NULL for activity not tied to a user. Tenant totals are the
+    sum over a day's rows.
+    """
+    __tablename__ = "compliance_daily_rollups"
+    __table_args__ = (
+        Index("ix_compliance_daily_rollups_tenant_day_user", "tenant_id", "day", "user_id", unique=True),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
+    day = Column(Date, nullable=False)  # UTC
+
+    reads = Column(Integer, nullable=False, default=0)
+    writes = Column(Integer, nullable=False, default=0)
+    logins = Column(Integer, nullable=False, default=0)
+    sensitive_accesses = Column(Integer, nullable=False, default=0)
+    gdpr_requests = Column(Integer, nullable=False, default=0)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class ComplianceRollupWatermark(Base):
+    """How far each source log table has been folded into the daily rollups"""
+    __tablename__ = "compliance_rollup_watermarks"
+
+    source = Column(String, primary_key=True)  # source table name
+    processed_through = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
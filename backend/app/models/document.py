@@ -1,8 +1,8 @@
 import uuid
 import enum
-from sqlalchemy import Column, String, DateTime, ForeignKey, Enum, Integer, Text, Boolean, JSON
+from sqlalchemy import Column, String, DateTime, ForeignKey, Enum, Integer, Text, Boolean, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -26,6 +26,13 @@ class DocumentStatus(enum.Enum):
     ARCHIVED = "archived"
 
 
+# Document.text_extraction_status values; NULL means not extracted yet.
+TEXT_EXTRACTION_PROCESSING = "processing"
+TEXT_EXTRACTION_DONE = "done"
+TEXT_EXTRACTION_PARTIAL = "partial"  # stopped at a page/time/size budget
+TEXT_EXTRACTION_FAILED = "failed"
+
+
 class Document(Base):
     __tablename__ = "documents"
 
@@ -47,15 +54,18 @@ class Document(Base):
     s3_key = Column(String, nullable=False)  # S3 object key
     s3_url = Column(String)  # Pre-signed URL or public URL
     s3_etag = Column(String)  # S3 ETag for integrity checking
+    content_sha256 = Column(String(64))  # Hex digest computed while the upload streams
     
     # Security and access
-    is_encrypted = Column(Boolean, default=True)
-    encryption_key_id = Column(String)  # KMS key ID if using AWS KMS
+    is_encrypted = Column(Boolean, default=False)
+    encryption_key_id = Column(String)  # Wrapped data key the object is encrypted with
     access_level = Column(String, default="private")  # private, tenant, public
     
-    # Document processing
-    extracted_text = Column(Text)  # OCR or text extraction results
-    processing_metadata = Column(JSON)  # Additional processing info
+    # Document processing. The heavy columns are deferred so listings never
+    # load them; use undefer_group("heavy") where they are needed.
+    extracted_text = deferred(Column(Text), group="heavy")  # OCR or text extraction results
+    text_extraction_status = Column(String(20))
+    processing_metadata = deferred(Column(JSON), group="heavy")  # Additional processing info
     
     # Audit trail
     uploaded_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
@@ -68,6 +78,13 @@ class Document(Base):
     dispute = relationship("Dispute", back_populates="documents")
     uploader = relationship("User", back_populates="uploaded_documents")
 
+    __table_args__ = (
+        # Dedup lookups on upload and object reference counts on delete
+        Index("ix_documents_tenant_content_sha256", "tenant_id", "content_sha256"),
+        Index("ix_documents_tenant_s3_key", "tenant_id", "s3_key"),
+        Index("ix_documents_text_extraction_status", "text_extraction_status", "mime_type"),
+    )
+
 
 class DocumentShare(Base):
     __tablename__ = "document_shares"
@@ -27,7 +27,10 @@ class LetterTemplate(TimestampMixin, SoftDeleteMixin, Base):
     __tablename__ = "letter_templates"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
+    # NULL for system templates, which are stored once and shared by every tenant.
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=True)
+    # Set on a tenant's private copy of a system template; the copy shadows its source.
+    source_template_id = Column(UUID(as_uuid=True), ForeignKey("letter_templates.id"), nullable=True)
     name = Column(String, nullable=False)
     slug = Column(String, nullable=False)
     category = Column(Enum(LetterTemplateCategory), nullable=False, default=LetterTemplateCategory.DISPUTE)
@@ -43,7 +46,19 @@ class LetterTemplate(TimestampMixin, SoftDeleteMixin, Base):
     tenant = relationship("Tenant", back_populates="letter_templates")
     letters = relationship("GeneratedLetter", back_populates="template")
 
+    @property
+    def is_system(self) -> bool:
+        return self.tenant_id is None
+
     __table_args__ = (
         Index("ix_letter_templates_tenant_slug", "tenant_id", "slug", unique=True),
         Index("ix_letter_templates_tenant", "tenant_id"),
+        Index(
+            "ix_letter_templates_system_slug",
+            "slug",
+            unique=True,
+            postgresql_where=text("tenant_id IS NULL"),
+            sqlite_where=text("tenant_id IS NULL"),
+        ),
+        Index("ix_letter_templates_tenant_source", "tenant_id", "source_template_id"),
     )
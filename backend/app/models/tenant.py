@@ -10,6 +10,8 @@ class Tenant(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
+    # Wrapped document data key; see app.services.encryption
+    data_key_id = Column(String, nullable=True)
     createdAt = Column("created_at", DateTime(timezone=True), server_default=func.now())
 
     users = relationship("User", back_populates="tenant")
@@ -17,6 +17,8 @@ from . import (
     documents,
     billing,
     compliance,
+    search,
+    storage,
     websocket,
 )
 
@@ -39,5 +41,7 @@ __all__ = [
     "documents",
     "billing",
     "compliance",
+    "search",
+    "storage",
     "websocket",
 ]
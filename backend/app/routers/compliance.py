@@ -1,16 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import func
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from typing import Optional
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
+import logging
+import os
+import time
+import uuid
+from urllib.parse import urlencode
 
 from app.database import get_db
 from app.security import get_current_active_user
 from ..models.user import User
-from ..models.audit_log import AuditLog, DataAccessLog, ComplianceEvent, AuditAction, AuditResourceType
+from ..models.audit_log import (
+    AuditLog, DataAccessLog, ComplianceEvent, ComplianceDailyRollup, AuditAction, AuditResourceType
+)
 from ..middleware.audit import ComplianceLogger
+from ..services.audit_export import EXPORT_FORMATS, ExportCounter, export_chunks, export_filename, export_to_storage
+from ..services.audit_writer import audit_log_writer
+from ..services.compliance_rollups import ROLLUP_COUNTERS, refreshed_through
+from ..services.encryption import iter_plaintext
+from ..services.gdpr_erasure import erase_subject
+from ..services.gdpr_export import export_subject_archive, find_subject_clients
+from ..services.pagination import keyset_page, total_count
+from ..services.presigned_cache import presigned_url_cache
+from ..services.storage import sign_url, storage_service, verify_url_signature
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+GDPR_REQUEST_TYPES = ("access", "delete", "portability")
+API_PREFIX = os.getenv('COMPLIANCE_URL_PREFIX', '/api/v1/compliance')
+
 
 @router.get("/audit-logs")
 async def get_audit_logs(
@@ -19,12 +43,17 @@ async def get_audit_logs(
     user_id: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    limit: int = Query(100, le=1000),
-    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    exact_count: bool = False,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get audit logs for compliance reporting"""
+    """Get audit logs for compliance reporting, newest first.
+
+    Keyset-paginated: pass ``next_cursor`` back as ``cursor`` for the next
+    page. ``total_count`` is cached or estimated unless ``exact_count`` is set.
+    """
     
     # Only admins can access audit logs
     if current_user.role != "admin":
@@ -44,11 +73,12 @@ async def get_audit_logs(
     if end_date:
         query = query.filter(AuditLog.created_at <= end_date)
     
-    # Order by most recent first
-    query = query.order_by(AuditLog.created_at.desc())
-    
-    # Apply pagination
-    audit_logs = query.offset(offset).limit(limit).all()
+    audit_logs, next_cursor = keyset_page(query, AuditLog, cursor, limit)
+    total, total_kind = total_count(
+        db, query,
+        ("audit_logs", current_user.tenant_id, action, resource_type, user_id, start_date, end_date),
+        exact=exact_count
+    )
     
     # Log this compliance data access
     await ComplianceLogger.log_data_access(
@@ -62,7 +92,9 @@ async def get_audit_logs(
     
     return {
         "audit_logs": audit_logs,
-        "total_count": query.count(),
+        "next_cursor": next_cursor,
+        "total_count": total,
+        "total_count_type": total_kind,
         "filters_applied": {
             "action": action,
             "resource_type": resource_type,
@@ -78,12 +110,13 @@ async def get_data_access_logs(
     user_id: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    limit: int = Query(100, le=1000),
-    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    exact_count: bool = False,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get data access logs for sensitive data monitoring"""
+    """Get data access logs for sensitive data monitoring, paginated like audit logs"""
     
     # Only admins can access data access logs
     if current_user.role != "admin":
@@ -101,15 +134,18 @@ async def get_data_access_logs(
     if end_date:
         query = query.filter(DataAccessLog.created_at <= end_date)
     
-    # Order by most recent first
-    query = query.order_by(DataAccessLog.created_at.desc())
-    
-    # Apply pagination
-    access_logs = query.offset(offset).limit(limit).all()
+    access_logs, next_cursor = keyset_page(query, DataAccessLog, cursor, limit)
+    total, total_kind = total_count(
+        db, query,
+        ("data_access_logs", current_user.tenant_id, resource_type, user_id, start_date, end_date),
+        exact=exact_count
+    )
     
     return {
         "access_logs": access_logs,
-        "total_count": query.count()
+        "next_cursor": next_cursor,
+        "total_count": total,
+        "total_count_type": total_kind
     }
 
 
@@ -120,12 +156,13 @@ async def get_compliance_events(
     resolved: Optional[bool] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    limit: int = Query(100, le=1000),
-    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    exact_count: bool = False,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get compliance events"""
+    """Get compliance events, paginated like audit logs"""
     
     # Only admins can access compliance events
     if current_user.role != "admin":
@@ -148,27 +185,120 @@ async def get_compliance_events(
     if end_date:
         query = query.filter(ComplianceEvent.created_at <= end_date)
     
-    # Order by most recent first
-    query = query.order_by(ComplianceEvent.created_at.desc())
-    
-    # Apply pagination
-    events = query.offset(offset).limit(limit).all()
+    events, next_cursor = keyset_page(query, ComplianceEvent, cursor, limit)
+    total, total_kind = total_count(
+        db, query,
+        ("compliance_events", current_user.tenant_id, event_type, severity, resolved, start_date, end_date),
+        exact=exact_count
+    )
     
     return {
         "compliance_events": events,
-        "total_count": query.count()
+        "next_cursor": next_cursor,
+        "total_count": total,
+        "total_count_type": total_kind
     }
 
 
+@router.get("/dashboard")
+async def get_compliance_dashboard(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    user_id: Optional[uuid.UUID] = None,
+    top_users: int = Query(20, ge=0, le=200),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Daily reads, writes, logins, sensitive accesses and GDPR requests.
+
+    Served from the daily rollups (defaults to the last 30 UTC days), so the
+    counts run up to ``refreshed_through`` rather than to this instant.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    end_date = end_date or datetime.now(timezone.utc).date()
+    start_date = start_date or end_date - timedelta(days=29)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    if (end_date - start_date).days > 365:
+        raise HTTPException(status_code=400, detail="Date range cannot exceed 1 year")
+
+    counters = [
+        func.coalesce(func.sum(getattr(ComplianceDailyRollup, name)), 0).label(name)
+        for name in ROLLUP_COUNTERS
+    ]
+    query = db.query(ComplianceDailyRollup).filter(
+        ComplianceDailyRollup.tenant_id == current_user.tenant_id,
+        ComplianceDailyRollup.day >= start_date,
+        ComplianceDailyRollup.day <= end_date
+    )
+    if user_id:
+        query = query.filter(ComplianceDailyRollup.user_id == user_id)
+
+    daily = (
+        query.with_entities(ComplianceDailyRollup.day, *counters)
+        .group_by(ComplianceDailyRollup.day)
+        .order_by(ComplianceDailyRollup.day)
+        .all()
+    )
+    totals = query.with_entities(*counters).one()
+    users = []
+    if top_users and not user_id:
+        activity = sum(getattr(ComplianceDailyRollup, name) for name in ROLLUP_COUNTERS)
+        users = (
+            query.with_entities(ComplianceDailyRollup.user_id, User.email, *counters)
+            .outerjoin(User, User.id == ComplianceDailyRollup.user_id)
+            .group_by(ComplianceDailyRollup.user_id, User.email)
+            .order_by(func.sum(activity).desc())
+            .limit(top_users)
+            .all()
+        )
+
+    watermark = refreshed_through(db)
+    return {
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "user_id": str(user_id) if user_id else None,
+        "refreshed_through": watermark.isoformat() if watermark else None,
+        "totals": {name: getattr(totals, name) for name in ROLLUP_COUNTERS},
+        "daily": [
+            {"day": str(row.day), **{name: getattr(row, name) for name in ROLLUP_COUNTERS}}
+            for row in daily
+        ],
+        "users": [
+            {
+                "user_id": str(row.user_id) if row.user_id else None,
+                "user_email": row.email,
+                **{name: getattr(row, name) for name in ROLLUP_COUNTERS}
+            }
+            for row in users
+        ]
+    }
+
+
+@router.get("/audit-writer/metrics")
+async def get_audit_writer_metrics(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Report audit log writer queue depth, throughput and spill counters"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return audit_log_writer.stats()
+
+
 @router.post("/export-audit-data")
 async def export_audit_data(
     start_date: datetime,
     end_date: datetime,
+    background_tasks: BackgroundTasks,
     format: str = "csv",
+    gzip: bool = False,
+    background: bool = False,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Export audit data for compliance reporting"""
+    """Stream audit data as CSV or NDJSON, or export it to storage in the background"""
     
     # Only admins can export audit data
     if current_user.role != "admin":
@@ -177,120 +307,346 @@ async def export_audit_data(
     # Validate date range (max 1 year)
     if (end_date - start_date).days > 365:
         raise HTTPException(status_code=400, detail="Date range cannot exceed 1 year")
-    
-    # Get audit logs for the period
-    audit_logs = db.query(AuditLog).filter(
-        AuditLog.tenant_id == current_user.tenant_id,
-        AuditLog.created_at >= start_date,
-        AuditLog.created_at <= end_date
-    ).order_by(AuditLog.created_at.desc()).all()
-    
-    # Log this export action
-    await ComplianceLogger.log_compliance_event(
-        tenant_id=str(current_user.tenant_id),
-        event_type="AUDIT_EXPORT",
-        title="Audit Data Export",
-        description=f"User {current_user.email} exported audit data from {start_date} to {end_date}",
-        severity="INFO",
-        user_id=str(current_user.id),
-        event_data={
-            "export_format": format,
-            "date_range": f"{start_date} to {end_date}",
-            "record_count": len(audit_logs)
-        }
-    )
-    
-    if format.lower() == "csv":
-        # Generate CSV content
-        import csv
-        import io
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers
-        writer.writerow([
-            "Timestamp", "User Email", "Action", "Resource Type", 
-            "Resource ID", "IP Address", "Description"
-        ])
-        
-        # Write data
-        for log in audit_logs:
-            writer.writerow([
-                log.created_at.isoformat(),
-                log.user_email or "System",
-                log.action.value,
-                log.resource_type.value,
-                log.resource_id or "",
-                log.ip_address or "",
-                log.description or ""
-            ])
-        
-        csv_content = output.getvalue()
-        output.close()
-        
-        return {
-            "format": "csv",
-            "content": csv_content,
-            "filename": f"audit_export_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.csv",
-            "record_count": len(audit_logs)
-        }
-    
-    else:
-        # Return JSON format
-        return {
-            "format": "json",
-            "data": [
-                {
-                    "timestamp": log.created_at.isoformat(),
-                    "user_email": log.user_email,
-                    "action": log.action.value,
-                    "resource_type": log.resource_type.value,
-                    "resource_id": log.resource_id,
-                    "ip_address": log.ip_address,
-                    "description": log.description,
-                    "metadata": log.event_metadata
+
+    export_format = "csv" if format.lower() == "csv" else "ndjson"
+    date_range = f"{start_date} to {end_date}"
+    # The export reads on its own session: the response streams after this
+    # handler (and the request's session) has returned.
+    session_factory = sessionmaker(bind=db.get_bind(), autoflush=False)
+
+    if background:
+        job = ComplianceEvent(
+            tenant_id=current_user.tenant_id,
+            event_type="AUDIT_EXPORT",
+            title="Audit Data Export",
+            description=f"User {current_user.email} exported audit data from {start_date} to {end_date}",
+            severity="INFO",
+            user_id=current_user.id,
+            event_data={
+                "status": "queued",
+                "export_format": export_format,
+                "gzip": gzip,
+                "date_range": date_range
+            }
+        )
+        db.add(job)
+        db.commit()
+        background_tasks.add_task(
+            _run_audit_export_job, session_factory, job.id, current_user.tenant_id,
+            start_date, end_date, export_format, gzip
+        )
+        return JSONResponse(status_code=202, content={"job_id": str(job.id), "status": "queued"})
+
+    counter = ExportCounter()
+
+    async def body():
+        export_db = session_factory()
+        completed = False
+        try:
+            chunks = export_chunks(
+                export_db, current_user.tenant_id, start_date, end_date, export_format, gzip, counter
+            )
+            async for chunk in iterate_in_threadpool(chunks):
+                yield chunk
+            completed = True
+        finally:
+            export_db.close()
+            # Logged once the stream ends so the record count is known
+            await ComplianceLogger.log_compliance_event(
+                tenant_id=str(current_user.tenant_id),
+                event_type="AUDIT_EXPORT",
+                title="Audit Data Export",
+                description=f"User {current_user.email} exported audit data from {start_date} to {end_date}",
+                severity="INFO",
+                user_id=str(current_user.id),
+                event_data={
+                    "export_format": export_format,
+                    "gzip": gzip,
+                    "date_range": date_range,
+                    "record_count": counter.rows,
+                    "completed": completed
                 }
-                for log in audit_logs
-            ],
-            "record_count": len(audit_logs)
+            )
+
+    media_type, _ = EXPORT_FORMATS[export_format]
+    filename = export_filename(start_date, end_date, export_format, gzip)
+    return StreamingResponse(
+        body(),
+        media_type="application/gzip" if gzip else media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/export-audit-data/{job_id}")
+async def get_audit_export_job(
+    job_id: uuid.UUID,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Report a background audit export and link to the file once it is ready"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    job = db.query(ComplianceEvent).filter(
+        ComplianceEvent.id == job_id,
+        ComplianceEvent.tenant_id == current_user.tenant_id,
+        ComplianceEvent.event_type == "AUDIT_EXPORT"
+    ).first()
+    if not job or "status" not in (job.event_data or {}):
+        raise HTTPException(status_code=404, detail="Export job not found")
+
+    result = {"job_id": str(job.id), **job.event_data}
+    result.pop("encryption_key_id", None)
+    if job.event_data["status"] == "completed":
+        result["download_url"], result["expires_in"] = _job_download_url(
+            job, _audit_export_resource(job.id), f"export-audit-data/{job.id}/download", expiration=3600
+        )
+    return result
+
+
+def _audit_export_resource(job_id) -> str:
+    return f"compliance/export-audit-data/{job_id}/download"
+
+
+@router.get("/export-audit-data/{job_id}/download")
+async def download_audit_export(
+    job_id: uuid.UUID,
+    expires: int,
+    signature: str,
+    db: Session = Depends(get_db)
+):
+    """Stream a background audit export's plaintext via a signed URL"""
+    if not verify_url_signature(_audit_export_resource(job_id), expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+
+    job = db.get(ComplianceEvent, job_id)
+    if not job or job.event_type != "AUDIT_EXPORT" or not (job.event_data or {}).get("s3_key"):
+        raise HTTPException(status_code=404, detail="Export not found")
+
+    gzip = job.event_data["gzip"]
+    media_type, extension = EXPORT_FORMATS[job.event_data["export_format"]]
+    filename = f"audit-export-{job_id}.{extension}{'.gz' if gzip else ''}"
+    return StreamingResponse(
+        iter_plaintext(storage_service, job.event_data["s3_key"], job.event_data.get("encryption_key_id")),
+        media_type="application/gzip" if gzip else media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": str(job.event_data["file_size"]),
         }
+    )
+
+
+async def _run_audit_export_job(
+    session_factory, job_id, tenant_id, start_date, end_date, export_format, gzip
+) -> None:
+    try:
+        _update_export_job(session_factory, job_id, status="running")
+        stored = await export_to_storage(
+            session_factory,
+            storage_service,
+            tenant_id=tenant_id,
+            start_date=start_date,
+            end_date=end_date,
+            export_format=export_format,
+            gzip=gzip
+        )
+    except Exception as e:
+        logger.error(f"Audit export {job_id} failed: {str(e)}")
+        _update_export_job(session_factory, job_id, status="failed", error=str(e))
+        return
+    _update_export_job(
+        session_factory,
+        job_id,
+        status="completed",
+        s3_key=stored["s3_key"],
+        file_size=stored["file_size"],
+        encryption_key_id=stored["encryption_key_id"],
+        record_count=stored["record_count"]
+    )
+
+
+def _update_export_job(session_factory, job_id, **fields) -> None:
+    db = session_factory()
+    try:
+        job = db.get(ComplianceEvent, job_id)
+        job.event_data = {**(job.event_data or {}), **fields}
+        if fields.get("status") in ("completed", "failed"):
+            job.resolved_at = datetime.now(timezone.utc)
+        db.commit()
+    finally:
+        db.close()
 
 
 @router.post("/gdpr-request")
 async def handle_gdpr_request(
     client_email: str,
     request_type: str,  # "access", "delete", "portability"
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Handle GDPR data requests"""
+    """Handle GDPR data requests.
+
+    Access and portability requests start a background export of the data
+    subject's records and documents, delete requests a background erasure;
+    poll ``/gdpr-request/{job_id}`` for progress and the archive link.
+    """
     
     # Only admins can handle GDPR requests
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
-    
-    # Log the GDPR request
-    await ComplianceLogger.log_compliance_event(
-        tenant_id=str(current_user.tenant_id),
+    if request_type not in GDPR_REQUEST_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"request_type must be one of {', '.join(GDPR_REQUEST_TYPES)}"
+        )
+
+    client_ids = find_subject_clients(db, current_user.tenant_id, client_email)
+    event_data = {
+        "request_type": request_type,
+        "client_email": client_email,
+        "requested_by": current_user.email,
+        "client_ids": [str(client_id) for client_id in client_ids]
+    }
+    if client_ids:
+        event_data["status"] = "queued"
+
+    # Log the GDPR request; the event doubles as the export job record
+    request_event = ComplianceEvent(
+        tenant_id=current_user.tenant_id,
         event_type="GDPR_REQUEST",
         title=f"GDPR {request_type.upper()} Request",
         description=f"GDPR {request_type} request received for {client_email}",
         severity="WARNING",
-        user_id=str(current_user.id),
+        client_id=client_ids[0] if len(client_ids) == 1 else None,
+        user_id=current_user.id,
         response_required=True,
-        event_data={
-            "request_type": request_type,
-            "client_email": client_email,
-            "requested_by": current_user.email
-        }
+        event_data=event_data
     )
+    db.add(request_event)
+    db.commit()
+
+    session_factory = sessionmaker(bind=db.get_bind(), autoflush=False)
+    if client_ids and request_type == "delete":
+        background_tasks.add_task(_run_gdpr_erasure_job, session_factory, request_event.id)
+    elif client_ids:
+        background_tasks.add_task(
+            _run_gdpr_export_job, session_factory, request_event.id, current_user.tenant_id, client_ids
+        )
     
     return {
         "message": f"GDPR {request_type} request logged and will be processed within 30 days",
+        "job_id": str(request_event.id),
+        "status": event_data.get("status"),
         "request_type": request_type,
         "client_email": client_email,
+        "matched_clients": len(client_ids),
         "estimated_completion": (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
     }
 
 
+@router.get("/gdpr-request/{job_id}")
+async def get_gdpr_request(
+    job_id: uuid.UUID,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Report a GDPR request's progress and link to its archive once ready"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    job = db.query(ComplianceEvent).filter(
+        ComplianceEvent.id == job_id,
+        ComplianceEvent.tenant_id == current_user.tenant_id,
+        ComplianceEvent.event_type == "GDPR_REQUEST"
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="GDPR request not found")
+
+    result = {"job_id": str(job.id), **(job.event_data or {})}
+    result.pop("encryption_key_id", None)
+    if result.get("status") == "completed" and result.get("s3_key"):
+        result["download_url"], result["expires_in"] = _job_download_url(
+            job, _gdpr_archive_resource(job.id), f"gdpr-request/{job.id}/archive", expiration=3600
+        )
+    return result
+
+
+def _gdpr_archive_resource(job_id) -> str:
+    return f"compliance/gdpr-request/{job_id}/archive"
+
+
+def _job_download_url(job: ComplianceEvent, resource: str, path: str, expiration: int) -> tuple:
+    """Encrypted job output goes through its decrypting endpoint at ``path``"""
+    if not job.event_data.get("encryption_key_id"):
+        return presigned_url_cache.get_url(s3_key=job.event_data["s3_key"], expiration=expiration)
+    expires = int(time.time()) + expiration
+    query = urlencode({
+        "expires": expires,
+        "signature": sign_url(resource, expires)
+    })
+    return f"{API_PREFIX}/{path}?{query}", expiration
+
+
+@router.get("/gdpr-request/{job_id}/archive")
+async def get_gdpr_archive(
+    job_id: uuid.UUID,
+    expires: int,
+    signature: str,
+    db: Session = Depends(get_db)
+):
+    """Stream a GDPR export archive's plaintext via a signed URL"""
+    if not verify_url_signature(_gdpr_archive_resource(job_id), expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+
+    job = db.get(ComplianceEvent, job_id)
+    if not job or not (job.event_data or {}).get("s3_key"):
+        raise HTTPException(status_code=404, detail="Archive not found")
+
+    return StreamingResponse(
+        iter_plaintext(storage_service, job.event_data["s3_key"], job.event_data.get("encryption_key_id")),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="gdpr-export-{job_id}.zip"',
+            "Content-Length": str(job.event_data["file_size"]),
+        }
+    )
+
+
+async def _run_gdpr_export_job(session_factory, job_id, tenant_id, client_ids) -> None:
+    try:
+        _update_export_job(session_factory, job_id, status="running")
+        stored = await export_subject_archive(
+            session_factory,
+            storage_service,
+            tenant_id=tenant_id,
+            client_ids=client_ids,
+            on_progress=lambda snapshot: _update_export_job(session_factory, job_id, **snapshot)
+        )
+    except Exception as e:
+        logger.error(f"GDPR export {job_id} failed: {str(e)}")
+        _update_export_job(session_factory, job_id, status="failed", error=str(e))
+        return
+    _update_export_job(
+        session_factory,
+        job_id,
+        status="completed",
+        s3_key=stored["s3_key"],
+        file_size=stored["file_size"],
+        encryption_key_id=stored["encryption_key_id"],
+        record_counts=stored["record_counts"],
+        tables_done=stored["tables_done"],
+        tables_total=stored["tables_total"],
+        documents_done=stored["documents_done"],
+        documents_failed=stored["documents_failed"],
+        documents_total=stored["documents_total"],
+        archive_bytes=stored["archive_bytes"]
+    )
+
+
+async def _run_gdpr_erasure_job(session_factory, job_id) -> None:
+    # Progress and failures are recorded on the event by erase_subject
+    try:
+        await run_in_threadpool(erase_subject, session_factory, storage_service, job_id)
+    except Exception as e:
+        logger.error(f"GDPR erasure {job_id} failed: {str(e)}")
@@ -1,26 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, undefer_group
 from typing import Optional, List
 import uuid
 import os
+import time
 from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
 
 from app.database import get_db
 from app.security import get_current_active_user
 from ..models.user import User
 from ..models.document import Document, DocumentType, DocumentStatus
-from ..services.storage import storage_service
-from ..schemas.document import DocumentResponse
+from ..services.storage import digest_upload, sign_url, storage_service, verify_url_signature
+from ..services.encryption import iter_plaintext, tenant_data_key_id
+from ..services.presigned_cache import presigned_url_cache
+from ..services.document_export import ExportEntry, stream_zip, unique_arcnames
+from ..services.document_dedup import dedup_stats, find_duplicate, object_reference_count
+from ..services.pagination import keyset_page
+from ..schemas.document import DocumentDedupStats, DocumentDetailResponse, DocumentResponse
 
 router = APIRouter()
 
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+API_PREFIX = os.getenv('DOCUMENTS_URL_PREFIX', '/api/v1/documents')
+
+
+def _content_resource(document_id) -> str:
+    return f"documents/{document_id}/content"
+
+
+def _download_url(document: Document, expiration: int) -> tuple:
+    """Return ``(url, expires_in)`` for downloading ``document``.
+
+    Encrypted objects cannot be fetched straight from storage, so they get a
+    signed URL to the decrypting content endpoint instead of a presigned one.
+    """
+    if not document.encryption_key_id:
+        return presigned_url_cache.get_url(s3_key=document.s3_key, expiration=expiration)
+    expires = int(time.time()) + expiration
+    query = urlencode({
+        'expires': expires,
+        'signature': sign_url(_content_resource(document.id), expires)
+    })
+    return f"{API_PREFIX}/{document.id}/content?{query}", expiration
+
 
 @router.post("/upload", response_model=DocumentResponse)
 async def upload_document(
     file: UploadFile = File(...),
     document_type: DocumentType = Form(...),
-    client_id: Optional[str] = Form(None),
-    dispute_id: Optional[str] = Form(None),
+    client_id: Optional[uuid.UUID] = Form(None),
+    dispute_id: Optional[uuid.UUID] = Form(None),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -30,24 +63,39 @@ async def upload_document(
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
     
-    # Check file size (10MB limit)
-    max_size = 10 * 1024 * 1024  # 10MB
-    file_content = await file.read()
-    if len(file_content) > max_size:
-        raise HTTPException(status_code=400, detail="File too large. Maximum size is 10MB")
-    
-    # Reset file pointer
-    await file.seek(0)
-    
     try:
-        # Upload to S3
-        upload_result = await storage_service.upload_file(
-            file=file,
-            tenant_id=str(current_user.tenant_id),
-            document_type=document_type.value,
-            client_id=client_id
-        )
-        
+        # Identical content already stored for this tenant: reuse that object
+        # instead of uploading another copy. Hashing reads the spooled upload
+        # locally, so a duplicate never reaches storage.
+        content_sha256 = await digest_upload(file, MAX_UPLOAD_SIZE)
+        duplicate = find_duplicate(db, current_user.tenant_id, content_sha256, storage_service.bucket_name)
+        if duplicate is not None:
+            upload_result = {
+                'filename': duplicate.filename,
+                'original_filename': file.filename,
+                'file_size': duplicate.file_size,
+                'mime_type': duplicate.mime_type,
+                'content_sha256': content_sha256,
+                's3_bucket': duplicate.s3_bucket,
+                's3_key': duplicate.s3_key,
+                's3_url': duplicate.s3_url,
+                's3_etag': duplicate.s3_etag
+            }
+            encryption_key_id = duplicate.encryption_key_id
+        else:
+            # Stream to S3; the 10MB limit is enforced while the file is read
+            # and the object is encrypted with the tenant's data key when
+            # configured
+            encryption_key_id = tenant_data_key_id(db, current_user.tenant_id)
+            upload_result = await storage_service.upload_file(
+                file=file,
+                tenant_id=str(current_user.tenant_id),
+                document_type=document_type.value,
+                client_id=str(client_id) if client_id else None,
+                max_size=MAX_UPLOAD_SIZE,
+                encryption_key_id=encryption_key_id
+            )
+
         # Create document record in database
         document = Document(
             tenant_id=current_user.tenant_id,
@@ -63,6 +111,9 @@ async def upload_document(
             s3_key=upload_result['s3_key'],
             s3_url=upload_result['s3_url'],
             s3_etag=upload_result['s3_etag'],
+            content_sha256=upload_result['content_sha256'],
+            is_encrypted=bool(encryption_key_id),
+            encryption_key_id=encryption_key_id,
             uploaded_by=current_user.id
         )
         
@@ -72,18 +123,27 @@ async def upload_document(
         
         return document
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
 @router.get("/", response_model=List[DocumentResponse])
 async def list_documents(
+    response: Response,
     document_type: Optional[DocumentType] = None,
-    client_id: Optional[str] = None,
+    client_id: Optional[uuid.UUID] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """List documents for the current tenant"""
+    """List documents for the current tenant, newest first.
+
+    Keyset-paginated on (created_at, id): when more rows exist the opaque
+    cursor for the next page is returned in the ``X-Next-Cursor`` header.
+    """
     query = db.query(Document).filter(Document.tenant_id == current_user.tenant_id)
     
     if document_type:
@@ -91,19 +151,71 @@ async def list_documents(
     
     if client_id:
         query = query.filter(Document.client_id == client_id)
-    
-    documents = query.order_by(Document.created_at.desc()).all()
+
+    documents, next_cursor = keyset_page(query, Document, cursor, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return documents
 
 
-@router.get("/{document_id}", response_model=DocumentResponse)
+@router.get("/export")
+async def export_documents(
+    client_id: Optional[uuid.UUID] = None,
+    dispute_id: Optional[uuid.UUID] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Stream a ZIP of every document for a client or dispute"""
+    if client_id is None and dispute_id is None:
+        raise HTTPException(status_code=400, detail="client_id or dispute_id is required")
+
+    query = db.query(
+        Document.s3_key, Document.original_filename, Document.mime_type,
+        Document.encryption_key_id
+    ).filter(Document.tenant_id == current_user.tenant_id)
+    if client_id:
+        query = query.filter(Document.client_id == client_id)
+    if dispute_id:
+        query = query.filter(Document.dispute_id == dispute_id)
+    rows = query.order_by(Document.created_at.asc()).all()
+
+    if not rows:
+        raise HTTPException(status_code=404, detail="No documents found")
+
+    entries = [
+        ExportEntry(
+            s3_key=row.s3_key,
+            arcname=arcname,
+            mime_type=row.mime_type,
+            encryption_key_id=row.encryption_key_id
+        )
+        for row, arcname in zip(rows, unique_arcnames(row.original_filename for row in rows))
+    ]
+    archive_name = f"documents-{dispute_id or client_id}.zip"
+    return StreamingResponse(
+        stream_zip(storage_service, entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{archive_name}"'}
+    )
+
+
+@router.get("/stats/dedup", response_model=DocumentDedupStats)
+async def get_dedup_stats(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Report how much storage content-hash deduplication saves for the tenant"""
+    return dedup_stats(db, current_user.tenant_id)
+
+
+@router.get("/{document_id}", response_model=DocumentDetailResponse)
 async def get_document(
-    document_id: str,
+    document_id: uuid.UUID,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get document metadata"""
-    document = db.query(Document).filter(
+    """Get document metadata, including extracted text and processing results"""
+    document = db.query(Document).options(undefer_group("heavy")).filter(
         Document.id == document_id,
         Document.tenant_id == current_user.tenant_id
     ).first()
@@ -116,7 +228,7 @@ async def get_document(
 
 @router.get("/{document_id}/download")
 async def download_document(
-    document_id: str,
+    document_id: uuid.UUID,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -130,25 +242,50 @@ async def download_document(
         raise HTTPException(status_code=404, detail="Document not found")
     
     try:
-        # Generate presigned URL (valid for 1 hour)
-        download_url = storage_service.generate_presigned_url(
-            s3_key=document.s3_key,
-            expiration=3600
-        )
+        # URL valid for 1 hour; plaintext presigned URLs are reused while most
+        # of that remains
+        download_url, expires_in = _download_url(document, expiration=3600)
         
         return {
             "download_url": download_url,
             "filename": document.original_filename,
-            "expires_in": 3600
+            "expires_in": expires_in
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate download URL: {str(e)}")
 
 
+@router.get("/{document_id}/content")
+async def get_document_content(
+    document_id: uuid.UUID,
+    expires: int,
+    signature: str,
+    db: Session = Depends(get_db)
+):
+    """Stream a document's plaintext via a signed URL from ``/download``"""
+    if not verify_url_signature(_content_resource(document_id), expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+
+    document = db.query(Document).filter(Document.id == document_id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    # Decryption happens chunk by chunk as the response is sent; a tampered
+    # object fails authentication and aborts the stream.
+    return StreamingResponse(
+        iter_plaintext(storage_service, document.s3_key, document.encryption_key_id),
+        media_type=document.mime_type or "application/octet-stream",
+        headers={
+            "Content-Disposition": f'attachment; filename="{document.original_filename}"',
+            "Content-Length": str(document.file_size),
+        }
+    )
+
+
 @router.delete("/{document_id}")
 async def delete_document(
-    document_id: str,
+    document_id: uuid.UUID,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -166,8 +303,13 @@ async def delete_document(
         raise HTTPException(status_code=403, detail="Not authorized to delete this document")
     
     try:
-        # Delete from S3
-        storage_service.delete_file(document.s3_key)
+        # Delete from S3 once no other document shares the object
+        if object_reference_count(db, document) <= 1:
+            storage_service.delete_file(document.s3_key)
+            presigned_url_cache.invalidate(document.s3_key)
+        snapshot_ref = (document.processing_metadata or {}).get('normalized_snapshot_ref')
+        if snapshot_ref:
+            storage_service.delete_file(snapshot_ref['s3_key'])
         
         # Delete from database
         db.delete(document)
@@ -181,7 +323,7 @@ async def delete_document(
 
 @router.post("/{document_id}/share")
 async def create_document_share(
-    document_id: str,
+    document_id: uuid.UUID,
     expires_hours: int = 24,
     max_downloads: int = 1,
     password: Optional[str] = None,
@@ -272,10 +414,7 @@ async def access_shared_document(
     
     try:
         # Generate download URL
-        download_url = storage_service.generate_presigned_url(
-            s3_key=document.s3_key,
-            expiration=300  # 5 minutes
-        )
+        download_url, _ = _download_url(document, expiration=300)  # 5 minutes
         
         # Update access tracking
         document_share.download_count += 1
@@ -19,6 +19,7 @@ from ..schemas.generated_letter import (
     GeneratedLetterCreate,
     GeneratedLetterUpdate,
 )
+from ..services.letter_templates import get_effective_template
 
 router = APIRouter()
 
@@ -81,15 +82,7 @@ def _ensure_template(
 ) -> LetterTemplateModel | None:
     if template_id is None:
         return None
-    template = (
-        db.query(LetterTemplateModel)
-        .filter(
-            LetterTemplateModel.id == template_id,
-            LetterTemplateModel.tenant_id == tenant_id,
-            LetterTemplateModel.deleted_at.is_(None),
-        )
-        .first()
-    )
+    template = get_effective_template(db, tenant_id, template_id)
     if not template:
         raise HTTPException(status_code=404, detail="Letter template not found")
     if not template.is_active:
@@ -17,6 +17,12 @@ from ..schemas.letter_template import (
     LetterTemplateCreate,
     LetterTemplateUpdate,
 )
+from ..services.letter_templates import (
+    effective_templates_query,
+    fork_system_template,
+    get_effective_template,
+    slug_in_use,
+)
 
 router = APIRouter()
 
@@ -24,15 +30,7 @@ router = APIRouter()
 def _get_template(
     db: Session, tenant_id: uuid.UUID, template_id: uuid.UUID
 ) -> LetterTemplateModel:
-    template = (
-        db.query(LetterTemplateModel)
-        .filter(
-            LetterTemplateModel.id == template_id,
-            LetterTemplateModel.tenant_id == tenant_id,
-            LetterTemplateModel.deleted_at.is_(None),
-        )
-        .first()
-    )
+    template = get_effective_template(db, tenant_id, template_id)
     if not template:
         raise HTTPException(status_code=404, detail="Letter template not found")
     return template
@@ -46,16 +44,7 @@ def create_letter_template(
 ):
     tenant_id = current_user.tenant_id
 
-    exists = (
-        db.query(LetterTemplateModel)
-        .filter(
-            LetterTemplateModel.tenant_id == tenant_id,
-            LetterTemplateModel.slug == payload.slug,
-            LetterTemplateModel.deleted_at.is_(None),
-        )
-        .first()
-    )
-    if exists:
+    if slug_in_use(db, tenant_id, payload.slug):
         raise HTTPException(status_code=400, detail="Slug already in use")
 
     template = LetterTemplateModel(
@@ -89,13 +78,10 @@ def list_letter_templates(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    query = db.query(LetterTemplateModel).filter(
-        LetterTemplateModel.tenant_id == current_user.tenant_id
+    query = effective_templates_query(
+        db, current_user.tenant_id, include_archived=include_archived
     )
 
-    if not include_archived:
-        query = query.filter(LetterTemplateModel.deleted_at.is_(None))
-
     if category:
         query = query.filter(LetterTemplateModel.category == category)
 
@@ -129,19 +115,12 @@ def update_letter_template(
     template = _get_template(db, current_user.tenant_id, template_id)
 
     if payload.slug and payload.slug != template.slug:
-        exists = (
-            db.query(LetterTemplateModel)
-            .filter(
-                LetterTemplateModel.tenant_id == current_user.tenant_id,
-                LetterTemplateModel.slug == payload.slug,
-                LetterTemplateModel.id != template.id,
-                LetterTemplateModel.deleted_at.is_(None),
-            )
-            .first()
-        )
-        if exists:
+        if slug_in_use(db, current_user.tenant_id, payload.slug, exclude_ids=[template.id]):
             raise HTTPException(status_code=400, detail="Slug already in use")
 
+    # Editing a shared system template gives the tenant its own private copy.
+    template = fork_system_template(db, current_user.tenant_id, template)
+
     for field, value in payload.dict(exclude_unset=True).items():
         setattr(template, field, value)
 
@@ -157,6 +136,9 @@ def archive_letter_template(
     current_user: User = Depends(get_current_active_user),
 ):
     template = _get_template(db, current_user.tenant_id, template_id)
+    # Archiving a system template leaves an archived private copy that hides it
+    # for this tenant only.
+    template = fork_system_template(db, current_user.tenant_id, template)
     template.deleted_at = datetime.now(timezone.utc)
     template.is_active = False
 
@@ -0,0 +1,38 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.security import get_current_active_user
+from ..models.user import User
+from ..schemas.search import SearchResults
+from ..services.search import SEARCH_KINDS, search
+
+router = APIRouter()
+
+
+@router.get("/", response_model=SearchResults)
+async def search_text(
+    q: str = Query(..., min_length=2, max_length=200),
+    types: Optional[List[str]] = Query(None, description="document and/or letter"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Ranked full-text search over document text and generated letters"""
+    kinds = types or list(SEARCH_KINDS)
+    unknown = set(kinds) - set(SEARCH_KINDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown search types: {', '.join(sorted(unknown))}")
+
+    results, next_cursor = search(
+        db,
+        current_user.tenant_id,
+        q,
+        kinds=[kind for kind in SEARCH_KINDS if kind in kinds],
+        limit=limit,
+        cursor=cursor,
+    )
+    return {"results": results, "next_cursor": next_cursor}
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+import mimetypes
+import os
+
+from app.security import get_current_active_user
+from ..models.user import User
+from ..services.presigned_cache import presigned_url_cache
+from ..services.storage import LocalStorageService, storage_service
+
+router = APIRouter()
+
+
+@router.get("/local/{key:path}")
+async def download_local_object(key: str, expires: int, signature: str, method: str = "get_object"):
+    """Serve an object from the local storage backend via a signed URL"""
+    if not isinstance(storage_service, LocalStorageService):
+        raise HTTPException(status_code=404, detail="Local storage is not enabled")
+    if method != "get_object" or not storage_service.verify_signature(key, expires, signature, method):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+
+    path = storage_service.path_for(key)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # FileResponse streams from disk and uses the server's sendfile/pathsend
+    # extension when available, so the body never passes through Python.
+    return FileResponse(
+        path,
+        media_type=mimetypes.guess_type(key)[0] or "application/octet-stream",
+        filename=os.path.basename(key),
+    )
+
+
+@router.get("/metrics")
+async def storage_metrics(current_user: User = Depends(get_current_active_user)):
+    """Report presigned URL cache effectiveness"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {"presigned_url_cache": presigned_url_cache.stats()}
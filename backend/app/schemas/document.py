@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 from datetime import datetime
 import uuid
+from typing import Any
 from ..models.document import DocumentType, DocumentStatus
 
 
@@ -24,6 +25,21 @@ class DocumentResponse(BaseModel):
         from_attributes = True
 
 
+class DocumentDetailResponse(DocumentResponse):
+    text_extraction_status: str | None = None
+    extracted_text: str | None = None
+    processing_metadata: dict[str, Any] | None = None
+
+
+class DocumentDedupStats(BaseModel):
+    documents: int
+    stored_objects: int
+    logical_bytes: int
+    stored_bytes: int
+    bytes_saved: int
+    dedup_ratio: float
+
+
 class DocumentCreate(BaseModel):
     document_type: DocumentType
     client_id: uuid.UUID | None = None
@@ -41,7 +41,9 @@ class LetterTemplateUpdate(BaseModel):
 
 class LetterTemplate(LetterTemplateBase):
     id: uuid.UUID
-    tenant_id: uuid.UUID
+    tenant_id: uuid.UUID | None = None
+    source_template_id: uuid.UUID | None = None
+    is_system: bool = False
     created_at: datetime
     updated_at: datetime
     deleted_at: datetime | None = None
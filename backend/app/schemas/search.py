@@ -0,0 +1,21 @@
+from datetime import datetime
+import uuid
+from typing import Literal
+
+from pydantic import BaseModel
+
+
+class SearchHit(BaseModel):
+    kind: Literal["document", "letter"]
+    id: uuid.UUID
+    title: str
+    snippet: str
+    rank: float
+    client_id: uuid.UUID | None = None
+    case_id: uuid.UUID | None = None
+    created_at: datetime | None = None
+
+
+class SearchResults(BaseModel):
+    results: list[SearchHit]
+    next_cursor: str | None = None
@@ -88,7 +88,7 @@ def create_seed_data():
         db.refresh(agent_user)
 
         # Seed system letter templates
-        seed_system_templates(db, demo_tenant.id)
+        seed_system_templates(db)
 
         # 4. Create Pipeline Stages
         stages = [
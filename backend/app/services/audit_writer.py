@@ -0,0 +1,363 @@
+"""Background batched writer for request audit logs.
+
+``AuditMiddleware`` hands each audit event to :data:`audit_log_writer`
+instead of inserting it inline. Events wait in a bounded in-process queue and
+a background task bulk-inserts them, flushing when ``AUDIT_BATCH_SIZE`` events
+are waiting or ``AUDIT_FLUSH_INTERVAL`` seconds have passed.
+
+When the database is slow or unavailable, events are appended to a JSON-lines
+spill file instead of being lost: a batch goes there when its insert fails or
+exceeds ``AUDIT_WRITE_TIMEOUT``, and a single event does when the queue is
+full. The spill file is replayed after the next successful flush. Replay skips
+ids that are already stored, so a batch that timed out but later committed is
+not written twice. Every worker process shares the spill file: appends and the
+hand-over to replay take an exclusive ``flock`` on ``<spill>.lock``, and one
+process at a time replays, holding ``<spill>.replay.lock``. Replay reads the
+file in batches, so a large spill is never loaded whole. Replayed events keep
+their original ``created_at``; when that is behind the compliance rollups'
+watermark, their days are recounted after the replay.
+
+Events are plain JSON-safe dicts (enum names, string UUIDs, ISO timestamps) so
+the queue and the spill file share one format.
+"""
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.models.audit_log import AuditAction, AuditLog, AuditResourceType
+from app.services.compliance_rollups import recount_late_rows
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', 10000))
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 500))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 1.0))
+AUDIT_WRITE_TIMEOUT = float(os.getenv('AUDIT_WRITE_TIMEOUT', 5.0))
+AUDIT_SPILL_PATH = os.getenv('AUDIT_SPILL_PATH', './audit-spill.jsonl')
+
+_STOP = object()
+_UUID_FIELDS = ('id', 'tenant_id', 'user_id')
+
+
+def audit_event(
+    *,
+    tenant_id: Any,
+    action: AuditAction,
+    resource_type: AuditResourceType,
+    **fields: Any
+) -> Dict[str, Any]:
+    """Build a queue-ready audit event stamped with its own id and time"""
+    event = {
+        'id': str(uuid.uuid4()),
+        'tenant_id': str(tenant_id) if tenant_id else None,
+        'action': action.name,
+        'resource_type': resource_type.name,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+    }
+    for key, value in fields.items():
+        event[key] = str(value) if key in _UUID_FIELDS and value else value
+    return event
+
+
+@contextmanager
+def _file_lock(path: str, blocking: bool = True) -> Iterator[bool]:
+    """Hold an exclusive ``flock`` on ``path``.
+
+    Yields False instead of waiting when ``blocking`` is off and another
+    process (or thread: each call opens its own descriptor) holds it.
+    """
+    with open(path, 'a') as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _read_batches(fh: IO[str], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for line in fh:
+        if line.strip():
+            batch.append(json.loads(line))
+            if len(batch) >= size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _to_row(event: Dict[str, Any]) -> Dict[str, Any]:
+    row = dict(event)
+    for key in _UUID_FIELDS:
+        if row.get(key):
+            row[key] = uuid.UUID(row[key])
+    row['action'] = AuditAction[row['action']]
+    row['resource_type'] = AuditResourceType[row['resource_type']]
+    row['created_at'] = datetime.fromisoformat(row['created_at'])
+    return row
+
+
+class AuditWriterMetrics:
+    """Counters for the audit writer; ``delay`` is event creation to commit."""
+
+    def __init__(self):
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.last_flush_ms = 0.0
+        self.last_delay_ms = 0.0
+        self.max_delay_ms = 0.0
+
+    def record_delay(self, events: List[Dict[str, Any]]) -> None:
+        oldest = min(datetime.fromisoformat(event['created_at']) for event in events)
+        delay = (datetime.now(timezone.utc) - oldest).total_seconds() * 1000
+        self.last_delay_ms = round(delay, 1)
+        self.max_delay_ms = max(self.max_delay_ms, self.last_delay_ms)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+class AuditLogWriter:
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Session]] = None,
+        max_queue: int = AUDIT_QUEUE_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        write_timeout: float = AUDIT_WRITE_TIMEOUT,
+        spill_path: str = AUDIT_SPILL_PATH
+    ):
+        self._session_factory = session_factory
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_timeout = write_timeout
+        self.spill_path = spill_path
+        self.metrics = AuditWriterMetrics()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def session_factory(self) -> Callable[[], Session]:
+        if self._session_factory is None:
+            from app.database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory
+
+    def start(self) -> None:
+        """Start the background flusher on the running loop (idempotent)"""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything queued, then stop the background task"""
+        if self._task is None or self._loop is not asyncio.get_running_loop():
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    def submit(self, event: Dict[str, Any]) -> None:
+        """Queue an event without waiting on the database.
+
+        A full queue means the database is already behind, so the event goes
+        straight to the spill file; that small synchronous write is the only
+        backpressure the request path ever sees.
+        """
+        if not event.get('tenant_id'):
+            # audit_logs.tenant_id is NOT NULL; one such row would fail the
+            # whole batch insert.
+            self.metrics.skipped += 1
+            return
+        self.start()
+        try:
+            self._queue.put_nowait(event)
+            self.metrics.enqueued += 1
+        except asyncio.QueueFull:
+            self._spill([event])
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.metrics.as_dict()
+        stats['queue_depth'] = self._queue.qsize() if self._queue else 0
+        stats['queue_capacity'] = self.max_queue
+        stats['spill_pending'] = os.path.exists(self.spill_path)
+        return stats
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                first = await asyncio.wait_for(self._queue.get(), self.flush_interval)
+            except asyncio.TimeoutError:
+                await self._replay()
+                continue
+            if first is _STOP:
+                return
+
+            batch = [first]
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(run_in_threadpool(self._insert, batch), self.write_timeout)
+        except Exception as e:
+            logger.warning("Audit batch of %d spilled to disk: %s", len(batch), e)
+            self.metrics.failed_batches += 1
+            await run_in_threadpool(self._spill, batch)
+            return
+        self.metrics.batches += 1
+        self.metrics.written += len(batch)
+        self.metrics.last_flush_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.metrics.record_delay(batch)
+        await self._replay()
+
+    def _insert(self, events: List[Dict[str, Any]], skip_existing: bool = False) -> int:
+        rows = [_to_row(event) for event in events]
+        db = self.session_factory()
+        try:
+            if skip_existing:
+                ids = [row['id'] for row in rows]
+                stored = {row_id for (row_id,) in db.query(AuditLog.id).filter(AuditLog.id.in_(ids))}
+                rows = [row for row in rows if row['id'] not in stored]
+            if rows:
+                db.execute(insert(AuditLog), rows)
+                db.commit()
+            return len(rows)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _spill(self, events: List[Dict[str, Any]]) -> None:
+        lines = ''.join(json.dumps(event, default=str) + '\n' for event in events)
+        try:
+            with _file_lock(self._lock_path), open(self.spill_path, 'a', encoding='utf-8') as fh:
+                fh.write(lines)
+                fh.flush()
+                os.fsync(fh.fileno())
+        except OSError as e:
+            logger.error("Dropped %d audit events, spill file unavailable: %s", len(events), e)
+            self.metrics.dropped += len(events)
+            return
+        self.metrics.spilled += len(events)
+
+    async def _replay(self) -> None:
+        if os.path.exists(self.spill_path) or os.path.exists(self._replay_path):
+            try:
+                await run_in_threadpool(self._replay_spill)
+            except Exception as e:
+                logger.warning("Audit spill replay deferred: %s", e)
+
+    @property
+    def _replay_path(self) -> str:
+        return f"{self.spill_path}.replay"
+
+    @property
+    def _lock_path(self) -> str:
+        return f"{self.spill_path}.lock"
+
+    def _replay_spill(self) -> None:
+        """Insert spilled events in batches; whatever fails stays spilled"""
+        with _file_lock(f"{self._replay_path}.lock", blocking=False) as replaying:
+            if not replaying:
+                # Another worker is replaying
+                return
+            with _file_lock(self._lock_path):
+                # A leftover .replay file means a previous replay was
+                # interrupted; finish that one before claiming new spills.
+                if not os.path.exists(self._replay_path):
+                    if not os.path.exists(self.spill_path):
+                        return
+                    os.replace(self.spill_path, self._replay_path)
+
+            oldest: Optional[datetime] = None
+            try:
+                with open(self._replay_path, encoding='utf-8') as fh:
+                    for batch in _read_batches(fh, self.batch_size):
+                        try:
+                            inserted = self._insert(batch, skip_existing=True)
+                        except Exception:
+                            self._respill(batch, fh)
+                            os.remove(self._replay_path)
+                            raise
+                        self.metrics.replayed += inserted
+                        self.metrics.record_delay(batch)
+                        if inserted:
+                            first = min(datetime.fromisoformat(event['created_at']) for event in batch)
+                            oldest = first if oldest is None else min(oldest, first)
+                os.remove(self._replay_path)
+            finally:
+                if oldest is not None:
+                    self._recount_rollups(oldest)
+
+    def _recount_rollups(self, oldest: datetime) -> None:
+        """Recount rollup days that replayed events landed behind"""
+        try:
+            db = self.session_factory()
+            try:
+                recount_late_rows(db, 'audit_logs', oldest)
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error("Compliance rollups not recounted after audit replay since %s: %s", oldest, e)
+
+    def _respill(self, batch: List[Dict[str, Any]], rest: IO[str]) -> None:
+        """Put a failed batch and the unread rest of the replay file back"""
+        with _file_lock(self._lock_path), open(self.spill_path, 'a', encoding='utf-8') as out:
+            out.writelines(json.dumps(event) + '\n' for event in batch)
+            shutil.copyfileobj(rest, out)
+
+
+# Process-wide writer used by AuditMiddleware
+audit_log_writer = AuditLogWriter()
@@ -0,0 +1,265 @@
+"""Daily compliance dashboard rollups.
+
+``compliance_daily_rollups`` holds one row of counters per tenant, user and
+UTC day, so the dashboard reads a few hundred small rows instead of scanning
+the log tables. :func:`refresh_rollups` folds in only the log rows created
+since each source table's watermark, adding them to the stored counters and
+advancing the watermark in the same transaction.
+
+Rows are only folded in once they are ``COMPLIANCE_ROLLUP_SETTLE_SECONDS``
+old. The audit writer stamps events when they happen and commits them a
+little later, so this lag keeps a refresh from stepping over rows that are
+still on their way. Events replayed from the audit spill file after a longer
+outage land behind the watermark; the audit writer then calls
+:func:`recount_late_rows`, which recounts their days from scratch with
+:func:`rebuild_rollups`.
+"""
+from __future__ import annotations
+
+import os
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import Date
+
+from app.models.audit_log import (
+    AuditAction,
+    AuditLog,
+    ComplianceDailyRollup,
+    ComplianceEvent,
+    ComplianceRollupWatermark,
+    DataAccessLog,
+)
+
+COMPLIANCE_ROLLUP_SETTLE_SECONDS = int(os.getenv('COMPLIANCE_ROLLUP_SETTLE_SECONDS', 120))
+
+ROLLUP_COUNTERS = ('reads', 'writes', 'logins', 'sensitive_accesses', 'gdpr_requests')
+READ_ACTIONS = (AuditAction.READ, AuditAction.DOWNLOAD, AuditAction.EXPORT)
+WRITE_ACTIONS = (AuditAction.CREATE, AuditAction.UPDATE, AuditAction.DELETE)
+
+_Key = Tuple[object, Optional[object], date]
+
+
+class utc_day(FunctionElement):
+    """The UTC calendar day of a timestamp column"""
+    type = Date()
+    inherit_cache = True
+
+
+@compiles(utc_day)
+def _compile_utc_day(element, compiler, **kw):
+    return f"date({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(utc_day, "postgresql")
+def _compile_utc_day_pg(element, compiler, **kw):
+    return f"CAST(({compiler.process(element.clauses, **kw)}) AT TIME ZONE 'UTC' AS DATE)"
+
+
+def _as_date(value) -> date:
+    # SQLite hands back date() results as strings
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _audit_log_counts(db: Session, window):
+    return (
+        db.query(
+            AuditLog.tenant_id,
+            AuditLog.user_id,
+            utc_day(AuditLog.created_at),
+            func.sum(case((AuditLog.action.in_(READ_ACTIONS), 1), else_=0)).label('reads'),
+            func.sum(case((AuditLog.action.in_(WRITE_ACTIONS), 1), else_=0)).label('writes'),
+            func.sum(case((AuditLog.action == AuditAction.LOGIN, 1), else_=0)).label('logins'),
+        )
+        .filter(*window(AuditLog.created_at))
+        .group_by(AuditLog.tenant_id, AuditLog.user_id, utc_day(AuditLog.created_at))
+    )
+
+
+def _data_access_counts(db: Session, window):
+    return (
+        db.query(
+            DataAccessLog.tenant_id,
+            DataAccessLog.user_id,
+            utc_day(DataAccessLog.created_at),
+            func.count().label('sensitive_accesses'),
+        )
+        .filter(*window(DataAccessLog.created_at))
+        .group_by(DataAccessLog.tenant_id, DataAccessLog.user_id, utc_day(DataAccessLog.created_at))
+    )
+
+
+def _gdpr_request_counts(db: Session, window):
+    return (
+        db.query(
+            ComplianceEvent.tenant_id,
+            ComplianceEvent.user_id,
+            utc_day(ComplianceEvent.created_at),
+            func.count().label('gdpr_requests'),
+        )
+        .filter(ComplianceEvent.event_type == 'GDPR_REQUEST', *window(ComplianceEvent.created_at))
+        .group_by(ComplianceEvent.tenant_id, ComplianceEvent.user_id, utc_day(ComplianceEvent.created_at))
+    )
+
+
+# Source table -> grouped counts over a created_at window
+_SOURCES = {
+    'audit_logs': _audit_log_counts,
+    'data_access_logs': _data_access_counts,
+    'compliance_events': _gdpr_request_counts,
+}
+
+
+def _window(lower: Optional[datetime], upper: datetime, inclusive: bool):
+    def bounds(column):
+        clauses = [column <= upper]
+        if lower is not None:
+            clauses.append(column >= lower if inclusive else column > lower)
+        return clauses
+    return bounds
+
+
+def _collect(
+    db: Session,
+    source: str,
+    lower: Optional[datetime],
+    upper: datetime,
+    deltas,
+    inclusive: bool = False
+) -> None:
+    for row in _SOURCES[source](db, _window(lower, upper, inclusive)):
+        tenant_id, user_id, day = row[0], row[1], _as_date(row[2])
+        for counter, value in row._mapping.items():
+            if counter in ROLLUP_COUNTERS and value:
+                deltas[(tenant_id, user_id, day)][counter] += int(value)
+
+
+def _apply(db: Session, deltas: Dict[_Key, Dict[str, int]]) -> int:
+    """Add ``deltas`` to the stored rollup rows, creating missing ones"""
+    if not deltas:
+        return 0
+    tenants = {key[0] for key in deltas}
+    days = {key[2] for key in deltas}
+    existing = {
+        (row.tenant_id, row.user_id, row.day): row
+        for row in db.query(ComplianceDailyRollup).filter(
+            ComplianceDailyRollup.tenant_id.in_(tenants),
+            ComplianceDailyRollup.day.in_(days),
+        )
+    }
+    for key, counts in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            tenant_id, user_id, day = key
+            row = ComplianceDailyRollup(tenant_id=tenant_id, user_id=user_id, day=day)
+            for counter in ROLLUP_COUNTERS:
+                setattr(row, counter, 0)
+            db.add(row)
+        for counter, value in counts.items():
+            setattr(row, counter, getattr(row, counter) + value)
+    return len(deltas)
+
+
+def _locked_watermark(db: Session, source: str) -> Optional[ComplianceRollupWatermark]:
+    # FOR UPDATE serializes concurrent refreshes on PostgreSQL, so no window
+    # is ever counted twice
+    return (
+        db.query(ComplianceRollupWatermark)
+        .filter(ComplianceRollupWatermark.source == source)
+        .with_for_update()
+        .first()
+    )
+
+
+def refresh_rollups(
+    db: Session,
+    now: Optional[datetime] = None,
+    settle_seconds: Optional[int] = None
+) -> Dict[str, datetime]:
+    """Fold new log rows into the rollups; returns each source's watermark.
+
+    The first refresh has no watermark and counts everything, which doubles
+    as the initial backfill.
+    """
+    now = now or datetime.now(timezone.utc)
+    settle = COMPLIANCE_ROLLUP_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+    upper = now - timedelta(seconds=settle)
+    deltas: Dict[_Key, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    watermarks = {}
+    try:
+        for source in _SOURCES:
+            watermark = _locked_watermark(db, source)
+            lower = watermark.processed_through if watermark else None
+            if lower is not None and _naive(lower) >= _naive(upper):
+                watermarks[source] = lower
+                continue
+            _collect(db, source, lower, upper, deltas)
+            if watermark is None:
+                watermark = ComplianceRollupWatermark(source=source, processed_through=upper)
+                db.add(watermark)
+            watermark.processed_through = upper
+            watermarks[source] = upper
+        _apply(db, deltas)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return watermarks
+
+
+def rebuild_rollups(db: Session, since: date) -> int:
+    """Recount every day from ``since`` up to the current watermarks.
+
+    Returns the number of rollup rows written.
+    """
+    since_at = datetime.combine(since, time.min, tzinfo=timezone.utc)
+    deltas: Dict[_Key, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    try:
+        for source in _SOURCES:
+            watermark = _locked_watermark(db, source)
+            if watermark is None:
+                continue
+            _collect(db, source, since_at, watermark.processed_through, deltas, inclusive=True)
+        db.query(ComplianceDailyRollup).filter(
+            ComplianceDailyRollup.day >= since
+        ).delete(synchronize_session=False)
+        written = _apply(db, deltas)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return written
+
+
+def recount_late_rows(db: Session, source: str, oldest: datetime) -> Optional[int]:
+    """Rebuild from ``oldest``'s day if rows created then are behind the watermark.
+
+    For rows inserted late with their original ``created_at``, which
+    :func:`refresh_rollups` would never count. Returns the number of rollup
+    rows written, or None when the next refresh will count the rows anyway.
+    """
+    watermark = (
+        db.query(ComplianceRollupWatermark.processed_through)
+        .filter(ComplianceRollupWatermark.source == source)
+        .scalar()
+    )
+    if watermark is None or _naive(oldest) > _naive(watermark):
+        return None
+    return rebuild_rollups(db, _naive(oldest).date())
+
+
+def refreshed_through(db: Session) -> Optional[datetime]:
+    """The oldest watermark: every source is counted up to at least this time"""
+    marks = [mark for (mark,) in db.query(ComplianceRollupWatermark.processed_through)]
+    return min(marks, key=_naive) if len(marks) == len(_SOURCES) else None
+
+
+def _naive(value: datetime) -> datetime:
+    # SQLite drops tzinfo on the way back; everything stored here is UTC
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
@@ -0,0 +1,372 @@
+"""Parse uploaded credit report exports into the normalized snapshot.
+
+The snapshot is the structure ``DisputeSuggestionService`` reads from
+``Document.processing_metadata["normalized_snapshot"]``::
+
+    {"generated_at": ..., "source_format": ...,
+     "tradelines": [...], "collections": [...], "inquiries": [...]}
+
+CSV and XML are parsed row by row / element by element straight off the
+storage stream. JSON exports are already snapshot-shaped and are decoded in
+one go; uploads are capped at 10MB so that stays bounded.
+
+Large snapshots are written to object storage instead of the row; use
+:func:`load_snapshot` to read either form.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.services import storage
+from app.services.encryption import iter_plaintext
+
+SNAPSHOT_SECTIONS = ("tradelines", "collections", "inquiries")
+# Snapshots larger than this (serialized bytes) live in object storage and
+# processing_metadata only keeps a "normalized_snapshot_ref" pointer.
+SNAPSHOT_INLINE_LIMIT = int(os.getenv("SNAPSHOT_INLINE_LIMIT", 256 * 1024))
+
+_NUMERIC_FIELDS = {"balance", "credit_limit", "high_balance", "past_due", "monthly_payment"}
+_LATE_BUCKETS = ("30", "60", "90", "120")
+
+
+class CreditReportParseError(ValueError):
+    """Raised when an upload is not a supported or well-formed credit report."""
+
+
+class _ChunkReader(io.RawIOBase):
+    """Expose a chunk iterator as a readable binary file object."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = bytes(next(self._chunks))
+            except StopIteration:
+                return 0
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def open_stream(s3_key: str, encryption_key_id: Optional[str] = None) -> io.BufferedReader:
+    """Open a stored object as a buffered binary stream, decrypting if needed"""
+    return io.BufferedReader(
+        _ChunkReader(iter_plaintext(storage.storage_service, s3_key, encryption_key_id))
+    )
+
+
+def detect_format(mime_type: Optional[str], filename: Optional[str], head: bytes) -> str:
+    """Pick a parser from the MIME type, then the extension, then the content"""
+    mime_type = (mime_type or "").lower()
+    if "json" in mime_type:
+        return "json"
+    if "csv" in mime_type:
+        return "csv"
+    if "xml" in mime_type:
+        return "xml"
+
+    extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if extension in ("json", "csv", "xml"):
+        return extension
+
+    stripped = head.lstrip()
+    if stripped.startswith((b"{", b"[")):
+        return "json"
+    if stripped.startswith(b"<"):
+        return "xml"
+    if b"," in head.split(b"\n", 1)[0]:
+        return "csv"
+    raise CreditReportParseError("Unsupported credit report format")
+
+
+def _coerce(field: str, value: Any) -> Any:
+    if isinstance(value, str):
+        value = value.strip()
+        if value == "":
+            return None
+        if field in _NUMERIC_FIELDS:
+            try:
+                number = float(value.replace(",", "").replace("$", ""))
+            except ValueError:
+                return value
+            return int(number) if number.is_integer() else number
+    return value
+
+
+def _snapshot(source_format: str, generated_at: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "generated_at": generated_at or datetime.now(timezone.utc).isoformat(),
+        "source_format": source_format,
+        "tradelines": [],
+        "collections": [],
+        "inquiries": [],
+    }
+
+
+# JSON ------------------------------------------------------------------------
+
+def parse_json(stream: io.BufferedReader) -> Dict[str, Any]:
+    try:
+        payload = json.load(stream)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise CreditReportParseError(f"Invalid JSON credit report: {e}")
+
+    if isinstance(payload, dict) and isinstance(payload.get("normalized_snapshot"), dict):
+        payload = payload["normalized_snapshot"]
+    if not isinstance(payload, dict) or not any(k in payload for k in SNAPSHOT_SECTIONS):
+        raise CreditReportParseError("JSON credit report has no tradelines, collections or inquiries")
+
+    snapshot = _snapshot("json", payload.get("generated_at"))
+    for section in SNAPSHOT_SECTIONS:
+        entries = payload.get(section) or []
+        if not isinstance(entries, list):
+            raise CreditReportParseError(f"'{section}' must be a list")
+        snapshot[section] = [entry for entry in entries if isinstance(entry, dict)]
+    return snapshot
+
+
+# CSV -------------------------------------------------------------------------
+
+_CSV_SECTIONS = {
+    "tradeline": "tradelines",
+    "collection": "collections",
+    "inquiry": "inquiries",
+}
+_ACCOUNT_FIELDS = ("account_ref", "account_number", "furnisher", "overall_status")
+
+
+def parse_csv(stream: io.BufferedReader) -> Dict[str, Any]:
+    """Parse one row per (account, bureau); rows for the same account are merged.
+
+    Columns: ``record_type`` (tradeline/collection/inquiry, default tradeline),
+    ``account_ref``, ``account_number``, ``furnisher``, ``overall_status``,
+    ``bureau`` and the per-bureau fields (``status``, ``balance``,
+    ``credit_limit``, ``dofd``, ``late_30`` ... ``late_120``). Inquiry rows use
+    ``bureau``, ``furnisher``, ``type``, ``date`` and ``reference``.
+    """
+    snapshot = _snapshot("csv")
+    accounts: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    if not reader.fieldnames:
+        raise CreditReportParseError("CSV credit report has no header row")
+
+    try:
+        for row in reader:
+            row = {(k or "").strip().lower(): _coerce((k or "").strip().lower(), v) for k, v in row.items()}
+            section = _CSV_SECTIONS.get((row.pop("record_type", None) or "tradeline").lower())
+            if section is None:
+                continue
+
+            if section == "inquiries":
+                snapshot["inquiries"].append({k: v for k, v in row.items() if v is not None})
+                continue
+
+            identity = (section, row.get("account_ref") or row.get("account_number") or "", row.get("furnisher") or "")
+            account = accounts.get(identity)
+            if account is None:
+                account = {field: row.get(field) for field in _ACCOUNT_FIELDS if row.get(field) is not None}
+                account["bureaus"] = {}
+                accounts[identity] = account
+                snapshot[section].append(account)
+
+            bureau = (row.get("bureau") or "").upper()
+            if not bureau:
+                continue
+            late_counts = {
+                bucket: int(row[f"late_{bucket}"])
+                for bucket in _LATE_BUCKETS
+                if str(row.get(f"late_{bucket}") or "").isdigit()
+            }
+            details = {
+                k: v for k, v in row.items()
+                if v is not None and k not in _ACCOUNT_FIELDS and k != "bureau" and not k.startswith("late_")
+            }
+            if late_counts:
+                details["late_counts"] = late_counts
+            account["bureaus"][bureau] = details
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise CreditReportParseError(f"Invalid CSV credit report: {e}")
+    finally:
+        text.detach()
+    return snapshot
+
+
+# XML -------------------------------------------------------------------------
+
+_XML_SECTIONS = {
+    "tradeline": "tradelines",
+    "collection": "collections",
+    "inquiry": "inquiries",
+}
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1].lower()
+
+
+def _fields(element: ET.Element) -> Dict[str, Any]:
+    """Merge attributes and simple child elements into one dict"""
+    fields = {k.lower(): _coerce(k.lower(), v) for k, v in element.attrib.items()}
+    for child in element:
+        if len(child) == 0 and child.text and child.text.strip() and not child.attrib:
+            name = _local(child.tag)
+            fields.setdefault(name, _coerce(name, child.text))
+    return {k: v for k, v in fields.items() if v is not None}
+
+
+def _xml_account(element: ET.Element) -> Dict[str, Any]:
+    account = _fields(element)
+    bureaus: Dict[str, Dict[str, Any]] = {}
+    for bureau in element:
+        if _local(bureau.tag) != "bureau":
+            continue
+        details = _fields(bureau)
+        name = str(details.pop("name", "")).upper()
+        late_counts = {
+            str(late.get("days")): int(late.text)
+            for late in bureau
+            if _local(late.tag) == "latecount" and late.get("days") and (late.text or "").strip().isdigit()
+        }
+        if late_counts:
+            details["late_counts"] = late_counts
+        if name:
+            bureaus[name] = details
+    account["bureaus"] = bureaus
+    return account
+
+
+def parse_xml(stream: io.BufferedReader) -> Dict[str, Any]:
+    """Parse a bureau-style XML export with ``iterparse``, freeing each record.
+
+    Expected shape::
+
+        <CreditReport generated_at="...">
+          <Tradeline account_ref=".." furnisher="..">
+            <Bureau name="EXPERIAN" status="late" balance="1200">
+              <LateCount days="30">2</LateCount>
+            </Bureau>
+          </Tradeline>
+          <Collection ...>...</Collection>
+          <Inquiry bureau="EXPERIAN" furnisher=".." type="hard" date="2021-01-10"/>
+        </CreditReport>
+    """
+    snapshot = _snapshot("xml")
+    root = None
+    depth = 0
+    try:
+        for event, element in ET.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                if depth == 0:
+                    root = element
+                    snapshot["generated_at"] = element.get("generated_at") or snapshot["generated_at"]
+                depth += 1
+                continue
+            depth -= 1
+            section = _XML_SECTIONS.get(_local(element.tag))
+            if section is None or depth != 1:
+                continue
+            if section == "inquiries":
+                snapshot["inquiries"].append(_fields(element))
+            else:
+                snapshot[section].append(_xml_account(element))
+            # Drop finished records so memory tracks one record, not the file.
+            root.clear()
+    except ET.ParseError as e:
+        raise CreditReportParseError(f"Invalid XML credit report: {e}")
+    return snapshot
+
+
+_PARSERS = {
+    "json": parse_json,
+    "csv": parse_csv,
+    "xml": parse_xml,
+}
+
+
+def parse_credit_report(
+    s3_key: str,
+    mime_type: Optional[str],
+    filename: Optional[str],
+    encryption_key_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Read a stored credit report and return its normalized snapshot.
+
+    Runs in ingestion worker processes, so it only touches storage, never the
+    database.
+    """
+    with open_stream(s3_key, encryption_key_id) as stream:
+        source_format = detect_format(mime_type, filename, stream.peek(512)[:512])
+        snapshot = _PARSERS[source_format](stream)
+    if not any(snapshot[section] for section in SNAPSHOT_SECTIONS):
+        raise CreditReportParseError("Credit report contains no tradelines, collections or inquiries")
+    return snapshot
+
+
+def snapshot_counts(snapshot: Dict[str, Any]) -> Dict[str, int]:
+    return {section: len(snapshot.get(section) or []) for section in SNAPSHOT_SECTIONS}
+
+
+def store_snapshot(
+    metadata: Optional[Dict[str, Any]],
+    snapshot: Dict[str, Any],
+    *,
+    tenant_id: Any,
+    document_id: Any,
+    encryption_key_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Return ``metadata`` with the snapshot inlined or offloaded by size.
+
+    Offloaded snapshots are encrypted with the source document's key.
+    """
+    metadata = dict(metadata or {})
+    metadata.pop("normalized_snapshot", None)
+    metadata.pop("normalized_snapshot_ref", None)
+
+    payload = json.dumps(snapshot, separators=(",", ":"), default=str).encode()
+    if len(payload) <= SNAPSHOT_INLINE_LIMIT:
+        metadata["normalized_snapshot"] = snapshot
+        return metadata
+
+    stored = storage.storage_service.upload_bytes(
+        content=payload,
+        tenant_id=str(tenant_id),
+        document_type="snapshots",
+        filename=f"{document_id}.json",
+        content_type="application/json",
+        encryption_key_id=encryption_key_id,
+    )
+    metadata["normalized_snapshot_ref"] = {
+        "s3_key": stored["s3_key"],
+        "size": len(payload),
+        "sha256": stored["content_sha256"],
+        "encryption_key_id": encryption_key_id,
+    }
+    return metadata
+
+
+def load_snapshot(metadata: Any) -> Optional[Dict[str, Any]]:
+    """Read a snapshot from ``processing_metadata``, fetching it from storage if offloaded"""
+    if not isinstance(metadata, dict):
+        return None
+    snapshot = metadata.get("normalized_snapshot") or metadata.get("snapshot")
+    if snapshot:
+        return snapshot
+    ref = metadata.get("normalized_snapshot_ref")
+    if not isinstance(ref, dict) or not ref.get("s3_key"):
+        return None
+    with open_stream(ref["s3_key"], ref.get("encryption_key_id")) as stream:
+        return json.load(stream)
@@ -5,9 +5,10 @@ from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 from uuid import UUID
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, undefer
 
 from app.models.document import Document, DocumentStatus, DocumentType
+from app.services.credit_report_parsing import load_snapshot
 from app.models.suggestion_run import (
     SuggestionEngine,
     SuggestionRun as SuggestionRunModel,
@@ -123,6 +124,7 @@ class DisputeSuggestionService:
     def _load_latest_snapshot(self) -> Tuple[Optional[Dict[str, Any]], Optional[Document]]:
         document = (
             self.db.query(Document)
+            .options(undefer(Document.processing_metadata))
             .filter(
                 Document.tenant_id == self.tenant_id,
                 Document.client_id == self.client_id,
@@ -134,10 +136,7 @@ class DisputeSuggestionService:
         )
         if not document:
             return None, None
-        metadata = document.processing_metadata
-        if not isinstance(metadata, dict):
-            metadata = {}
-        snapshot = metadata.get("normalized_snapshot") or metadata.get("snapshot")
+        snapshot = load_snapshot(document.processing_metadata)
         if not snapshot:
             return None, document
         return snapshot, document
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.document import Document
+
+
+def find_duplicate(
+    db: Session, tenant_id: UUID, content_sha256: str, bucket: Optional[str]
+) -> Optional[Document]:
+    """Return an existing document in the tenant whose object has the same content.
+
+    Dedup is scoped to a single tenant and a single bucket, so switching storage
+    backends never points a document at an object the current backend cannot
+    serve.
+
+    The row is locked until the caller commits, so a concurrent delete of the
+    last other reference waits and then counts the new document.
+    """
+    return (
+        db.query(Document)
+        .filter(
+            Document.tenant_id == tenant_id,
+            Document.content_sha256 == content_sha256,
+            Document.s3_bucket == bucket,
+        )
+        .order_by(Document.created_at.asc())
+        .with_for_update()
+        .first()
+    )
+
+
+def object_reference_count(db: Session, document: Document) -> int:
+    """Count documents, including ``document``, that point at its stored object.
+
+    The referencing rows are locked first (held until the caller's transaction
+    ends). An upload reusing the object through ``find_duplicate`` either
+    commits before the lock is granted, and its row is counted, or waits and
+    then no longer finds the deleted row.
+    """
+    same_object = (
+        Document.tenant_id == document.tenant_id,
+        Document.s3_bucket == document.s3_bucket,
+        Document.s3_key == document.s3_key,
+    )
+    db.query(Document.id).filter(*same_object).with_for_update().all()
+    # A separate statement: under READ COMMITTED it sees rows committed while
+    # the lock was awaited
+    return db.query(func.count(Document.id)).filter(*same_object).scalar()
+
+
+def dedup_stats(db: Session, tenant_id: UUID) -> dict:
+    """Summarise how much storage content-hash dedup saves for a tenant.
+
+    ``dedup_ratio`` is logical bytes (what the tenant uploaded) over stored bytes
+    (distinct objects), so 1.0 means nothing was shared.
+    """
+    documents, logical_bytes = (
+        db.query(func.count(Document.id), func.coalesce(func.sum(Document.file_size), 0))
+        .filter(Document.tenant_id == tenant_id)
+        .one()
+    )
+    objects = (
+        db.query(func.max(Document.file_size).label("file_size"))
+        .filter(Document.tenant_id == tenant_id)
+        .group_by(Document.s3_bucket, Document.s3_key)
+        .subquery()
+    )
+    stored_objects, stored_bytes = db.query(
+        func.count(), func.coalesce(func.sum(objects.c.file_size), 0)
+    ).select_from(objects).one()
+
+    return {
+        "documents": documents,
+        "stored_objects": stored_objects,
+        "logical_bytes": int(logical_bytes),
+        "stored_bytes": int(stored_bytes),
+        "bytes_saved": int(logical_bytes) - int(stored_bytes),
+        "dedup_ratio": round(logical_bytes / stored_bytes, 4) if stored_bytes else 1.0,
+    }
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterable, List, Optional
+
+from starlette.concurrency import iterate_in_threadpool
+
+from app.services.encryption import iter_plaintext
+
+EXPORT_CONCURRENCY = int(os.getenv('DOCUMENT_EXPORT_CONCURRENCY', 4))
+EXPORT_CHUNK_SIZE = int(os.getenv('DOCUMENT_EXPORT_CHUNK_SIZE', 1024 * 1024))
+# Chunks each in-flight fetch may buffer ahead of the ZIP writer.
+EXPORT_PREFETCH_CHUNKS = 4
+
+# Already-compressed formats are stored as-is; deflating them again only burns CPU.
+_STORED_MIME_PREFIXES = ('image/', 'application/pdf', 'application/zip', 'video/', 'audio/')
+
+_DONE = object()
+
+
+@dataclass(frozen=True)
+class ExportEntry:
+    """A storage object to place in the archive, detached from the DB session.
+
+    ``read`` replaces the storage read for generated entries. It is called on
+    the event loop and iterated in a worker thread, so it should return a
+    generator that does its work lazily.
+    """
+    s3_key: Optional[str]
+    arcname: str
+    mime_type: Optional[str] = None
+    encryption_key_id: Optional[str] = None
+    read: Optional[Callable[[], Iterable[bytes]]] = None
+
+
+class _ZipSink:
+    """Write-only file object that hands finished ZIP bytes back to the caller.
+
+    Having no ``tell``/``seek`` makes ``zipfile`` write data descriptors, which
+    is what lets each entry stream without knowing its size up front.
+    """
+
+    def __init__(self):
+        self._pending: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._pending.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._pending)
+        self._pending.clear()
+        return data
+
+
+def unique_arcnames(names: Iterable[str]) -> List[str]:
+    """Make archive names unique by suffixing repeats: ``a.pdf``, ``a (2).pdf``"""
+    used = set()
+    result = []
+    for name in names:
+        name = os.path.basename(name or '') or 'document'
+        stem, ext = os.path.splitext(name)
+        candidate, n = name, 1
+        while candidate.lower() in used:
+            n += 1
+            candidate = f"{stem} ({n}){ext}"
+        used.add(candidate.lower())
+        result.append(candidate)
+    return result
+
+
+async def stream_zip(
+    storage,
+    entries: List[ExportEntry],
+    concurrency: int = EXPORT_CONCURRENCY,
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """Yield a ZIP archive of ``entries`` as it is built.
+
+    Up to ``concurrency`` objects are fetched at once, each buffering at most
+    ``EXPORT_PREFETCH_CHUNKS`` chunks, and entries are written in the order
+    their data starts arriving. Memory therefore stays bounded by
+    ``concurrency * EXPORT_PREFETCH_CHUNKS * chunk_size`` whatever the archive
+    size. Objects that cannot be read are listed in ``_export_errors.txt``.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    ready: asyncio.Queue = asyncio.Queue()
+
+    async def fetch(entry: ExportEntry) -> None:
+        async with slots:
+            chunks: asyncio.Queue = asyncio.Queue(maxsize=EXPORT_PREFETCH_CHUNKS)
+            announced = False
+            try:
+                source = entry.read() if entry.read else iter_plaintext(
+                    storage, entry.s3_key, entry.encryption_key_id, chunk_size
+                )
+                async for chunk in iterate_in_threadpool(bytes(c) for c in source):
+                    if not announced:
+                        await ready.put((entry, chunks))
+                        announced = True
+                    await chunks.put(chunk)
+                error = None
+            except Exception as e:
+                error = e
+            if not announced:
+                await ready.put((entry, chunks))
+            await chunks.put(error if error is not None else _DONE)
+            # Hold the slot until the writer has consumed everything we queued.
+            await chunks.join()
+
+    tasks = [asyncio.create_task(fetch(entry)) for entry in entries]
+    sink = _ZipSink()
+    errors = []
+    try:
+        with zipfile.ZipFile(sink, mode='w', allowZip64=True) as archive:
+            for _ in range(len(entries)):
+                entry, chunks = await ready.get()
+                item = await chunks.get()
+                chunks.task_done()
+                if isinstance(item, Exception):
+                    errors.append(f"{entry.arcname}: {item}")
+                    continue
+
+                info = zipfile.ZipInfo(entry.arcname, date_time=time.localtime()[:6])
+                info.compress_type = (
+                    zipfile.ZIP_STORED
+                    if (entry.mime_type or '').startswith(_STORED_MIME_PREFIXES)
+                    else zipfile.ZIP_DEFLATED
+                )
+                with archive.open(info, mode='w') as member:
+                    while item is not _DONE:
+                        if isinstance(item, Exception):
+                            errors.append(f"{entry.arcname}: truncated, {item}")
+                            break
+                        member.write(item)
+                        data = sink.drain()
+                        if data:
+                            yield data
+                        item = await chunks.get()
+                        chunks.task_done()
+                data = sink.drain()
+                if data:
+                    yield data
+            if errors:
+                archive.writestr('_export_errors.txt', '\n'.join(errors) + '\n')
+        yield sink.drain()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,405 @@
+"""Background processing of uploaded documents.
+
+Workers claim documents in batches, fan the CPU-bound work out to a process
+pool, and write the results back in batched transactions. Run them
+with ``python -m scripts.manage ingest-credit-reports`` and
+``python -m scripts.manage extract-text``.
+"""
+from __future__ import annotations
+
+import abc
+import logging
+import os
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import Session, undefer
+
+from app.models.document import (
+    TEXT_EXTRACTION_DONE,
+    TEXT_EXTRACTION_FAILED,
+    TEXT_EXTRACTION_PARTIAL,
+    TEXT_EXTRACTION_PROCESSING,
+    Document,
+    DocumentStatus,
+    DocumentType,
+)
+from app.services.credit_report_parsing import parse_credit_report, snapshot_counts, store_snapshot
+from app.services.text_extraction import EXTRACTABLE_MIME_TYPES, extract_document_text
+
+logger = logging.getLogger(__name__)
+
+INGESTION_BATCH_SIZE = int(os.getenv('INGESTION_BATCH_SIZE', 50))
+INGESTION_WORKERS = int(os.getenv('INGESTION_WORKERS', os.cpu_count() or 2))
+EXTRACTION_BATCH_SIZE = int(os.getenv('EXTRACTION_BATCH_SIZE', 200))
+EXTRACTION_WRITE_BATCH = int(os.getenv('EXTRACTION_WRITE_BATCH', 50))
+# PROCESSING claims older than this are assumed orphaned by a crashed worker.
+INGESTION_CLAIM_TIMEOUT = int(os.getenv('INGESTION_CLAIM_TIMEOUT', 15 * 60))
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class PipelineMetrics:
+    """Running throughput and error counters for a pipeline worker."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.batches = 0
+        self.claimed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.released = 0
+        self.pool_restarts = 0
+        self.busy_seconds = 0.0
+        self.errors: Dict[str, int] = {}
+
+    def record_failure(self, error: BaseException) -> None:
+        self.failed += 1
+        name = type(error).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        done = self.succeeded + self.failed
+        return {
+            'batches': self.batches,
+            'claimed': self.claimed,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'released': self.released,
+            'pool_restarts': self.pool_restarts,
+            'errors': dict(self.errors),
+            'docs_per_second': round(done / self.busy_seconds, 2) if self.busy_seconds else 0.0,
+            'uptime_seconds': round(time.monotonic() - self.started, 1),
+        }
+
+
+def _claim(db: Session, criteria, updates: Dict[Any, Any], batch_size: int) -> List[UUID]:
+    """Atomically mark up to ``batch_size`` matching documents as claimed.
+
+    ``FOR UPDATE SKIP LOCKED`` lets several workers claim concurrently on
+    PostgreSQL without handing out the same document twice.
+    """
+    ids = db.execute(
+        select(Document.id)
+        .where(criteria)
+        .order_by(Document.created_at.asc())
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if ids:
+        db.query(Document).filter(Document.id.in_(ids)).update(
+            {**updates, Document.updated_at: utc_now()},
+            synchronize_session=False,
+        )
+    db.commit()
+    return list(ids)
+
+
+def claim_credit_reports(db: Session, batch_size: int = INGESTION_BATCH_SIZE) -> List[Document]:
+    """Move a batch of credit reports from UPLOADED to PROCESSING"""
+    stale = utc_now() - timedelta(seconds=INGESTION_CLAIM_TIMEOUT)
+    ids = _claim(
+        db,
+        and_(
+            Document.document_type == DocumentType.CREDIT_REPORT,
+            or_(
+                Document.status == DocumentStatus.UPLOADED,
+                and_(Document.status == DocumentStatus.PROCESSING, Document.updated_at < stale),
+            ),
+        ),
+        {Document.status: DocumentStatus.PROCESSING},
+        batch_size,
+    )
+    if not ids:
+        return []
+    return (
+        db.query(Document)
+        .options(undefer(Document.processing_metadata))
+        .filter(Document.id.in_(ids))
+        .all()
+    )
+
+
+def claim_for_text_extraction(db: Session, batch_size: int = EXTRACTION_BATCH_SIZE) -> List[Any]:
+    """Claim PDFs and text uploads whose text has not been extracted yet"""
+    stale = utc_now() - timedelta(seconds=INGESTION_CLAIM_TIMEOUT)
+    ids = _claim(
+        db,
+        and_(
+            Document.mime_type.in_(EXTRACTABLE_MIME_TYPES),
+            or_(
+                Document.text_extraction_status.is_(None),
+                and_(
+                    Document.text_extraction_status == TEXT_EXTRACTION_PROCESSING,
+                    Document.updated_at < stale,
+                ),
+            ),
+        ),
+        {Document.text_extraction_status: TEXT_EXTRACTION_PROCESSING},
+        batch_size,
+    )
+    if not ids:
+        return []
+    return db.query(
+        Document.id, Document.s3_key, Document.mime_type, Document.encryption_key_id
+    ).filter(Document.id.in_(ids)).all()
+
+
+def _timed_parse(
+    s3_key: str,
+    mime_type: Optional[str],
+    filename: Optional[str],
+    encryption_key_id: Optional[str] = None
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    snapshot = parse_credit_report(s3_key, mime_type, filename, encryption_key_id)
+    return {'snapshot': snapshot, 'duration_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+
+class _BatchPipeline(abc.ABC):
+    """Shared worker loop: CPU-bound work runs in ``executor`` (a process pool
+    by default) while only the parent talks to the database.
+
+    A worker process that dies (a hostile PDF exhausting memory, say) breaks
+    the whole pool. The pool is then rebuilt with ``executor_factory`` and the
+    documents whose work was lost go back to pending. Those documents are
+    suspects from then on and are run one at a time, so the one that kills
+    its worker is failed on its own instead of taking the batch down again.
+    """
+
+    default_batch_size = INGESTION_BATCH_SIZE
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        executor: Optional[Executor] = None,
+        batch_size: Optional[int] = None,
+        executor_factory: Optional[Callable[[], Executor]] = None
+    ):
+        self.session_factory = session_factory
+        self.executor_factory = executor_factory or (
+            lambda: ProcessPoolExecutor(max_workers=INGESTION_WORKERS)
+        )
+        self.executor = executor or self.executor_factory()
+        self.batch_size = batch_size or self.default_batch_size
+        self.metrics = PipelineMetrics()
+        self._suspects: Set[UUID] = set()
+
+    @abc.abstractmethod
+    def run_batch(self) -> int:
+        """Process one batch; returns how many documents were claimed"""
+
+    def _restart_executor(self) -> None:
+        logger.warning("Worker pool broke; starting a new one")
+        self.executor.shutdown(wait=False)
+        self.executor = self.executor_factory()
+        self.metrics.pool_restarts += 1
+
+    def _submit(self, task: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        try:
+            return self.executor.submit(task, *args, **kwargs)
+        except BrokenProcessPool:
+            self._restart_executor()
+            return self.executor.submit(task, *args, **kwargs)
+
+    def _completed(
+        self, items: List[Any], submit: Callable[[Any], Future], released: List[Any]
+    ) -> Iterator[Tuple[Any, Future]]:
+        """Yield ``(item, future)`` for each item as its work finishes.
+
+        Items whose work was lost to a broken pool are appended to
+        ``released`` instead of being yielded.
+        """
+        batch = []
+        for item in items:
+            if item.id in self._suspects:
+                # Alone in the pool: if it breaks now, this item broke it
+                future = submit(item)
+                try:
+                    future.result()
+                except BrokenProcessPool:
+                    self._restart_executor()
+                except Exception:
+                    pass
+                self._suspects.discard(item.id)
+                yield item, future
+            else:
+                batch.append(item)
+
+        futures = {submit(item): item for item in batch}
+        broken = False
+        for future in as_completed(futures):
+            item = futures[future]
+            if isinstance(future.exception(), BrokenProcessPool):
+                broken = True
+                self._suspects.add(item.id)
+                released.append(item)
+            else:
+                yield item, future
+        if broken:
+            self._restart_executor()
+        self.metrics.released += len(released)
+
+    def drain(self) -> None:
+        """Process batches until nothing is left to claim"""
+        while self.run_batch():
+            pass
+
+    def run_forever(self, poll_interval: float = 5.0) -> None:
+        """Keep draining the queue, sleeping only when it is empty"""
+        try:
+            while True:
+                if self.run_batch() == 0:
+                    time.sleep(poll_interval)
+        finally:
+            self.executor.shutdown()
+
+
+class CreditReportIngestion(_BatchPipeline):
+    """Claim UPLOADED credit reports and write ``normalized_snapshot``."""
+
+    def run_batch(self) -> int:
+        db = self.session_factory()
+        try:
+            documents = claim_credit_reports(db, self.batch_size)
+            if not documents:
+                return 0
+            started = time.monotonic()
+            self.metrics.batches += 1
+            self.metrics.claimed += len(documents)
+
+            released: List[Document] = []
+            for doc, future in self._completed(documents, self._parse, released):
+                self._apply(doc, future)
+            for doc in released:
+                doc.status = DocumentStatus.UPLOADED
+            db.commit()
+
+            self.metrics.busy_seconds += time.monotonic() - started
+            logger.info("Credit report ingestion batch done: %s", self.metrics.as_dict())
+            return len(documents)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _parse(self, doc: Document) -> Future:
+        return self._submit(
+            _timed_parse, doc.s3_key, doc.mime_type, doc.original_filename, doc.encryption_key_id
+        )
+
+    def _apply(self, document: Document, future) -> None:
+        metadata = dict(document.processing_metadata or {})
+        try:
+            result = future.result()
+            snapshot = result['snapshot']
+            metadata = store_snapshot(
+                metadata, snapshot,
+                tenant_id=document.tenant_id,
+                document_id=document.id,
+                encryption_key_id=document.encryption_key_id
+            )
+        except Exception as e:
+            self.metrics.record_failure(e)
+            metadata['ingestion'] = {
+                'status': 'failed',
+                'error': f"{type(e).__name__}: {e}",
+                'failed_at': utc_now().isoformat(),
+            }
+            document.status = DocumentStatus.FAILED
+        else:
+            self.metrics.succeeded += 1
+            metadata['ingestion'] = {
+                'status': 'processed',
+                'source_format': snapshot.get('source_format'),
+                'counts': snapshot_counts(snapshot),
+                'duration_ms': result['duration_ms'],
+                'processed_at': utc_now().isoformat(),
+            }
+            document.status = DocumentStatus.PROCESSED
+        document.processing_metadata = metadata
+
+
+class TextExtraction(_BatchPipeline):
+    """Fill ``Document.extracted_text`` for PDF and plain-text uploads.
+
+    Results are written back with one executemany UPDATE per
+    ``EXTRACTION_WRITE_BATCH`` documents rather than a round trip each.
+    """
+
+    default_batch_size = EXTRACTION_BATCH_SIZE
+
+    def run_batch(self) -> int:
+        db = self.session_factory()
+        try:
+            claimed = claim_for_text_extraction(db, self.batch_size)
+            if not claimed:
+                return 0
+            started = time.monotonic()
+            self.metrics.batches += 1
+            self.metrics.claimed += len(claimed)
+
+            released: List[Any] = []
+            pending: List[Dict[str, Any]] = []
+            for row, future in self._completed(claimed, self._extract, released):
+                pending.append(self._result_row(row.id, future))
+                if len(pending) >= EXTRACTION_WRITE_BATCH:
+                    self._write(db, pending)
+            # Lost to a broken pool: back to pending for the next claim
+            pending.extend(
+                {'id': row.id, 'text_extraction_status': None, 'updated_at': utc_now()}
+                for row in released
+            )
+            self._write(db, pending)
+
+            self.metrics.busy_seconds += time.monotonic() - started
+            logger.info("Text extraction batch done: %s", self.metrics.as_dict())
+            return len(claimed)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _extract(self, row: Any) -> Future:
+        return self._submit(
+            extract_document_text, row.s3_key, row.mime_type,
+            encryption_key_id=row.encryption_key_id
+        )
+
+    def _result_row(self, document_id: UUID, future) -> Dict[str, Any]:
+        try:
+            result = future.result()
+        except Exception as e:
+            self.metrics.record_failure(e)
+            logger.warning("Text extraction failed for document %s: %s", document_id, e)
+            return {
+                'id': document_id,
+                'extracted_text': None,
+                'text_extraction_status': TEXT_EXTRACTION_FAILED,
+                'updated_at': utc_now(),
+            }
+        self.metrics.succeeded += 1
+        return {
+            'id': document_id,
+            'extracted_text': result['text'],
+            'text_extraction_status': (
+                TEXT_EXTRACTION_PARTIAL if result['budget_exceeded'] else TEXT_EXTRACTION_DONE
+            ),
+            'updated_at': utc_now(),
+        }
+
+    @staticmethod
+    def _write(db: Session, rows: List[Dict[str, Any]]) -> None:
+        if rows:
+            db.execute(update(Document), rows)
+            db.commit()
+            rows.clear()
@@ -0,0 +1,251 @@
+"""Chunked AES-GCM envelope encryption for stored documents.
+
+Each tenant has a 256-bit data key (DEK). The DEK is wrapped with the master
+key from ``DOCUMENT_ENCRYPTION_KEY`` and the wrapped form *is* the key id
+stored on ``Tenant.data_key_id`` and ``Document.encryption_key_id``, so any
+process holding the master key can decrypt without a key lookup. Unwrapped
+keys are cached in memory.
+
+Objects are encrypted in fixed-size chunks so uploads and downloads stream
+with one chunk in memory. Layout::
+
+    header   = b"CKE1" | chunk_size (u32) | nonce_prefix (8 bytes)
+    chunk[i] = AES-GCM(plaintext[i], nonce = nonce_prefix | i (u32),
+                       aad = header | i (u32) | is_last (1 byte))
+
+Binding the index and last-chunk flag into the AAD means reordered,
+truncated or extended ciphertext fails authentication.
+"""
+from __future__ import annotations
+
+import base64
+import os
+import struct
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+ENCRYPTION_CHUNK_SIZE = int(os.getenv('DOCUMENT_ENCRYPTION_CHUNK_SIZE', 64 * 1024))
+
+_MAGIC = b"CKE1"
+_HEADER = struct.Struct(">4sI8s")
+_TAG_SIZE = 16
+_KEY_PREFIX = "aesgcm1:"
+
+
+class DocumentEncryptionError(Exception):
+    """Raised for missing keys or ciphertext that fails authentication."""
+
+
+def encryption_enabled() -> bool:
+    return bool(os.getenv('DOCUMENT_ENCRYPTION_KEY'))
+
+
+@lru_cache(maxsize=4)
+def _master_key(encoded: str) -> AESGCM:
+    key = base64.b64decode(encoded)
+    if len(key) != 32:
+        raise DocumentEncryptionError("DOCUMENT_ENCRYPTION_KEY must be 32 base64-encoded bytes")
+    return AESGCM(key)
+
+
+def _master() -> AESGCM:
+    encoded = os.getenv('DOCUMENT_ENCRYPTION_KEY')
+    if not encoded:
+        raise DocumentEncryptionError("DOCUMENT_ENCRYPTION_KEY is not configured")
+    return _master_key(encoded)
+
+
+def generate_data_key() -> str:
+    """Create a new data key and return its wrapped form as the key id"""
+    nonce = os.urandom(12)
+    wrapped = _master().encrypt(nonce, AESGCM.generate_key(bit_length=256), _MAGIC)
+    return _KEY_PREFIX + base64.urlsafe_b64encode(nonce + wrapped).decode()
+
+
+@lru_cache(maxsize=1024)
+def data_key(key_id: str) -> AESGCM:
+    """Unwrap (and cache) the data key identified by ``key_id``"""
+    if not key_id.startswith(_KEY_PREFIX):
+        raise DocumentEncryptionError("Unsupported encryption key id")
+    blob = base64.urlsafe_b64decode(key_id[len(_KEY_PREFIX):].encode())
+    try:
+        return AESGCM(_master().decrypt(blob[:12], blob[12:], _MAGIC))
+    except InvalidTag:
+        raise DocumentEncryptionError("Data key was not wrapped by the configured master key")
+
+
+def tenant_data_key_id(db, tenant_id) -> Optional[str]:
+    """Return the tenant's data key id, creating it on first use.
+
+    Returns None when encryption is not configured. The key is created in a
+    session of its own, which locks the tenant row and commits, so the
+    caller's transaction is left untouched.
+    """
+    if not encryption_enabled():
+        return None
+    from sqlalchemy.orm import Session
+
+    from app.models.tenant import Tenant
+
+    key_id = db.query(Tenant.data_key_id).filter(Tenant.id == tenant_id).scalar()
+    if key_id:
+        return key_id
+
+    with Session(bind=db.get_bind()) as key_db:
+        tenant = key_db.query(Tenant).filter(Tenant.id == tenant_id).with_for_update().one()
+        if not tenant.data_key_id:
+            tenant.data_key_id = generate_data_key()
+        key_id = tenant.data_key_id
+        key_db.commit()
+    return key_id
+
+
+def ciphertext_size(plaintext_size: int, chunk_size: Optional[int] = None) -> int:
+    chunk_size = chunk_size or ENCRYPTION_CHUNK_SIZE
+    chunks = max(1, -(-plaintext_size // chunk_size))
+    return _HEADER.size + plaintext_size + chunks * _TAG_SIZE
+
+
+def _aad(header: bytes, index: int, last: bool) -> bytes:
+    return header + struct.pack(">IB", index, last)
+
+
+class StreamEncryptor:
+    """Incrementally encrypt a byte stream; feed ``update`` then call ``finalize``."""
+
+    def __init__(self, key_id: str, chunk_size: Optional[int] = None):
+        self._aead = data_key(key_id)
+        self._chunk_size = chunk_size or ENCRYPTION_CHUNK_SIZE
+        self._prefix = os.urandom(8)
+        self._header = _HEADER.pack(_MAGIC, self._chunk_size, self._prefix)
+        self._buffer = bytearray()
+        self._index = 0
+        self._started = False
+
+    def _seal(self, plaintext, last: bool) -> bytes:
+        nonce = self._prefix + struct.pack(">I", self._index)
+        sealed = self._aead.encrypt(nonce, bytes(plaintext), _aad(self._header, self._index, last))
+        self._index += 1
+        return sealed
+
+    def _seal_into(self, plaintext, out: memoryview) -> None:
+        nonce = self._prefix + struct.pack(">I", self._index)
+        self._aead.encrypt_into(nonce, plaintext, _aad(self._header, self._index, False), out)
+        self._index += 1
+
+    def update(self, data: bytes) -> bytearray:
+        size = self._chunk_size
+        # Keep the trailing chunk back: only finalize() knows it is the last.
+        total = len(self._buffer) + len(data)
+        full = (total - 1) // size if total else 0
+        head = b"" if self._started else self._header
+        self._started = True
+        if not full:
+            self._buffer += data
+            return bytearray(head)
+
+        # Chunks are sealed straight from ``data`` into one preallocated
+        # output; only a partial chunk at either end is copied into the buffer
+        sealed_size = size + _TAG_SIZE
+        out = bytearray(len(head) + full * sealed_size)
+        out[:len(head)] = head
+        view, source = memoryview(out), memoryview(data)
+        offset, position = len(head), 0
+        if self._buffer:
+            position = size - len(self._buffer)
+            self._buffer += source[:position]
+            self._seal_into(self._buffer, view[offset:offset + sealed_size])
+            self._buffer.clear()
+            offset += sealed_size
+        while offset < len(out):
+            self._seal_into(source[position:position + size], view[offset:offset + sealed_size])
+            position += size
+            offset += sealed_size
+        self._buffer += source[position:]
+        view.release()
+        source.release()
+        return out
+
+    def finalize(self) -> bytes:
+        head = b"" if self._started else self._header
+        self._started = True
+        sealed = self._seal(self._buffer, last=True)
+        self._buffer.clear()
+        return head + sealed
+
+
+class StreamDecryptor:
+    """Inverse of :class:`StreamEncryptor`; raises on tampering or truncation."""
+
+    def __init__(self, key_id: str):
+        self._aead = data_key(key_id)
+        self._header: Optional[bytes] = None
+        self._sealed_size = 0
+        self._prefix = b""
+        self._buffer = bytearray()
+        self._index = 0
+
+    def _open(self, sealed, last: bool) -> bytes:
+        nonce = self._prefix + struct.pack(">I", self._index)
+        try:
+            plaintext = self._aead.decrypt(nonce, bytes(sealed), _aad(self._header, self._index, last))
+        except InvalidTag:
+            raise DocumentEncryptionError("Encrypted document failed authentication")
+        self._index += 1
+        return plaintext
+
+    def update(self, data: bytes) -> bytes:
+        self._buffer += data
+        if self._header is None:
+            if len(self._buffer) < _HEADER.size:
+                return b""
+            magic, chunk_size, self._prefix = _HEADER.unpack_from(self._buffer)
+            if magic != _MAGIC:
+                raise DocumentEncryptionError("Not an encrypted document")
+            self._header = bytes(self._buffer[:_HEADER.size])
+            self._sealed_size = chunk_size + _TAG_SIZE
+            del self._buffer[:_HEADER.size]
+
+        size = self._sealed_size
+        # As when encrypting, the final chunk is only opened in finalize().
+        full = (len(self._buffer) - 1) // size if self._buffer else 0
+        view = memoryview(self._buffer)
+        out = [self._open(view[n * size:(n + 1) * size], last=False) for n in range(full)]
+        view.release()
+        del self._buffer[:full * size]
+        return b"".join(out)
+
+    def finalize(self) -> bytes:
+        if self._header is None or len(self._buffer) < _TAG_SIZE:
+            raise DocumentEncryptionError("Encrypted document is truncated")
+        plaintext = self._open(self._buffer, last=True)
+        self._buffer.clear()
+        return plaintext
+
+
+def encrypt_bytes(content: bytes, key_id: str) -> bytes:
+    encryptor = StreamEncryptor(key_id)
+    return encryptor.update(content) + encryptor.finalize()
+
+
+def decrypt_chunks(chunks: Iterable[bytes], key_id: str) -> Iterator[bytes]:
+    """Decrypt a ciphertext chunk stream, yielding plaintext as it authenticates"""
+    decryptor = StreamDecryptor(key_id)
+    for chunk in chunks:
+        plaintext = decryptor.update(chunk)
+        if plaintext:
+            yield plaintext
+    yield decryptor.finalize()
+
+
+def iter_plaintext(storage, s3_key: str, key_id: Optional[str], chunk_size: Optional[int] = None) -> Iterator[bytes]:
+    """Read a stored object, decrypting it when ``key_id`` is set"""
+    if not key_id:
+        return storage.iter_file(s3_key, chunk_size) if chunk_size else storage.iter_file(s3_key)
+    # Read in sealed-chunk multiples so at most one chunk is buffered
+    sealed = ENCRYPTION_CHUNK_SIZE + _TAG_SIZE
+    read_size = max(1, (chunk_size or sealed) // sealed) * sealed
+    return decrypt_chunks(storage.iter_file(s3_key, read_size), key_id)
@@ -0,0 +1,345 @@
+"""Batched, resumable erasure for GDPR delete requests.
+
+:func:`erase_subject` removes everything belonging to the clients recorded on
+a ``GDPR_REQUEST`` compliance event, walking the foreign-key graph from the
+leaves up to ``clients``. Each step deletes ``GDPR_ERASURE_BATCH_SIZE`` rows
+per short transaction and pauses ``GDPR_ERASURE_PAUSE`` seconds between
+batches, so hot tables are never locked for long.
+
+Audit and data-access log rows are anonymized rather than deleted, and other
+compliance events only lose their link to the client. Stored objects (document
+binaries, offloaded snapshots and earlier GDPR export archives) are deleted
+``GDPR_ERASURE_STORAGE_CONCURRENCY`` at a time, before the rows that reference
+them are committed away.
+
+Progress is committed to the event's ``event_data`` together with each batch.
+Every step only selects rows that still need erasing, so after a crash the job
+is rerun (``manage.py gdpr-erasure``) and picks up where it stopped.
+"""
+from __future__ import annotations
+
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models.audit_log import AuditLog, ComplianceEvent, DataAccessLog
+from app.models.client import Client
+from app.models.client_tag import client_tags
+from app.models.dispute import Dispute
+from app.models.dispute_case import DisputeCase
+from app.models.dispute_item import DisputeItem
+from app.models.document import Document, DocumentShare
+from app.models.generated_letter import GeneratedLetter
+from app.models.reminder import Reminder
+from app.models.suggestion_run import SuggestionRun
+from app.models.task import Task
+from app.services.gdpr_export import subject_document_filter
+from app.services.response_cache import CACHE_RESOURCES, cache_versions
+
+GDPR_ERASURE_BATCH_SIZE = int(os.getenv('GDPR_ERASURE_BATCH_SIZE', 500))
+GDPR_ERASURE_PAUSE = float(os.getenv('GDPR_ERASURE_PAUSE', 0.1))
+GDPR_ERASURE_STORAGE_CONCURRENCY = int(os.getenv('GDPR_ERASURE_STORAGE_CONCURRENCY', 8))
+
+ERASED = '[erased]'
+
+
+class GDPRErasureError(Exception):
+    pass
+
+
+class SubjectErasure:
+    """One erasure job; :meth:`run` is safe to call again after a failure."""
+
+    def __init__(
+        self,
+        db: Session,
+        storage,
+        job: ComplianceEvent,
+        batch_size: Optional[int] = None,
+        pause: Optional[float] = None,
+        concurrency: Optional[int] = None
+    ):
+        self.db = db
+        self.storage = storage
+        self.job = job
+        self.batch_size = batch_size or GDPR_ERASURE_BATCH_SIZE
+        self.pause = GDPR_ERASURE_PAUSE if pause is None else pause
+        self.concurrency = concurrency or GDPR_ERASURE_STORAGE_CONCURRENCY
+        self.tenant_id = job.tenant_id
+        self.client_ids = [uuid.UUID(value) for value in job.event_data.get('client_ids', [])]
+
+    def steps(self) -> List[tuple]:
+        """(name, callable) in foreign-key order, leaves first"""
+        return [
+            ('audit_logs', self._anonymize_audit_logs),
+            ('data_access_logs', self._anonymize_data_access_logs),
+            ('gdpr_exports', self._erase_export_archives),
+            ('suggestion_runs', self._deleter(SuggestionRun, self._case_owned(SuggestionRun))),
+            ('generated_letters', self._deleter(GeneratedLetter, self._case_owned(GeneratedLetter))),
+            ('dispute_items', self._deleter(DisputeItem, self._case_owned(DisputeItem))),
+            ('dispute_cases', self._deleter(DisputeCase, self._owned(DisputeCase))),
+            ('reminders', self._deleter(
+                Reminder, self._owned(Reminder) | Reminder.task_id.in_(self._task_ids())
+            )),
+            ('tasks', self._deleter(Task, self._owned(Task))),
+            ('document_shares', self._deleter(
+                DocumentShare, DocumentShare.document_id.in_(self._document_ids())
+            )),
+            ('documents', self._erase_documents),
+            ('disputes', self._deleter(Dispute, self._owned(Dispute))),
+            ('client_tags', self._erase_client_tags),
+            ('compliance_events', self._unlink_compliance_events),
+            ('clients', self._deleter(Client, Client.id.in_(self.client_ids))),
+        ]
+
+    def run(self) -> Dict[str, Any]:
+        if not self.client_ids:
+            raise GDPRErasureError("No clients recorded on the request")
+        done = list(self.job.event_data.get('steps_done', []))
+        self._record(status='running', error=None)
+        self.db.commit()
+        for name, step in self.steps():
+            if name in done:
+                continue
+            self._record(step=name)
+            self.db.commit()
+            step(name)
+            done.append(name)
+            self._record(steps_done=done)
+            self.db.commit()
+        self._record(status='completed', step=None)
+        self.job.resolved_at = datetime.now(timezone.utc)
+        self.job.resolution_notes = f"Erased {sum(self.job.event_data.get('erased', {}).values())} records"
+        self.db.commit()
+        # Cached listings may still show the subject's clients, tasks and disputes
+        cache_versions.bump(self.job.tenant_id, *CACHE_RESOURCES)
+        return self.job.event_data
+
+    # -- bookkeeping -----------------------------------------------------
+
+    def _record(self, **fields: Any) -> None:
+        # Reassign so the JSON column is flagged dirty
+        self.job.event_data = {**(self.job.event_data or {}), **fields}
+
+    def _count(self, name: str, rows: int, objects: int = 0) -> None:
+        erased = dict(self.job.event_data.get('erased', {}))
+        erased[name] = erased.get(name, 0) + rows
+        self._record(
+            erased=erased,
+            objects_deleted=self.job.event_data.get('objects_deleted', 0) + objects
+        )
+
+    def _batches(self, name: str, select_ids: Callable[[int], List], apply: Callable[[List], Optional[int]]) -> None:
+        """Apply ``apply`` to ``select_ids`` batches until none are left"""
+        while True:
+            ids = select_ids(self.batch_size)
+            if not ids:
+                return
+            objects = apply(ids)
+            self._count(name, len(ids), objects or 0)
+            self.db.commit()
+            if self.pause:
+                time.sleep(self.pause)
+
+    def _execute(self, statement) -> None:
+        self.db.execute(statement)
+
+    def _ids(self, column, *where) -> Callable[[int], List]:
+        return lambda limit: [value for (value,) in self.db.query(column).filter(*where).limit(limit)]
+
+    # -- filters ---------------------------------------------------------
+
+    def _owned(self, model):
+        return (model.tenant_id == self.tenant_id) & model.client_id.in_(self.client_ids)
+
+    def _case_ids(self):
+        return select(DisputeCase.id).where(self._owned(DisputeCase))
+
+    def _case_owned(self, model):
+        return (model.tenant_id == self.tenant_id) & or_(
+            model.client_id.in_(self.client_ids), model.case_id.in_(self._case_ids())
+        )
+
+    def _task_ids(self):
+        return select(Task.id).where(self._owned(Task))
+
+    def _document_filter(self):
+        return subject_document_filter(self.tenant_id, self.client_ids)
+
+    def _document_ids(self):
+        return select(Document.id).where(self._document_filter())
+
+    # -- steps -----------------------------------------------------------
+
+    def _deleter(self, model, where) -> Callable[[str], None]:
+        def step(name: str) -> None:
+            self._batches(
+                name,
+                self._ids(model.id, where),
+                lambda ids: self._execute(delete(model).where(model.id.in_(ids)))
+            )
+        return step
+
+    def _log_resource_ids(self) -> List[str]:
+        # Log steps run before documents are deleted, so their ids are still known
+        documents = self.db.query(Document.id).filter(self._document_filter())
+        return [str(value) for value in self.client_ids] + [str(value) for (value,) in documents]
+
+    def _anonymize_audit_logs(self, name: str) -> None:
+        resource_ids = self._log_resource_ids()
+        self._batches(
+            name,
+            self._ids(
+                AuditLog.id,
+                AuditLog.tenant_id == self.tenant_id,
+                AuditLog.resource_id.in_(resource_ids)
+            ),
+            lambda ids: self._execute(
+                update(AuditLog).where(AuditLog.id.in_(ids)).values(
+                    resource_id=ERASED, description=None, old_values=None,
+                    new_values=None, changes=None, event_metadata=None
+                )
+            )
+        )
+
+    def _anonymize_data_access_logs(self, name: str) -> None:
+        resource_ids = self._log_resource_ids()
+        self._batches(
+            name,
+            self._ids(
+                DataAccessLog.id,
+                DataAccessLog.tenant_id == self.tenant_id,
+                DataAccessLog.resource_id.in_(resource_ids)
+            ),
+            lambda ids: self._execute(
+                update(DataAccessLog).where(DataAccessLog.id.in_(ids)).values(resource_id=ERASED)
+            )
+        )
+
+    def _erase_export_archives(self, name: str) -> None:
+        """Delete archives that earlier access requests exported for these clients"""
+        subject = {str(value) for value in self.client_ids}
+        events = self.db.query(ComplianceEvent).filter(
+            ComplianceEvent.tenant_id == self.tenant_id,
+            ComplianceEvent.event_type == "GDPR_REQUEST",
+            ComplianceEvent.id != self.job.id
+        )
+        erased = 0
+        for event in events:
+            data = event.event_data or {}
+            if not data.get('s3_key') or not subject & set(data.get('client_ids', [])):
+                continue
+            self._delete_objects([data['s3_key']])
+            event.event_data = {
+                **{key: value for key, value in data.items() if key not in ('s3_key', 'encryption_key_id')},
+                'archive_erased': True
+            }
+            erased += 1
+        self._count(name, erased, erased)
+
+    def _erase_documents(self, name: str) -> None:
+        def select_batch(limit: int) -> List:
+            return self.db.query(
+                Document.id, Document.s3_bucket, Document.s3_key, Document.processing_metadata
+            ).filter(self._document_filter()).limit(limit).all()
+
+        def apply(rows) -> int:
+            ids = [row.id for row in rows]
+            keys = {(row.s3_bucket, row.s3_key) for row in rows}
+            # Deduplicated objects stay while any other document points at them
+            shared = {
+                (bucket, key) for bucket, key in self.db.query(Document.s3_bucket, Document.s3_key).filter(
+                    Document.tenant_id == self.tenant_id,
+                    Document.s3_key.in_([key for _, key in keys]),
+                    Document.id.notin_(ids)
+                )
+            }
+            objects = [key for _, key in keys - shared]
+            objects += [
+                row.processing_metadata['normalized_snapshot_ref']['s3_key']
+                for row in rows
+                if isinstance(row.processing_metadata, dict)
+                and row.processing_metadata.get('normalized_snapshot_ref')
+            ]
+            self._delete_objects(objects)
+            self._execute(delete(Document).where(Document.id.in_(ids)))
+            return len(objects)
+
+        self._batches(name, select_batch, apply)
+
+    def _erase_client_tags(self, name: str) -> None:
+        self._batches(
+            name,
+            self._ids(client_tags.c.id, client_tags.c.client_id.in_(self.client_ids)),
+            lambda ids: self._execute(delete(client_tags).where(client_tags.c.id.in_(ids)))
+        )
+
+    def _unlink_compliance_events(self, name: str) -> None:
+        self._batches(
+            name,
+            self._ids(ComplianceEvent.id, self._owned(ComplianceEvent)),
+            lambda ids: self._execute(
+                update(ComplianceEvent).where(ComplianceEvent.id.in_(ids)).values(client_id=None)
+                .execution_options(synchronize_session=False)
+            )
+        )
+        # The request event itself may have been unlinked by the bulk update
+        self.db.refresh(self.job, ['client_id'])
+
+    def _delete_objects(self, keys: Iterable[str]) -> None:
+        """Delete stored objects concurrently; any failure aborts the batch"""
+        keys = list(keys)
+        if not keys:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(keys))) as pool:
+            failed = [key for key, ok in zip(keys, pool.map(self.storage.delete_file, keys)) if not ok]
+        if failed:
+            raise GDPRErasureError(f"Could not delete {len(failed)} stored objects")
+
+
+def erase_subject(
+    session_factory: Callable[[], Session],
+    storage,
+    job_id: Any,
+    **options: Any
+) -> Dict[str, Any]:
+    """Run (or resume) the erasure job recorded on compliance event ``job_id``.
+
+    A failure is recorded on the event before it is re-raised.
+    """
+    db = session_factory()
+    try:
+        job = db.get(ComplianceEvent, job_id)
+        if job is None:
+            raise GDPRErasureError(f"GDPR request {job_id} not found")
+        try:
+            return SubjectErasure(db, storage, job, **options).run()
+        except Exception as e:
+            db.rollback()
+            job = db.get(ComplianceEvent, job_id)
+            job.event_data = {**(job.event_data or {}), 'status': 'failed', 'error': str(e)}
+            db.commit()
+            raise
+    finally:
+        db.close()
+
+
+def pending_erasures(db: Session, tenant_id: Optional[Any] = None) -> List[uuid.UUID]:
+    """Delete requests that were queued, interrupted or failed"""
+    query = db.query(ComplianceEvent).filter(
+        ComplianceEvent.event_type == "GDPR_REQUEST",
+        ComplianceEvent.resolved_at.is_(None)
+    )
+    if tenant_id is not None:
+        query = query.filter(ComplianceEvent.tenant_id == tenant_id)
+    return [
+        event.id for event in query
+        if (event.event_data or {}).get('request_type') == 'delete'
+        and (event.event_data or {}).get('status') in ('queued', 'running', 'failed')
+    ]
@@ -0,0 +1,336 @@
+"""GDPR access and portability exports.
+
+A data subject is every client of the tenant with the requested email
+address. Their export is one ZIP archive in object storage::
+
+    manifest.json
+    data/<table>.ndjson       one JSON object per row
+    documents/<filename>      the subject's uploaded files, decrypted
+
+The subject's documents are those of their clients and those attached to
+their disputes (:func:`subject_document_filter`, shared with the erasure).
+
+Each table is read on its own session through a server-side cursor, and
+tables and document binaries are fetched ``GDPR_EXPORT_CONCURRENCY`` at a time
+by :func:`app.services.document_export.stream_zip`. However much data the
+subject has, memory stays bounded and the archive is spooled to a temporary
+file before it is uploaded.
+"""
+from __future__ import annotations
+
+import base64
+import enum
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from sqlalchemy import func, inspect as sa_inspect, or_, select
+from sqlalchemy.orm import Query, Session, undefer
+from starlette.concurrency import run_in_threadpool
+
+from app.models.audit_log import AuditLog, ComplianceEvent, DataAccessLog
+from app.models.client import Client
+from app.models.client_tag import client_tags
+from app.models.dispute import Dispute
+from app.models.dispute_case import DisputeCase
+from app.models.dispute_item import DisputeItem
+from app.models.document import Document, DocumentShare
+from app.models.generated_letter import GeneratedLetter
+from app.models.reminder import Reminder
+from app.models.suggestion_run import SuggestionRun
+from app.models.tag import Tag
+from app.models.task import Task
+from app.services.document_export import ExportEntry, stream_zip, unique_arcnames
+from app.services.encryption import iter_plaintext, tenant_data_key_id
+
+
+GDPR_EXPORT_CONCURRENCY = int(os.getenv('GDPR_EXPORT_CONCURRENCY', 4))
+GDPR_EXPORT_BATCH_SIZE = int(os.getenv('GDPR_EXPORT_BATCH_SIZE', 1000))
+GDPR_PROGRESS_INTERVAL = float(os.getenv('GDPR_PROGRESS_INTERVAL', 2.0))
+
+# Internal bookkeeping that is not the subject's personal data
+_EXCLUDED_COLUMNS = {'encryption_key_id'}
+
+
+class GDPRExportError(Exception):
+    pass
+
+
+def find_subject_clients(db: Session, tenant_id: Any, email: str) -> List[uuid.UUID]:
+    """Ids of the tenant's clients with ``email``, compared case-insensitively"""
+    return [
+        client_id for (client_id,) in db.query(Client.id).filter(
+            Client.tenant_id == tenant_id,
+            func.lower(Client.email) == email.strip().lower()
+        )
+    ]
+
+
+def subject_document_filter(tenant_id: Any, client_ids: Sequence[uuid.UUID]):
+    """Documents of the subject's clients, or attached to their disputes"""
+    disputes = select(Dispute.id).where(Dispute.tenant_id == tenant_id, Dispute.client_id.in_(client_ids))
+    return (Document.tenant_id == tenant_id) & or_(
+        Document.client_id.in_(client_ids), Document.dispute_id.in_(disputes)
+    )
+
+
+def subject_queries(
+    tenant_id: Any,
+    client_ids: Sequence[uuid.UUID],
+    document_ids: Sequence[uuid.UUID]
+) -> Dict[str, Callable[[Session], Query]]:
+    """Table name -> query for the subject's rows in that table"""
+    resource_ids = [str(value) for value in (*client_ids, *document_ids)]
+
+    def owned(model):
+        return lambda db: db.query(model).filter(
+            model.tenant_id == tenant_id, model.client_id.in_(client_ids)
+        )
+
+    return {
+        'clients': lambda db: db.query(Client).filter(
+            Client.tenant_id == tenant_id, Client.id.in_(client_ids)
+        ),
+        'client_tags': lambda db: db.query(
+            client_tags.c.client_id, Tag.name.label('tag'), client_tags.c.created_at
+        ).join(Tag, Tag.id == client_tags.c.tag_id).filter(
+            Tag.tenant_id == tenant_id, client_tags.c.client_id.in_(client_ids)
+        ),
+        'tasks': owned(Task),
+        'reminders': owned(Reminder),
+        'documents': lambda db: db.query(Document).filter(subject_document_filter(tenant_id, client_ids)),
+        'document_shares': lambda db: db.query(DocumentShare).filter(
+            DocumentShare.document_id.in_(document_ids)
+        ),
+        'disputes': owned(Dispute),
+        'dispute_cases': owned(DisputeCase),
+        'dispute_items': owned(DisputeItem),
+        'generated_letters': owned(GeneratedLetter),
+        'suggestion_runs': owned(SuggestionRun),
+        'compliance_events': owned(ComplianceEvent),
+        'audit_logs': lambda db: db.query(AuditLog).filter(
+            AuditLog.tenant_id == tenant_id, AuditLog.resource_id.in_(resource_ids)
+        ),
+        'data_access_logs': lambda db: db.query(DataAccessLog).filter(
+            DataAccessLog.tenant_id == tenant_id, DataAccessLog.resource_id.in_(resource_ids)
+        ),
+    }
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, Decimal)):
+        return str(value)
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    return str(value)
+
+
+def row_dict(row: Any) -> Dict[str, Any]:
+    """Column values of an ORM instance or a result row"""
+    if hasattr(row, '_mapping'):
+        return dict(row._mapping)
+    return {
+        attr.key: getattr(row, attr.key)
+        for attr in sa_inspect(row).mapper.column_attrs
+        if attr.key not in _EXCLUDED_COLUMNS
+    }
+
+
+class GDPRExportProgress:
+    """Thread-safe export counters, reported on the compliance event."""
+
+    def __init__(self, tables: int, documents: int):
+        self._lock = threading.Lock()
+        self.tables_total = tables
+        self.documents_total = documents
+        self.record_counts: Dict[str, int] = {}
+        self.documents_done = 0
+        self.documents_failed = 0
+        self.failed_tables: List[str] = []
+        self.archive_bytes = 0
+
+    def table_done(self, table: str, rows: int) -> None:
+        with self._lock:
+            self.record_counts[table] = rows
+
+    def table_failed(self, table: str) -> None:
+        with self._lock:
+            self.failed_tables.append(table)
+
+    def document_done(self, ok: bool = True) -> None:
+        with self._lock:
+            if ok:
+                self.documents_done += 1
+            else:
+                self.documents_failed += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'tables_done': len(self.record_counts),
+                'tables_total': self.tables_total,
+                'documents_done': self.documents_done,
+                'documents_failed': self.documents_failed,
+                'documents_total': self.documents_total,
+                'archive_bytes': self.archive_bytes,
+            }
+
+
+def _table_chunks(
+    session_factory: Callable[[], Session],
+    table: str,
+    build: Callable[[Session], Query],
+    progress: GDPRExportProgress,
+    batch_size: int
+) -> Iterator[bytes]:
+    db = session_factory()
+    try:
+        query = build(db)
+        if query.column_descriptions[0]['entity'] is not None:
+            query = query.options(undefer('*'))
+        rows, lines = 0, []
+        for row in query.yield_per(batch_size):
+            lines.append(json.dumps(row_dict(row), default=_json_default) + '\n')
+            rows += 1
+            if len(lines) >= batch_size:
+                yield ''.join(lines).encode()
+                lines = []
+        if lines:
+            yield ''.join(lines).encode()
+        progress.table_done(table, rows)
+    except Exception:
+        progress.table_failed(table)
+        raise
+    finally:
+        db.close()
+
+
+def _document_chunks(storage, document: Dict[str, Any], progress: GDPRExportProgress) -> Iterator[bytes]:
+    try:
+        yield from iter_plaintext(storage, document['s3_key'], document['encryption_key_id'])
+    except Exception:
+        progress.document_done(ok=False)
+        raise
+    progress.document_done()
+
+
+def _manifest(tenant_id, client_ids, tables, documents) -> Iterator[bytes]:
+    yield json.dumps({
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'tenant_id': str(tenant_id),
+        'client_ids': [str(client_id) for client_id in client_ids],
+        'tables': [f"data/{table}.ndjson" for table in tables],
+        'documents': [
+            {'document_id': str(doc['id']), 'file': doc['arcname'], 'original_filename': doc['original_filename']}
+            for doc in documents
+        ],
+    }, indent=2).encode()
+
+
+async def export_subject_archive(
+    session_factory: Callable[[], Session],
+    storage,
+    *,
+    tenant_id: Any,
+    client_ids: Sequence[uuid.UUID],
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    concurrency: int = GDPR_EXPORT_CONCURRENCY,
+    batch_size: int = GDPR_EXPORT_BATCH_SIZE
+) -> Dict[str, Any]:
+    """Build the subject's archive, upload it and return the upload metadata.
+
+    ``on_progress`` receives a progress snapshot at most every
+    ``GDPR_PROGRESS_INTERVAL`` seconds; it runs in a worker thread. The
+    archive is encrypted with the tenant's data key when one is configured.
+    """
+    from fastapi import UploadFile
+
+    db = session_factory()
+    try:
+        documents = [
+            {
+                'id': doc.id,
+                's3_key': doc.s3_key,
+                'mime_type': doc.mime_type,
+                'original_filename': doc.original_filename,
+                'encryption_key_id': doc.encryption_key_id,
+            }
+            for doc in db.query(
+                Document.id, Document.s3_key, Document.mime_type,
+                Document.original_filename, Document.encryption_key_id
+            ).filter(subject_document_filter(tenant_id, client_ids))
+        ]
+        archive_key_id = tenant_data_key_id(db, tenant_id)
+    finally:
+        db.close()
+    arcnames = unique_arcnames(doc['original_filename'] for doc in documents)
+    for doc, arcname in zip(documents, arcnames):
+        doc['arcname'] = f"documents/{arcname}"
+
+    queries = subject_queries(tenant_id, client_ids, [doc['id'] for doc in documents])
+    progress = GDPRExportProgress(tables=len(queries), documents=len(documents))
+    entries = [
+        ExportEntry(
+            s3_key=None,
+            arcname='manifest.json',
+            mime_type='application/json',
+            read=lambda: _manifest(tenant_id, client_ids, queries, documents)
+        )
+    ]
+    entries += [
+        ExportEntry(
+            s3_key=None,
+            arcname=f"data/{table}.ndjson",
+            mime_type='application/x-ndjson',
+            read=lambda table=table, build=build: _table_chunks(
+                session_factory, table, build, progress, batch_size
+            )
+        )
+        for table, build in queries.items()
+    ]
+    entries += [
+        ExportEntry(
+            s3_key=doc['s3_key'],
+            arcname=doc['arcname'],
+            mime_type=doc['mime_type'],
+            read=lambda doc=doc: _document_chunks(storage, doc, progress)
+        )
+        for doc in documents
+    ]
+
+    reported = time.monotonic()
+    with tempfile.TemporaryFile() as spool:
+        async for chunk in stream_zip(storage, entries, concurrency=concurrency):
+            # A disk write; keep it off the event loop
+            await run_in_threadpool(spool.write, chunk)
+            progress.archive_bytes += len(chunk)
+            if on_progress and time.monotonic() - reported >= GDPR_PROGRESS_INTERVAL:
+                reported = time.monotonic()
+                await run_in_threadpool(on_progress, progress.snapshot())
+
+        # Missing rows would make the export incomplete; a missing binary is
+        # listed in the archive's _export_errors.txt instead.
+        if progress.failed_tables:
+            raise GDPRExportError(f"Could not read {', '.join(sorted(progress.failed_tables))}")
+
+        await run_in_threadpool(spool.seek, 0)
+        result = await storage.upload_file(
+            UploadFile(file=spool, filename=f"gdpr-export-{uuid.uuid4()}.zip"),
+            str(tenant_id),
+            "gdpr_exports",
+            encryption_key_id=archive_key_id
+        )
+    result.update(progress.snapshot())
+    result['record_counts'] = dict(progress.record_counts)
+    result['encryption_key_id'] = archive_key_id
+    return result
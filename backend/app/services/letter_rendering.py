@@ -3,10 +3,11 @@ from __future__ import annotations
 import base64
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Any, Dict
 
 import markdown
-from jinja2 import Environment, StrictUndefined, TemplateError
+from jinja2 import Environment, StrictUndefined, Template, TemplateError
 from weasyprint import HTML
 
 
@@ -26,6 +27,16 @@ def _build_environment() -> Environment:
     return env
 
 
+_ENVIRONMENT = _build_environment()
+
+
+@lru_cache(maxsize=256)
+def _compile_template(source: str) -> Template:
+    # System templates are shared rows, so every tenant rendering one hits the
+    # same compiled entry.
+    return _ENVIRONMENT.from_string(source)
+
+
 @dataclass
 class LetterRenderResult:
     markdown: str
@@ -38,7 +49,7 @@ class LetterRenderer:
     """Renders markdown templates into HTML and PDF."""
 
     def __init__(self) -> None:
-        self.env = _build_environment()
+        self.env = _ENVIRONMENT
 
     def render(self, *, template: str, context: Dict[str, Any]) -> LetterRenderResult:
         enriched_context = {
@@ -47,7 +58,7 @@ class LetterRenderer:
         }
 
         try:
-            markdown_body = self.env.from_string(template).render(enriched_context)
+            markdown_body = _compile_template(template).render(enriched_context)
         except TemplateError as exc:
             raise ValueError(f"Failed to render template: {exc}") from exc
 
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from typing import Iterable, Optional
+from uuid import UUID
+
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import Query, Session, aliased
+
+from app.models.letter_template import LetterTemplate
+
+# Columns copied verbatim when a tenant forks a system template.
+_FORKED_FIELDS = (
+    "name",
+    "slug",
+    "category",
+    "channel",
+    "version",
+    "locale",
+    "subject",
+    "preview_text",
+    "body",
+    "variables",
+    "is_active",
+)
+
+
+def effective_templates_query(
+    db: Session, tenant_id: UUID, *, include_archived: bool = False
+) -> Query:
+    """Return the tenant's effective template set as a single query.
+
+    A tenant sees its own templates plus every system template (``tenant_id IS
+    NULL``) that it has not shadowed with a private copy. Archived copies keep
+    shadowing their source, so archiving a system template hides it for that
+    tenant only.
+    """
+    override = aliased(LetterTemplate)
+    shadowed = exists().where(
+        override.tenant_id == tenant_id,
+        override.source_template_id == LetterTemplate.id,
+    )
+    query = db.query(LetterTemplate).filter(
+        or_(
+            LetterTemplate.tenant_id == tenant_id,
+            and_(LetterTemplate.tenant_id.is_(None), ~shadowed),
+        )
+    )
+    if not include_archived:
+        query = query.filter(LetterTemplate.deleted_at.is_(None))
+    return query
+
+
+def get_effective_template(
+    db: Session, tenant_id: UUID, template_id: UUID
+) -> Optional[LetterTemplate]:
+    return (
+        effective_templates_query(db, tenant_id)
+        .filter(LetterTemplate.id == template_id)
+        .first()
+    )
+
+
+def slug_in_use(
+    db: Session,
+    tenant_id: UUID,
+    slug: str,
+    *,
+    exclude_ids: Iterable[UUID] = (),
+) -> bool:
+    # Archived rows still hold their slug in ix_letter_templates_tenant_slug
+    query = effective_templates_query(db, tenant_id, include_archived=True).filter(
+        LetterTemplate.slug == slug
+    )
+    excluded = [template_id for template_id in exclude_ids if template_id is not None]
+    if excluded:
+        query = query.filter(LetterTemplate.id.notin_(excluded))
+    return db.query(query.exists()).scalar()
+
+
+def fork_system_template(
+    db: Session, tenant_id: UUID, template: LetterTemplate
+) -> LetterTemplate:
+    """Create the tenant's private copy of a system template (copy-on-write)."""
+    if not template.is_system:
+        return template
+
+    copy = LetterTemplate(
+        tenant_id=tenant_id,
+        source_template_id=template.id,
+        **{field: getattr(template, field) for field in _FORKED_FIELDS},
+    )
+    db.add(copy)
+    db.flush()
+    return copy
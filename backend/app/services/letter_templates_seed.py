@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 from typing import Any, Dict, Iterable
-from uuid import UUID
 
 from sqlalchemy.orm import Session
 
@@ -69,11 +68,17 @@ SYSTEM_TEMPLATES: Iterable[Dict[str, Any]] = [
 ]
 
 
-def seed_system_templates(db: Session, tenant_id: UUID) -> None:
+def seed_system_templates(db: Session) -> None:
+    """Ensure the shared system templates exist as global (tenant-less) rows.
+
+    System templates are stored once; tenants resolve them through
+    ``app.services.letter_templates.effective_templates_query`` and only get a
+    private copy when they edit or archive one.
+    """
     existing = {
-        template.slug: template
-        for template in db.query(LetterTemplate)
-        .filter(LetterTemplate.tenant_id == tenant_id, LetterTemplate.deleted_at.is_(None))
+        slug
+        for (slug,) in db.query(LetterTemplate.slug)
+        .filter(LetterTemplate.tenant_id.is_(None))
         .all()
     }
 
@@ -84,7 +89,7 @@ def seed_system_templates(db: Session, tenant_id: UUID) -> None:
             continue
 
         template = LetterTemplate(
-            tenant_id=tenant_id,
+            tenant_id=None,
             name=definition["name"],
             slug=slug,
             category=definition["category"],
@@ -102,5 +107,3 @@ def seed_system_templates(db: Session, tenant_id: UUID) -> None:
 
     if created:
         db.commit()
-
-
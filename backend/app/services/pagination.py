@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import base64
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Query, Session
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.expression import ClauseElement
+
+COUNT_CACHE_TTL = float(os.getenv('COUNT_CACHE_TTL', 60))
+COUNT_CACHE_SIZE = int(os.getenv('COUNT_CACHE_SIZE', 1024))
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """Serialise a keyset position into an opaque URL-safe token"""
+    raw = json.dumps(position, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Inverse of :func:`encode_cursor`; rejects tampered tokens with a 400"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(position, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+
+def keyset_page(query: Query, model, cursor: Optional[str], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """Return one newest-first page of ``query`` and the cursor for the next.
+
+    Pages on ``(created_at, id)`` of ``model``, so each page is an index range
+    scan however deep the caller has paged. The next cursor is None on the
+    last page.
+    """
+    position = decode_cursor(cursor)
+    if position:
+        try:
+            after_created = datetime.fromisoformat(position["created_at"])
+            after_id = uuid.UUID(position["id"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(or_(
+            model.created_at < after_created,
+            and_(model.created_at == after_created, model.id < after_id)
+        ))
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor({"created_at": last.created_at.isoformat(), "id": str(last.id)})
+
+
+class _Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def estimate_count(db: Session, query: Query) -> Optional[int]:
+    """The planner's row estimate for ``query`` on PostgreSQL, else None"""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    plan = db.execute(_Explain(query.order_by(None).statement)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class CountCache:
+    """Small TTL'd LRU of exact counts, keyed by table, tenant and filters."""
+
+    def __init__(self, ttl: float = COUNT_CACHE_TTL, max_entries: int = COUNT_CACHE_SIZE, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, count: int) -> None:
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, count)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+count_cache = CountCache()
+
+
+def total_count(db: Session, query: Query, cache_key: Hashable, exact: bool = False) -> Tuple[int, str]:
+    """Return ``(count, kind)`` for a filtered listing.
+
+    ``kind`` is ``"exact"`` (just counted), ``"cached"`` (an exact count at
+    most ``COUNT_CACHE_TTL`` seconds old) or ``"estimated"`` (the PostgreSQL
+    planner's estimate). Only ``exact=True`` always pays for a full count.
+    """
+    if not exact:
+        cached = count_cache.get(cache_key)
+        if cached is not None:
+            return cached, "cached"
+        estimate = estimate_count(db, query)
+        if estimate is not None:
+            return estimate, "estimated"
+    count = query.order_by(None).count()
+    count_cache.set(cache_key, count)
+    return count, "exact"
@@ -0,0 +1,284 @@
+"""Monthly range partitioning for the compliance log tables (PostgreSQL only).
+
+``audit_logs``, ``data_access_logs`` and ``compliance_events`` are partitioned
+by ``created_at`` into one partition per UTC month, named
+``<table>_yYYYYmMM``. Each table also has a ``<table>_default`` partition:
+
+* :func:`partition_table` turns an existing table into the default partition
+  of a new partitioned parent, so conversion copies nothing and old rows stay
+  readable immediately.
+* :func:`carve_month` moves one month out of the default partition into its
+  own partition. The backfill tooling runs it month by month, and
+  :func:`ensure_partitions` uses it to pre-create upcoming months.
+* :func:`drop_expired_partitions` applies retention by detaching and dropping
+  whole months instead of deleting rows.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ('audit_logs', 'data_access_logs', 'compliance_events')
+
+# Foreign keys re-declared on each partitioned parent (column, referenced table)
+_FOREIGN_KEYS = {
+    'audit_logs': (('tenant_id', 'tenants'), ('user_id', 'users')),
+    'data_access_logs': (('tenant_id', 'tenants'), ('user_id', 'users')),
+    'compliance_events': (('tenant_id', 'tenants'), ('client_id', 'clients'), ('user_id', 'users')),
+}
+
+# Secondary indexes re-declared on each partitioned parent (name suffix, columns).
+# ``created_at`` mirrors the model's ``index=True``; the parent index also
+# cascades to every partition attached later.
+_INDEXES = {
+    table: (('created_at', 'created_at'), ('tenant_created', 'tenant_id, created_at'))
+    for table in PARTITIONED_TABLES
+}
+
+COMPLIANCE_RETENTION_MONTHS = int(os.getenv('COMPLIANCE_RETENTION_MONTHS', 84))
+PARTITION_PREMAKE_MONTHS = int(os.getenv('PARTITION_PREMAKE_MONTHS', 3))
+
+
+def month_start(value: datetime | date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def partition_month(table: str, name: str) -> Optional[date]:
+    """Inverse of :func:`partition_name`; None for anything else"""
+    match = re.fullmatch(rf"{re.escape(table)}_y(\d{{4}})m(\d{{2}})", name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def expired_months(
+    table: str,
+    partition_names: Iterable[str],
+    now: datetime,
+    retention_months: int = COMPLIANCE_RETENTION_MONTHS
+) -> List[date]:
+    """Months whose partition lies entirely before the retention cutoff"""
+    cutoff = add_months(month_start(now), -retention_months)
+    months = (partition_month(table, name) for name in partition_names)
+    # A month's partition ends where the next month starts
+    return sorted(m for m in months if m is not None and add_months(m, 1) <= cutoff)
+
+
+def _bound(month: date) -> str:
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def _check_table(table: str) -> None:
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"{table} is not a partitioned compliance table")
+
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    return bool(conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+             "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"),
+        {'table': table},
+    ).scalar())
+
+
+def list_partitions(conn: Connection, table: str) -> List[str]:
+    return list(conn.execute(
+        text("SELECT child.relname FROM pg_inherits i "
+             "JOIN pg_class parent ON parent.oid = i.inhparent "
+             "JOIN pg_class child ON child.oid = i.inhrelid "
+             "WHERE parent.relname = :table AND pg_table_is_visible(parent.oid) "
+             "ORDER BY child.relname"),
+        {'table': table},
+    ).scalars())
+
+
+def partition_table(conn: Connection, table: str) -> None:
+    """Convert ``table`` into a partitioned table, keeping its rows in place.
+
+    The original table is renamed to ``<table>_default`` and attached as the
+    default partition. Partitioned tables need the partition key in every
+    unique constraint, so the parent's primary key is ``(id, created_at)``.
+    """
+    _check_table(table)
+    if is_partitioned(conn, table):
+        return
+    default = default_partition_name(table)
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {default}"))
+    # Free the model's index name for the parent; the renamed index is then
+    # attached to the parent's index instead of being built again
+    conn.execute(text(f"ALTER INDEX IF EXISTS ix_{table}_created_at RENAME TO ix_{default}_created_at"))
+    conn.execute(text(
+        f"CREATE TABLE {table} (LIKE {default} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        f"PARTITION BY RANGE (created_at)"
+    ))
+    conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+    conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)"))
+    for column, referenced in _FOREIGN_KEYS[table]:
+        conn.execute(text(
+            f"ALTER TABLE {table} ADD CONSTRAINT fk_{table}_{column} "
+            f"FOREIGN KEY ({column}) REFERENCES {referenced} (id)"
+        ))
+    for suffix, columns in _INDEXES[table]:
+        conn.execute(text(f"CREATE INDEX ix_{table}_{suffix} ON {table} ({columns})"))
+
+
+def unpartition_table(conn: Connection, table: str) -> None:
+    """Copy a partitioned table back into a plain table (downgrade path)"""
+    _check_table(table)
+    if not is_partitioned(conn, table):
+        return
+    plain = f"{table}_unpartitioned"
+    conn.execute(text(f"CREATE TABLE {plain} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(f"INSERT INTO {plain} SELECT * FROM {table}"))
+    conn.execute(text(f"DROP TABLE {table}"))
+    conn.execute(text(f"ALTER TABLE {plain} RENAME TO {table}"))
+    conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id)"))
+    for column, referenced in _FOREIGN_KEYS[table]:
+        conn.execute(text(
+            f"ALTER TABLE {table} ADD FOREIGN KEY ({column}) REFERENCES {referenced} (id)"
+        ))
+    conn.execute(text(f"CREATE INDEX ix_{table}_created_at ON {table} (created_at)"))
+
+
+def carve_month(conn: Connection, table: str, month: date) -> int:
+    """Give ``month`` its own partition, moving its rows out of the default.
+
+    Returns the number of rows moved. Attaching the filled table (rather than
+    creating the partition first) is what lets this work while the default
+    partition still holds rows for the month. Writes to the default partition
+    wait until the calling transaction commits, so no row committed
+    mid-carve is left behind or lost.
+
+    ATTACH takes an ACCESS EXCLUSIVE lock on the default partition, which
+    blocks its reads too until the transaction commits. Both tables carry a
+    validated CHECK matching their new bounds by then, so ATTACH scans
+    neither and only the catalog update happens under that lock.
+    """
+    _check_table(table)
+    name = partition_name(table, month)
+    if name in list_partitions(conn, table):
+        return 0
+    default = default_partition_name(table)
+    lower, upper = _bound(month), _bound(add_months(month, 1))
+    in_range = f"created_at >= {lower} AND created_at < {upper}"
+
+    excluded = f"{default}_not_y{month.year:04d}m{month.month:02d}"
+
+    # The partition's indexes are created by ATTACH, after the rows are loaded
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    # Blocks writes to the default (and other carves) but not reads, up to the ATTACH
+    conn.execute(text(f"LOCK TABLE {default} IN SHARE ROW EXCLUSIVE MODE"))
+    # One statement, so exactly the rows deleted are the rows copied
+    moved = conn.execute(text(
+        f"WITH moved AS (DELETE FROM {default} WHERE {in_range} RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    )).rowcount
+    # Matching CHECKs let ATTACH skip scanning the new partition and the
+    # default. NOT VALID then VALIDATE does the default's scan under the
+    # lock above rather than under ACCESS EXCLUSIVE.
+    conn.execute(text(f"ALTER TABLE {name} ADD CONSTRAINT {name}_range CHECK ({in_range})"))
+    conn.execute(text(f"ALTER TABLE {default} ADD CONSTRAINT {excluded} CHECK (NOT ({in_range})) NOT VALID"))
+    conn.execute(text(f"ALTER TABLE {default} VALIDATE CONSTRAINT {excluded}"))
+    conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ({lower}) TO ({upper})"))
+    # The partition bounds now enforce both
+    conn.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_range"))
+    conn.execute(text(f"ALTER TABLE {default} DROP CONSTRAINT {excluded}"))
+    return moved
+
+
+def default_partition_months(
+    conn: Connection,
+    table: str,
+    before: Optional[date] = None
+) -> List[date]:
+    """Months that still have rows in the default partition, oldest first.
+
+    With ``before``, only months starting before it are listed.
+    """
+    _check_table(table)
+    rows = conn.execute(text(
+        f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC') "
+        f"FROM {default_partition_name(table)} ORDER BY 1"
+    ))
+    months = [month_start(value) for (value,) in rows]
+    return [month for month in months if before is None or month < before]
+
+
+def _default_has_rows(conn: Connection, table: str, month: date) -> bool:
+    return bool(conn.execute(text(
+        f"SELECT 1 FROM {default_partition_name(table)} "
+        f"WHERE created_at >= {_bound(month)} AND created_at < {_bound(add_months(month, 1))} LIMIT 1"
+    )).scalar())
+
+
+def ensure_partitions(
+    conn: Connection,
+    table: str,
+    now: Optional[datetime] = None,
+    months_ahead: int = PARTITION_PREMAKE_MONTHS
+) -> List[str]:
+    """Create partitions for the current month and ``months_ahead`` after it.
+
+    A month whose rows are already arriving in the default partition is
+    left there until it has ended (the backfill then carves it), so live
+    writes are never held up behind a large move.
+    """
+    current = month_start(now or datetime.now(timezone.utc))
+    existing = set(list_partitions(conn, table))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if partition_name(table, month) not in existing:
+            if offset == 0 and _default_has_rows(conn, table, month):
+                logger.info("Leaving %s in the default partition until it ends", partition_name(table, month))
+                continue
+            carve_month(conn, table, month)
+            created.append(partition_name(table, month))
+    return created
+
+
+def drop_expired_partitions(
+    conn: Connection,
+    table: str,
+    now: Optional[datetime] = None,
+    retention_months: int = COMPLIANCE_RETENTION_MONTHS
+) -> List[str]:
+    """Detach and drop monthly partitions past retention.
+
+    An ``audit_logs`` partition is kept while any of its rows carries a
+    ``retention_date`` still in the future.
+    """
+    now = now or datetime.now(timezone.utc)
+    dropped = []
+    for month in expired_months(table, list_partitions(conn, table), now, retention_months):
+        name = partition_name(table, month)
+        if table == 'audit_logs' and conn.execute(
+            text(f"SELECT 1 FROM {name} WHERE retention_date > :now LIMIT 1"), {'now': now}
+        ).scalar():
+            logger.info("Keeping %s: rows are under an extended retention_date", name)
+            continue
+        conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.config import settings
+from app.services.storage import storage_service
+
+logger = logging.getLogger(__name__)
+
+PRESIGNED_URL_CACHE_SIZE = int(os.getenv('PRESIGNED_URL_CACHE_SIZE', 4096))
+# Reuse a URL only while more than this fraction of its lifetime remains, so
+# callers always get a link that is usable for a good while.
+PRESIGNED_URL_REUSE_MARGIN = float(os.getenv('PRESIGNED_URL_REUSE_MARGIN', 0.5))
+
+CacheKey = Tuple[str, str, int]
+
+
+class PresignedURLCache:
+    """Expiry-aware cache in front of ``storage_service.generate_presigned_url``.
+
+    Entries are keyed by (object key, method, requested lifetime) so a short-lived
+    share link never receives a longer-lived URL issued for a download. Lookups
+    go to an in-process LRU first and then to Redis when a client is configured;
+    Redis failures are counted and otherwise ignored.
+    """
+
+    def __init__(
+        self,
+        storage,
+        max_entries: int = PRESIGNED_URL_CACHE_SIZE,
+        reuse_margin: float = PRESIGNED_URL_REUSE_MARGIN,
+        redis_client=None,
+        clock=time.time
+    ):
+        self.storage = storage
+        self.max_entries = max_entries
+        self.reuse_margin = reuse_margin
+        self.redis_client = redis_client
+        self.clock = clock
+        self._entries: "OrderedDict[CacheKey, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'redis_errors': 0,
+        }
+
+    def _usable(self, expires_at: float, expiration: int) -> bool:
+        return expires_at - self.clock() > expiration * self.reuse_margin
+
+    @staticmethod
+    def _redis_key(key: CacheKey) -> str:
+        s3_key, method, expiration = key
+        return f"presigned:{method}:{expiration}:{s3_key}"
+
+    def _remember(self, key: CacheKey, url: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (url, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.metrics['evictions'] += 1
+
+    def _from_local(self, key: CacheKey) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not self._usable(entry[1], key[2]):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _from_redis(self, key: CacheKey) -> Optional[Tuple[str, float]]:
+        if self.redis_client is None:
+            return None
+        try:
+            raw = self.redis_client.get(self._redis_key(key))
+        except Exception as e:
+            self.metrics['redis_errors'] += 1
+            logger.warning(f"Presigned URL cache read failed: {str(e)}")
+            return None
+        if not raw:
+            return None
+        if isinstance(raw, bytes):
+            raw = raw.decode()
+        expires_at, _, url = raw.partition('|')
+        entry = (url, float(expires_at))
+        if not self._usable(entry[1], key[2]):
+            return None
+        return entry
+
+    def _store_redis(self, key: CacheKey, url: str, expires_at: float) -> None:
+        if self.redis_client is None:
+            return
+        # Expire the Redis copy when it stops being reusable.
+        ttl = int(expires_at - self.clock() - key[2] * self.reuse_margin)
+        if ttl <= 0:
+            return
+        try:
+            self.redis_client.setex(self._redis_key(key), ttl, f"{expires_at}|{url}")
+        except Exception as e:
+            self.metrics['redis_errors'] += 1
+            logger.warning(f"Presigned URL cache write failed: {str(e)}")
+
+    def get_url(
+        self,
+        s3_key: str,
+        expiration: int = 3600,
+        method: str = 'get_object'
+    ) -> Tuple[str, int]:
+        """Return a presigned URL and the seconds it remains valid"""
+        key = (s3_key, method, expiration)
+
+        entry = self._from_local(key)
+        if entry is not None:
+            self.metrics['local_hits'] += 1
+        else:
+            entry = self._from_redis(key)
+            if entry is not None:
+                self.metrics['redis_hits'] += 1
+                self._remember(key, *entry)
+
+        if entry is None:
+            self.metrics['misses'] += 1
+            expires_at = self.clock() + expiration
+            url = self.storage.generate_presigned_url(
+                s3_key=s3_key,
+                expiration=expiration,
+                method=method
+            )
+            entry = (url, expires_at)
+            self._remember(key, url, expires_at)
+            self._store_redis(key, url, expires_at)
+
+        url, expires_at = entry
+        return url, int(expires_at - self.clock())
+
+    def invalidate(self, s3_key: str) -> None:
+        """Forget every cached URL for an object, e.g. after it is deleted"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == s3_key]:
+                del self._entries[key]
+        # Redis copies expire on their own; a deleted object's URL just 404s.
+
+    def stats(self) -> dict:
+        lookups = self.metrics['local_hits'] + self.metrics['redis_hits'] + self.metrics['misses']
+        hits = self.metrics['local_hits'] + self.metrics['redis_hits']
+        return {
+            **self.metrics,
+            'entries': len(self._entries),
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _redis_client_from_env():
+    """Connect the optional Redis tier when PRESIGNED_URL_CACHE_REDIS is enabled"""
+    if os.getenv('PRESIGNED_URL_CACHE_REDIS', 'false').lower() not in ('1', 'true', 'yes'):
+        return None
+    try:
+        import redis
+    except ImportError:
+        logger.warning("PRESIGNED_URL_CACHE_REDIS is set but the redis package is not installed")
+        return None
+    return redis.Redis.from_url(settings.REDIS_URL, socket_timeout=0.05)
+
+
+# Global presigned URL cache in front of the configured storage backend
+presigned_url_cache = PresignedURLCache(storage_service, redis_client=_redis_client_from_env())
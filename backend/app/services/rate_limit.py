@@ -0,0 +1,242 @@
+"""Token-bucket rate limiting with per-tenant plan quotas.
+
+A bucket holds up to ``requests`` tokens and refills at ``requests / window``
+tokens per second, so a client may burst up to its whole allowance and is
+then held to the steady rate. Each request takes one token.
+
+:class:`RedisTokenBucket` keeps the buckets in Redis and updates them with a
+Lua script: one round trip per request, atomic across workers, and timed by
+the Redis clock so workers with skewed clocks agree. :class:`LocalTokenBucket`
+is the same algorithm in process memory, for single-node setups and as the
+fallback while Redis is unreachable (limits then apply per worker). Set
+``RATE_LIMIT_REDIS`` to keep :data:`rate_limiter`'s buckets in ``REDIS_URL``.
+
+Authenticated requests share a per-tenant bucket sized by the tenant's
+:class:`~app.models.subscription.PlanType`; see :data:`PLAN_RATE_LIMITS`.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from app.config import settings
+from app.models.subscription import PlanType
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', 60))
+RATE_LIMIT_PLAN_TTL = float(os.getenv('RATE_LIMIT_PLAN_TTL', 300))
+RATE_LIMIT_LOCAL_KEYS = int(os.getenv('RATE_LIMIT_LOCAL_KEYS', 100000))
+RATE_LIMIT_DEFAULT_PLAN = PlanType(os.getenv('RATE_LIMIT_DEFAULT_PLAN', PlanType.STARTER.value))
+
+# Requests per RATE_LIMIT_WINDOW for a tenant, by plan
+PLAN_RATE_LIMITS: Dict[PlanType, int] = {
+    PlanType.STARTER: int(os.getenv('RATE_LIMIT_STARTER', 300)),
+    PlanType.PROFESSIONAL: int(os.getenv('RATE_LIMIT_PROFESSIONAL', 1200)),
+    PlanType.ENTERPRISE: int(os.getenv('RATE_LIMIT_ENTERPRISE', 6000)),
+}
+
+
+# Health probes and metrics scrapes are never limited or counted
+RATE_LIMIT_EXEMPT_PATHS = frozenset((
+    '/api/v1/health',
+    '/api/v1/cache/metrics',
+    '/api/v1/storage/metrics',
+    '/api/v1/compliance/audit-writer/metrics',
+))
+
+
+class RateLimit(NamedTuple):
+    requests: int
+    window: float
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.window
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    # Seconds until the next token (when refused) or until the bucket is full
+    retry_after: float
+    reset_after: float
+
+
+def _decide(limit: RateLimit, allowed: bool, tokens: float) -> Decision:
+    missing = 0.0 if allowed else 1 - tokens
+    return Decision(
+        allowed=allowed,
+        limit=limit.requests,
+        remaining=max(0, int(tokens)),
+        retry_after=missing / limit.rate,
+        reset_after=(limit.requests - tokens) / limit.rate,
+    )
+
+
+class LocalTokenBucket:
+    """Token buckets in process memory, bounded to ``max_keys`` buckets"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_LOCAL_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: RateLimit) -> Decision:
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (float(limit.requests), now))
+            tokens = min(limit.requests, tokens + (now - updated) * limit.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            # The least recently used bucket goes first; a forgotten bucket
+            # just starts full again
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return _decide(limit, allowed, tokens)
+
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisTokenBucket:
+    """Token buckets in Redis, updated atomically in a single round trip"""
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._script = None
+
+    def hit(self, key: str, limit: RateLimit) -> Decision:
+        if self._script is None:
+            self._script = self.redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        allowed, tokens = self._script(keys=[key], args=[limit.requests, limit.rate])
+        return _decide(limit, bool(int(allowed)), float(tokens))
+
+
+class RateLimiter:
+    """Redis buckets when a client is configured, in-process buckets otherwise.
+
+    When Redis fails the request is counted against the in-process bucket
+    instead, so limiting degrades to per-worker rather than switching off.
+    """
+
+    def __init__(self, redis_client=None, local: Optional[LocalTokenBucket] = None):
+        self.redis = RedisTokenBucket(redis_client) if redis_client is not None else None
+        self.local = local or LocalTokenBucket()
+        self.metrics = {'redis_errors': 0, 'local_fallbacks': 0}
+
+    def hit(self, key: str, limit: RateLimit) -> Decision:
+        if self.redis is not None:
+            try:
+                return self.redis.hit(key, limit)
+            except Exception as e:
+                self.metrics['redis_errors'] += 1
+                self.metrics['local_fallbacks'] += 1
+                if self.metrics['redis_errors'] == 1 or self.metrics['redis_errors'] % 1000 == 0:
+                    logger.error(f"Rate limiting falls back to in-memory buckets: {str(e)}")
+        return self.local.hit(key, limit)
+
+
+def plan_rate_limit(plan: Optional[PlanType]) -> RateLimit:
+    return RateLimit(PLAN_RATE_LIMITS[plan or RATE_LIMIT_DEFAULT_PLAN], RATE_LIMIT_WINDOW)
+
+
+def active_plan(db, tenant_id: Any) -> Optional[PlanType]:
+    """Plan of the tenant's active subscription, if it has one"""
+    from app.models.subscription import Subscription, SubscriptionStatus
+
+    return db.query(Subscription.plan_type).filter(
+        Subscription.tenant_id == uuid.UUID(str(tenant_id)),
+        Subscription.is_active.is_(True),
+        Subscription.status.in_((
+            SubscriptionStatus.ACTIVE, SubscriptionStatus.TRIALING, SubscriptionStatus.PAST_DUE
+        )),
+    ).order_by(Subscription.created_at.desc()).limit(1).scalar()
+
+
+class PlanCache:
+    """Tenant id -> plan, looked up once per ``ttl`` seconds per tenant"""
+
+    def __init__(
+        self,
+        lookup: Optional[Callable[[str], Optional[PlanType]]] = None,
+        ttl: float = RATE_LIMIT_PLAN_TTL,
+        clock=time.monotonic
+    ):
+        self.lookup = lookup or self._lookup_in_db
+        self.ttl = ttl
+        self.clock = clock
+        self._plans: Dict[str, Tuple[Optional[PlanType], float]] = {}
+
+    def cached(self, tenant_id: str) -> Tuple[bool, Optional[PlanType]]:
+        entry = self._plans.get(tenant_id)
+        if entry is not None and entry[1] > self.clock():
+            return True, entry[0]
+        return False, None
+
+    def load(self, tenant_id: str) -> Optional[PlanType]:
+        """Look the plan up (blocking) and remember it"""
+        try:
+            plan = self.lookup(tenant_id)
+        except Exception as e:
+            logger.error(f"Could not load the plan of tenant {tenant_id}: {str(e)}")
+            plan = None
+        self._plans[tenant_id] = (plan, self.clock() + self.ttl)
+        return plan
+
+    @staticmethod
+    def _lookup_in_db(tenant_id: str) -> Optional[PlanType]:
+        from app.database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            return active_plan(db, tenant_id)
+        finally:
+            db.close()
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+def _redis_client_from_env():
+    """Connect to REDIS_URL when RATE_LIMIT_REDIS is enabled"""
+    if os.getenv('RATE_LIMIT_REDIS', 'false').lower() not in ('1', 'true', 'yes'):
+        return None
+    try:
+        import redis
+    except ImportError:
+        logger.warning("RATE_LIMIT_REDIS is set but the redis package is not installed")
+        return None
+    return redis.Redis.from_url(settings.REDIS_URL, socket_timeout=0.05)
+
+
+# Shared limiter of the application's RateLimitMiddleware
+rate_limiter = RateLimiter(_redis_client_from_env())
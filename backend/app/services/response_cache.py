@@ -0,0 +1,319 @@
+"""Two-tier GET response cache with version-tag invalidation.
+
+:class:`app.middleware.performance.CacheMiddleware` embeds a per-tenant,
+per-resource version in every cache key::
+
+    cache:<tenant>:<resource>:v<version>:<path>:<query>:<user>
+
+A write bumps the version with a single INCR, which makes every cached
+response for that tenant and resource unreachable at once; the orphaned
+entries simply age out through their TTL. The middleware bumps versions for
+successful writes under a cached prefix; code that changes these resources
+elsewhere (background jobs, other routers) calls :meth:`CacheVersions.bump`
+on :data:`cache_versions`.
+
+Responses are looked up in a per-worker LRU of raw bytes first and then in
+Redis, where they are stored as an HTTP-like blob (status line, headers,
+blank line, body) rather than JSON. A Redis hit is copied into the LRU.
+A worker reuses a version tag it read from Redis for
+``RESPONSE_CACHE_VERSION_TTL`` seconds (1 by default), which keeps the tag
+lookup off most requests. That is the staleness bound: a write is seen by the
+next read on the worker that handled it, and on every other worker within
+that many seconds. Set it to 0 to read the tag from Redis on every request.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))
+RESPONSE_CACHE_LOCAL_BYTES = int(os.getenv('RESPONSE_CACHE_LOCAL_BYTES', 32 * 1024 * 1024))
+RESPONSE_CACHE_LOCAL_TTL = float(os.getenv('RESPONSE_CACHE_LOCAL_TTL', 300))
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRY_BYTES', 1024 * 1024))
+RESPONSE_CACHE_VERSION_TTL = float(os.getenv('RESPONSE_CACHE_VERSION_TTL', 1))
+
+# Cached resource -> URL prefix of its router
+CACHE_RESOURCES: Dict[str, str] = {
+    'clients': '/api/v1/clients',
+    'tasks': '/api/v1/tasks',
+    'disputes': '/api/v1/disputes',
+    'stages': '/api/v1/stages',
+    'tags': '/api/v1/tags',
+}
+
+# Writes to a resource also stale these cached resources: client listings
+# filter on stages and tags
+RESOURCE_DEPENDENTS: Dict[str, Tuple[str, ...]] = {
+    'stages': ('clients',),
+    'tags': ('clients',),
+}
+
+# Per-entry bookkeeping counted against the LRU byte budget
+_ENTRY_OVERHEAD = 200
+
+
+def resource_for_path(path: str) -> Optional[str]:
+    """The cached resource a request path belongs to, if any"""
+    for resource, prefix in CACHE_RESOURCES.items():
+        if path == prefix or path.startswith(prefix + '/'):
+            return resource
+    return None
+
+
+def _decode(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+class CachedResponse(NamedTuple):
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(name) + len(value) for name, value in self.headers) + _ENTRY_OVERHEAD
+
+    def pack(self) -> bytes:
+        """``<status>\\r\\n<name>: <value>\\r\\n...\\r\\n<body>``"""
+        lines = [str(self.status).encode()]
+        lines += [name + b': ' + value for name, value in self.headers]
+        return b'\r\n'.join(lines) + b'\r\n\r\n' + self.body
+
+    @classmethod
+    def unpack(cls, raw: bytes) -> 'CachedResponse':
+        head, _, body = raw.partition(b'\r\n\r\n')
+        status, *lines = head.split(b'\r\n')
+        headers = [tuple(line.split(b': ', 1)) for line in lines]
+        return cls(int(status), headers, body)
+
+
+class CacheVersions:
+    """Per-tenant, per-resource version counters kept in Redis"""
+
+    def __init__(self, redis_client=None, reuse_seconds: float = 0.0, clock=time.monotonic):
+        self.redis_client = redis_client
+        self.reuse_seconds = reuse_seconds
+        self.clock = clock
+        self._seen: Dict[str, Tuple[str, float]] = {}
+
+    @staticmethod
+    def _key(tenant_id: Any, resource: str) -> str:
+        return f"cache_version:{tenant_id}:{resource}"
+
+    @staticmethod
+    def _fresh_version() -> int:
+        # Counters start from the clock rather than 0, so a tag that was
+        # evicted and recreated never reuses a version still baked into a
+        # live cache key
+        return time.time_ns() // 1000
+
+    def current(self, tenant_id: Any, resource: str) -> str:
+        """The version to embed in cache keys; raises on Redis errors"""
+        key = self._key(tenant_id, resource)
+        if self.reuse_seconds:
+            seen = self._seen.get(key)
+            if seen is not None and self.clock() - seen[1] < self.reuse_seconds:
+                return seen[0]
+        version = self.redis_client.get(key)
+        if version is None:
+            initial = self._fresh_version()
+            if self.redis_client.set(key, initial, nx=True):
+                version = initial
+            else:
+                version = self.redis_client.get(key)
+        version = _decode(version)
+        if self.reuse_seconds:
+            self._seen[key] = (version, self.clock())
+        return version
+
+    def bump(self, tenant_id: Any, *resources: str) -> None:
+        """Invalidate every cached response for these resources of a tenant"""
+        if self.redis_client is None:
+            return
+        for resource in self._with_dependents(resources):
+            key = self._key(tenant_id, resource)
+            self._seen.pop(key, None)
+            try:
+                if self.redis_client.incr(key) == 1:
+                    # The tag had gone missing; restart it from the clock
+                    self.redis_client.set(key, self._fresh_version())
+            except Exception as e:
+                logger.error(f"Cache invalidation failed for {key}: {str(e)}")
+
+    @staticmethod
+    def _with_dependents(resources: Iterable[str]) -> list:
+        ordered = []
+        for resource in resources:
+            for name in (resource, *RESOURCE_DEPENDENTS.get(resource, ())):
+                if name not in ordered:
+                    ordered.append(name)
+        return ordered
+
+
+class ResponseCache:
+    """Per-worker LRU of raw responses in front of Redis.
+
+    The LRU is bounded by ``max_bytes`` of bodies and headers, and entries
+    leave it after ``local_ttl`` seconds even if Redis would keep them
+    longer. Hits, misses and lookup time are counted per tier; Redis
+    failures are counted and otherwise treated as misses.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        ttl: int = RESPONSE_CACHE_TTL,
+        max_bytes: int = RESPONSE_CACHE_LOCAL_BYTES,
+        local_ttl: float = RESPONSE_CACHE_LOCAL_TTL,
+        max_entry_bytes: int = RESPONSE_CACHE_MAX_ENTRY_BYTES,
+        version_ttl: float = RESPONSE_CACHE_VERSION_TTL,
+        clock=time.monotonic
+    ):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.local_ttl = min(local_ttl, ttl)
+        self.max_entry_bytes = max_entry_bytes
+        self.clock = clock
+        self.versions = CacheVersions(redis_client, reuse_seconds=version_ttl)
+        self._entries: "OrderedDict[str, Tuple[CachedResponse, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.metrics = {
+            'local_hits': 0,
+            'local_lookups': 0,
+            'local_seconds': 0.0,
+            'redis_hits': 0,
+            'redis_lookups': 0,
+            'redis_seconds': 0.0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'redis_errors': 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        # Without Redis there is nowhere to share version tags, so a write on
+        # one worker could not invalidate another worker's entries
+        return self.redis_client is not None
+
+    def _remember(self, key: str, response: CachedResponse) -> None:
+        size = response.size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[0].size
+            self._entries[key] = (response, self.clock() + self.local_ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.metrics['evictions'] += 1
+
+    def _from_local(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= self.clock():
+                del self._entries[key]
+                self._bytes -= entry[0].size
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _from_redis(self, key: str) -> Optional[CachedResponse]:
+        try:
+            raw = self.redis_client.get(key)
+        except Exception as e:
+            self.metrics['redis_errors'] += 1
+            logger.error(f"Cache read error: {str(e)}")
+            return None
+        return CachedResponse.unpack(raw) if raw else None
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        started = time.perf_counter()
+        response = self._from_local(key)
+        local_done = time.perf_counter()
+        self.metrics['local_lookups'] += 1
+        self.metrics['local_seconds'] += local_done - started
+        if response is not None:
+            self.metrics['local_hits'] += 1
+            return response
+
+        response = self._from_redis(key)
+        self.metrics['redis_lookups'] += 1
+        self.metrics['redis_seconds'] += time.perf_counter() - local_done
+        if response is not None:
+            self.metrics['redis_hits'] += 1
+            self._remember(key, response)
+            return response
+        self.metrics['misses'] += 1
+        return None
+
+    def set(self, key: str, response: CachedResponse) -> None:
+        self.metrics['stores'] += 1
+        self._remember(key, response)
+        try:
+            self.redis_client.setex(key, self.ttl, response.pack())
+        except Exception as e:
+            self.metrics['redis_errors'] += 1
+            logger.error(f"Cache write error: {str(e)}")
+
+    def stats(self) -> dict:
+        metrics = self.metrics
+
+        def tier(hits: int, lookups: int, seconds: float) -> dict:
+            return {
+                'hits': hits,
+                'lookups': lookups,
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+                'mean_latency_us': round(seconds / lookups * 1e6, 1) if lookups else 0.0,
+            }
+
+        lookups = metrics['local_lookups']
+        hits = metrics['local_hits'] + metrics['redis_hits']
+        return {
+            'local': {
+                **tier(metrics['local_hits'], lookups, metrics['local_seconds']),
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'evictions': metrics['evictions'],
+            },
+            'redis': {
+                **tier(metrics['redis_hits'], metrics['redis_lookups'], metrics['redis_seconds']),
+                'errors': metrics['redis_errors'],
+            },
+            'misses': metrics['misses'],
+            'stores': metrics['stores'],
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _redis_client_from_env():
+    """Connect to REDIS_URL when RESPONSE_CACHE_REDIS is enabled"""
+    if os.getenv('RESPONSE_CACHE_REDIS', 'false').lower() not in ('1', 'true', 'yes'):
+        return None
+    try:
+        import redis
+    except ImportError:
+        logger.warning("RESPONSE_CACHE_REDIS is set but the redis package is not installed")
+        return None
+    return redis.Redis.from_url(settings.REDIS_URL, socket_timeout=0.05)
+
+
+# Shared response cache; its version tags are also used to invalidate from
+# outside the middleware
+response_cache = ResponseCache(_redis_client_from_env())
+cache_versions = response_cache.versions
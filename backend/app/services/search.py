@@ -0,0 +1,229 @@
+"""Full-text search over document text and generated letters.
+
+On PostgreSQL both tables carry a generated ``search_vector`` tsvector column
+with a GIN index (see the ``add_full_text_search`` migration), so matching,
+ranking (``ts_rank_cd``) and snippets (``ts_headline``) happen in the
+database. Other dialects, i.e. the SQLite test database, fall back to a
+term-matching scan with the same result shape and cursor semantics.
+
+Only the first ``SEARCH_TEXT_CHARS`` characters of a document's extracted
+text are indexed, keeping the vector under PostgreSQL's 1 MB tsvector limit;
+both paths match and build snippets from that same prefix.
+
+Results are ordered by (rank desc, kind, id) and paginated by keyset on that
+tuple; ranks are rounded to 6 places so cursor comparisons are exact.
+"""
+from __future__ import annotations
+
+import html
+import math
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_, func, or_, text
+from sqlalchemy.orm import Session
+
+from app.models.document import Document
+from app.models.generated_letter import GeneratedLetter
+from app.services.pagination import decode_cursor, encode_cursor
+
+SEARCH_KINDS = ("document", "letter")
+SEARCH_CONFIG = "english"
+# Must match the generated column in the add_full_text_search migration
+SEARCH_TEXT_CHARS = 100_000
+
+# Plain-text markers survive ts_headline; the snippet is HTML-escaped before
+# they are swapped for <mark> tags so stored text can never inject markup.
+_START, _STOP = "[[[", "]]]"
+_HEADLINE_OPTIONS = f"StartSel={_START}, StopSel={_STOP}, MaxFragments=2, MaxWords=25, MinWords=8"
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def _finish_snippet(snippet: Optional[str]) -> str:
+    escaped = html.escape(snippet or "")
+    return escaped.replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+def _page(rows: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor({"rank": last["rank"], "kind": last["kind"], "id": str(last["id"])})
+    return rows, next_cursor
+
+
+def search(
+    db: Session,
+    tenant_id: UUID,
+    query: str,
+    *,
+    kinds: Sequence[str] = SEARCH_KINDS,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Return one page of ranked hits plus the cursor for the next page"""
+    position = decode_cursor(cursor)
+    if db.get_bind().dialect.name == "postgresql":
+        rows = _search_postgres(db, tenant_id, query, kinds, limit + 1, position)
+    else:
+        rows = _search_fallback(db, tenant_id, query, kinds, limit + 1, position)
+    return _page(rows, limit)
+
+
+# PostgreSQL -----------------------------------------------------------------
+
+_SOURCES = {
+    "document": f"""
+        SELECT 'document' AS kind, d.id, d.original_filename AS title, d.client_id,
+               NULL::uuid AS case_id, d.created_at,
+               round(ts_rank_cd(d.search_vector, q)::numeric, 6) AS rank,
+               left(coalesce(d.extracted_text, ''), {SEARCH_TEXT_CHARS}) AS body
+        FROM documents AS d, websearch_to_tsquery(:config, :query) AS q
+        WHERE d.tenant_id = :tenant_id AND d.search_vector @@ q
+    """,
+    "letter": """
+        SELECT 'letter' AS kind, l.id, coalesce(l.subject, l.reference_code) AS title, l.client_id,
+               l.case_id, l.created_at,
+               round(ts_rank_cd(l.search_vector, q)::numeric, 6) AS rank,
+               l.body AS body
+        FROM generated_letters AS l, websearch_to_tsquery(:config, :query) AS q
+        WHERE l.tenant_id = :tenant_id AND l.deleted_at IS NULL AND l.search_vector @@ q
+    """,
+}
+
+
+def _search_postgres(
+    db: Session,
+    tenant_id: UUID,
+    query: str,
+    kinds: Sequence[str],
+    limit: int,
+    position: Optional[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    params: Dict[str, Any] = {
+        "config": SEARCH_CONFIG,
+        "query": query,
+        "tenant_id": tenant_id,
+        "limit": limit,
+        "headline": _HEADLINE_OPTIONS,
+    }
+    after = ""
+    if position:
+        after = (
+            "WHERE rank < :after_rank OR (rank = :after_rank AND "
+            "(kind, id::text) > (:after_kind, :after_id))"
+        )
+        params.update(
+            after_rank=position.get("rank"),
+            after_kind=position.get("kind"),
+            after_id=position.get("id"),
+        )
+
+    # Headlines are costly, so they are only built for the rows on this page.
+    statement = text(f"""
+        WITH hits AS ({' UNION ALL '.join(_SOURCES[kind] for kind in kinds)}),
+        page AS (
+            SELECT * FROM hits {after}
+            ORDER BY rank DESC, kind, id::text
+            LIMIT :limit
+        )
+        SELECT kind, id, title, client_id, case_id, created_at, rank,
+               ts_headline(:config, body, websearch_to_tsquery(:config, :query), :headline) AS snippet
+        FROM page
+        ORDER BY rank DESC, kind, id::text
+    """)
+    rows = db.execute(statement, params).mappings().all()
+    return [
+        {**row, "rank": float(row["rank"]), "snippet": _finish_snippet(row["snippet"])}
+        for row in rows
+    ]
+
+
+# Fallback -------------------------------------------------------------------
+
+def _terms(query: str) -> List[str]:
+    return [term.lower() for term in _TERM.findall(query)]
+
+
+def _score(body: str, terms: Iterable[str]) -> float:
+    lowered = body.lower()
+    hits = sum(lowered.count(term) for term in terms)
+    return round(hits / (1 + math.log1p(len(lowered))), 6)
+
+
+def _fallback_snippet(body: str, terms: Sequence[str], width: int = 160) -> str:
+    lowered = body.lower()
+    positions = [lowered.find(term) for term in terms if term in lowered]
+    start = max(min(positions) - width // 4, 0) if positions else 0
+    window = body[start:start + width]
+    marked = re.sub(
+        "(" + "|".join(re.escape(term) for term in terms) + ")",
+        lambda match: f"{_START}{match.group(0)}{_STOP}",
+        window,
+        flags=re.IGNORECASE,
+    ) if terms else window
+    return _finish_snippet(marked)
+
+
+def _search_fallback(
+    db: Session,
+    tenant_id: UUID,
+    query: str,
+    kinds: Sequence[str],
+    limit: int,
+    position: Optional[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    candidates: List[Dict[str, Any]] = []
+    if "document" in kinds:
+        body = func.substr(Document.extracted_text, 1, SEARCH_TEXT_CHARS).label("body")
+        rows = (
+            db.query(Document.id, Document.original_filename, Document.client_id, Document.created_at, body)
+            .filter(Document.tenant_id == tenant_id, and_(*(body.ilike(f"%{term}%") for term in terms)))
+            .all()
+        )
+        candidates.extend(
+            {"kind": "document", "id": row.id, "title": row.original_filename, "client_id": row.client_id,
+             "case_id": None, "created_at": row.created_at, "body": row.body or ""}
+            for row in rows
+        )
+    if "letter" in kinds:
+        body = GeneratedLetter.body
+        rows = (
+            db.query(
+                GeneratedLetter.id, GeneratedLetter.subject, GeneratedLetter.reference_code,
+                GeneratedLetter.client_id, GeneratedLetter.case_id, GeneratedLetter.created_at, body,
+            )
+            .filter(
+                GeneratedLetter.tenant_id == tenant_id,
+                GeneratedLetter.deleted_at.is_(None),
+                and_(*(or_(body.ilike(f"%{term}%"), GeneratedLetter.subject.ilike(f"%{term}%")) for term in terms)),
+            )
+            .all()
+        )
+        candidates.extend(
+            {"kind": "letter", "id": row.id, "title": row.subject or row.reference_code,
+             "client_id": row.client_id, "case_id": row.case_id, "created_at": row.created_at,
+             "body": f"{row.subject or ''}\n{row.body}"}
+            for row in rows
+        )
+
+    for hit in candidates:
+        hit["rank"] = _score(hit["body"], terms)
+    candidates.sort(key=lambda hit: (-hit["rank"], hit["kind"], str(hit["id"])))
+    if position:
+        after = (-float(position.get("rank", 0)), position.get("kind", ""), position.get("id", ""))
+        candidates = [
+            hit for hit in candidates
+            if (-hit["rank"], hit["kind"], str(hit["id"])) > after
+        ]
+
+    page = candidates[:limit]
+    for hit in page:
+        hit["snippet"] = _fallback_snippet(hit.pop("body"), terms)
+    return page
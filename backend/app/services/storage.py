@@ -1,11 +1,100 @@
 import boto3
+import hashlib
+import hmac
+import mmap
+import time
 import uuid
 import os
-from typing import Optional
+from typing import Iterator, Optional
 from botocore.exceptions import ClientError
 from fastapi import UploadFile, HTTPException
+from starlette.concurrency import run_in_threadpool
 import mimetypes
 from datetime import datetime, timezone
+from urllib.parse import quote, urlencode
+
+from app.config import settings
+from app.services.encryption import StreamEncryptor, encrypt_bytes
+
+# Uploads are streamed in parts of this size.
+UPLOAD_CHUNK_SIZE = int(os.getenv('STORAGE_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+# S3 requires every multipart part except the last to be at least this large.
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+# Leading bytes of the formats we accept, checked before trusting the client's
+# declared content type.
+_MAGIC_NUMBERS = (
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+)
+
+
+def sniff_mime_type(head: bytes) -> Optional[str]:
+    """Detect a MIME type from the first bytes of a file, if recognisable."""
+    for magic, mime_type in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    stripped = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if stripped.startswith((b'{', b'[')):
+        return 'application/json'
+    if stripped.startswith(b'<?xml'):
+        return 'application/xml'
+    return None
+
+
+def _build_key(
+    tenant_id: str,
+    document_type: str,
+    filename: str,
+    client_id: Optional[str] = None
+) -> str:
+    """Object key layout shared by every storage backend."""
+    key = f"tenants/{tenant_id}/{document_type}/"
+    if client_id:
+        key += f"clients/{client_id}/"
+    return key + filename
+
+
+def sign_url(resource: str, expires: int, method: str = 'get_object') -> str:
+    """HMAC signature for a URL granting ``method`` on ``resource`` until ``expires``"""
+    message = f"{method}:{resource}:{expires}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify_url_signature(resource: str, expires: int, signature: str, method: str = 'get_object') -> bool:
+    if expires < int(time.time()):
+        return False
+    return hmac.compare_digest(sign_url(resource, expires, method), signature)
+
+
+def _too_large(max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"File too large. Maximum size is {max_size // (1024 * 1024)}MB"
+    )
+
+
+async def digest_upload(file: UploadFile, max_size: Optional[int] = None) -> str:
+    """SHA-256 of an upload's content, rewinding it for the real upload.
+
+    Lets a caller look for a stored duplicate before sending anything to
+    storage. Raises 413 once the content passes ``max_size``.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise _too_large(max_size)
+        digest.update(chunk)
+    await file.seek(0)
+    return digest.hexdigest()
+
 
 class S3StorageService:
     def __init__(self):
@@ -23,57 +112,160 @@ class S3StorageService:
         file: UploadFile,
         tenant_id: str,
         document_type: str,
-        client_id: Optional[str] = None
+        client_id: Optional[str] = None,
+        max_size: Optional[int] = None,
+        encryption_key_id: Optional[str] = None
     ) -> dict:
-        """Upload file to S3 and return metadata"""
+        """Stream an upload to S3 and return metadata.
+
+        The file is read one chunk at a time: the size limit, SHA-256 digest and
+        MIME sniffing are all computed as chunks pass through, and anything
+        larger than one chunk goes up as a multipart upload. Peak memory is one
+        chunk regardless of file size. With ``encryption_key_id`` the object is
+        stored encrypted; the returned size and digest describe the plaintext.
+        """
         try:
             # Generate unique filename
             file_extension = os.path.splitext(file.filename)[1] if file.filename else ''
             unique_filename = f"{uuid.uuid4()}{file_extension}"
-            
+
             # Create S3 key with organized structure
-            s3_key = f"tenants/{tenant_id}/{document_type}/"
-            if client_id:
-                s3_key += f"clients/{client_id}/"
-            s3_key += unique_filename
-            
-            # Read file content
-            file_content = await file.read()
-            file_size = len(file_content)
-            
-            # Determine MIME type
-            mime_type = file.content_type or mimetypes.guess_type(file.filename)[0] or 'application/octet-stream'
-            
-            # Upload to S3
-            response = self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=s3_key,
-                Body=file_content,
-                ContentType=mime_type,
-                Metadata={
-                    'tenant_id': tenant_id,
-                    'document_type': document_type,
-                    'original_filename': file.filename or 'unknown',
-                    'uploaded_at': datetime.now(timezone.utc).isoformat()
-                }
+            s3_key = _build_key(tenant_id, document_type, unique_filename, client_id)
+
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if max_size is not None and len(chunk) > max_size:
+                raise _too_large(max_size)
+
+            # Determine MIME type, preferring what the content says it is
+            mime_type = (
+                sniff_mime_type(chunk)
+                or file.content_type
+                or mimetypes.guess_type(file.filename or '')[0]
+                or 'application/octet-stream'
             )
-            
+            metadata = {
+                'tenant_id': tenant_id,
+                'document_type': document_type,
+                'original_filename': file.filename or 'unknown',
+                'uploaded_at': datetime.now(timezone.utc).isoformat()
+            }
+
+            digest = hashlib.sha256(chunk)
+            file_size = len(chunk)
+
+            if len(chunk) < UPLOAD_CHUNK_SIZE:
+                # Small file: a single request is cheaper than a multipart upload
+                response = await run_in_threadpool(
+                    self.s3_client.put_object,
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    Body=encrypt_bytes(chunk, encryption_key_id) if encryption_key_id else chunk,
+                    ContentType=mime_type,
+                    Metadata={**metadata, 'sha256': digest.hexdigest()}
+                )
+                etag = response['ETag']
+            else:
+                etag, file_size = await self._multipart_upload(
+                    file, s3_key, chunk, mime_type, metadata, digest, max_size,
+                    StreamEncryptor(encryption_key_id) if encryption_key_id else None
+                )
+
             return {
                 'filename': unique_filename,
                 'original_filename': file.filename,
                 'file_size': file_size,
                 'mime_type': mime_type,
+                'content_sha256': digest.hexdigest(),
                 's3_bucket': self.bucket_name,
                 's3_key': s3_key,
-                's3_etag': response['ETag'].strip('"'),
+                's3_etag': etag.strip('"'),
                 's3_url': f"s3://{self.bucket_name}/{s3_key}"
             }
-            
+
+        except HTTPException:
+            raise
         except ClientError as e:
             raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Upload error: {str(e)}")
-    
+
+    async def _multipart_upload(
+        self,
+        file: UploadFile,
+        s3_key: str,
+        chunk: bytes,
+        mime_type: str,
+        metadata: dict,
+        digest,
+        max_size: Optional[int],
+        encryptor: Optional[StreamEncryptor] = None
+    ) -> tuple:
+        """Upload ``chunk`` and the rest of ``file`` as S3 multipart parts."""
+        upload = await run_in_threadpool(
+            self.s3_client.create_multipart_upload,
+            Bucket=self.bucket_name,
+            Key=s3_key,
+            ContentType=mime_type,
+            Metadata=metadata
+        )
+        upload_id = upload['UploadId']
+        parts = []
+        file_size = len(chunk)
+
+        async def upload_part(body: bytes) -> None:
+            part = await run_in_threadpool(
+                self.s3_client.upload_part,
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                PartNumber=len(parts) + 1,
+                Body=body
+            )
+            parts.append({'ETag': part['ETag'], 'PartNumber': len(parts) + 1})
+
+        # The encryptor holds back partial sealed chunks, so its output comes
+        # in uneven sizes; buffer it until a part is large enough for S3
+        pending = bytearray()
+        try:
+            while chunk:
+                body = encryptor.update(chunk) if encryptor else chunk
+                if not pending and len(body) >= S3_MIN_PART_SIZE:
+                    await upload_part(body)
+                else:
+                    pending += body
+                    if len(pending) >= S3_MIN_PART_SIZE:
+                        await upload_part(bytes(pending))
+                        pending.clear()
+
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if max_size is not None and file_size + len(chunk) > max_size:
+                    raise _too_large(max_size)
+                digest.update(chunk)
+                file_size += len(chunk)
+            if encryptor:
+                pending += encryptor.finalize()
+            if pending or not parts:
+                # Only the last part may be smaller than S3_MIN_PART_SIZE
+                await upload_part(bytes(pending))
+
+            response = await run_in_threadpool(
+                self.s3_client.complete_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            await run_in_threadpool(
+                self.s3_client.abort_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id
+            )
+            raise
+
+        return response['ETag'], file_size
+
     def upload_bytes(
         self,
         *,
@@ -84,6 +276,7 @@ class S3StorageService:
         client_id: Optional[str] = None,
         content_type: str | None = None,
         metadata: Optional[dict] = None,
+        encryption_key_id: Optional[str] = None,
     ) -> dict:
         """Upload raw bytes to S3 and return metadata"""
         try:
@@ -92,10 +285,7 @@ class S3StorageService:
                 file_extension = os.path.splitext(filename)[1]
             unique_filename = filename or f"{uuid.uuid4()}{file_extension}"
 
-            s3_key = f"tenants/{tenant_id}/{document_type}/"
-            if client_id:
-                s3_key += f"clients/{client_id}/"
-            s3_key += unique_filename
+            s3_key = _build_key(tenant_id, document_type, unique_filename, client_id)
 
             mime_type = content_type or (mimetypes.guess_type(filename)[0] if filename else None) or "application/pdf"
             metadata = metadata or {}
@@ -108,7 +298,7 @@ class S3StorageService:
             response = self.s3_client.put_object(
                 Bucket=self.bucket_name,
                 Key=s3_key,
-                Body=content,
+                Body=encrypt_bytes(content, encryption_key_id) if encryption_key_id else content,
                 ContentType=mime_type,
                 Metadata=metadata
             )
@@ -118,6 +308,7 @@ class S3StorageService:
                 'original_filename': filename or unique_filename,
                 'file_size': len(content),
                 'mime_type': mime_type,
+                'content_sha256': hashlib.sha256(content).hexdigest(),
                 's3_bucket': self.bucket_name,
                 's3_key': s3_key,
                 's3_etag': response['ETag'].strip('"'),
@@ -169,6 +360,18 @@ class S3StorageService:
         except ClientError as e:
             raise HTTPException(status_code=404, detail=f"File not found: {str(e)}")
     
+    def iter_file(self, s3_key: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield the object's content in chunks without buffering all of it"""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=s3_key)
+        except ClientError as e:
+            raise HTTPException(status_code=404, detail=f"File not found: {str(e)}")
+        body = response['Body']
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
     def list_files(self, prefix: str, max_keys: int = 1000) -> list:
         """List files with given prefix"""
         try:
@@ -192,7 +395,242 @@ class S3StorageService:
             raise HTTPException(status_code=500, detail=f"Failed to list files: {str(e)}")
 
 
+class LocalStorageService:
+    """Filesystem storage backend with the same interface as S3StorageService.
+
+    Objects live under ``LOCAL_STORAGE_ROOT`` using the S3 key layout. Reads are
+    memory-mapped, and downloads go through HMAC-signed URLs served by
+    ``app.routers.storage`` with a file response, which the ASGI server can
+    hand to ``sendfile``. Intended for on-prem, test and benchmark deployments
+    that should not need the network.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = os.path.realpath(root or os.getenv('LOCAL_STORAGE_ROOT', './storage'))
+        self.bucket_name = 'local'
+        self.url_prefix = os.getenv('LOCAL_STORAGE_URL_PREFIX', '/api/v1/storage/local').rstrip('/')
+        os.makedirs(self.root, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        """Resolve a key to a path, refusing anything outside the storage root"""
+        path = os.path.realpath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root or path == self.root:
+            raise HTTPException(status_code=400, detail="Invalid storage key")
+        return path
+
+    @staticmethod
+    def _etag(stat: os.stat_result) -> str:
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def _result(
+        self,
+        key: str,
+        unique_filename: str,
+        original_filename: Optional[str],
+        file_size: int,
+        mime_type: str,
+        digest: str
+    ) -> dict:
+        return {
+            'filename': unique_filename,
+            'original_filename': original_filename,
+            'file_size': file_size,
+            'mime_type': mime_type,
+            'content_sha256': digest,
+            's3_bucket': self.bucket_name,
+            's3_key': key,
+            's3_etag': self._etag(os.stat(self.path_for(key))),
+            's3_url': f"file://{self.path_for(key)}"
+        }
+
+    async def upload_file(
+        self,
+        file: UploadFile,
+        tenant_id: str,
+        document_type: str,
+        client_id: Optional[str] = None,
+        max_size: Optional[int] = None,
+        encryption_key_id: Optional[str] = None
+    ) -> dict:
+        """Stream an upload to disk, one chunk in memory at a time"""
+        file_extension = os.path.splitext(file.filename)[1] if file.filename else ''
+        unique_filename = f"{uuid.uuid4()}{file_extension}"
+        key = _build_key(tenant_id, document_type, unique_filename, client_id)
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        partial = f"{path}.part"
+        digest = hashlib.sha256()
+        file_size = 0
+        mime_type = None
+        encryptor = StreamEncryptor(encryption_key_id) if encryption_key_id else None
+        try:
+            with open(partial, 'wb') as fh:
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                    if mime_type is None:
+                        mime_type = (
+                            sniff_mime_type(chunk)
+                            or file.content_type
+                            or mimetypes.guess_type(file.filename or '')[0]
+                            or 'application/octet-stream'
+                        )
+                    if not chunk:
+                        break
+                    file_size += len(chunk)
+                    if max_size is not None and file_size > max_size:
+                        raise _too_large(max_size)
+                    digest.update(chunk)
+                    await run_in_threadpool(fh.write, encryptor.update(chunk) if encryptor else chunk)
+                if encryptor:
+                    fh.write(encryptor.finalize())
+            os.replace(partial, path)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Upload error: {str(e)}")
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+        return self._result(key, unique_filename, file.filename, file_size, mime_type, digest.hexdigest())
+
+    def upload_bytes(
+        self,
+        *,
+        content: bytes,
+        tenant_id: str,
+        document_type: str,
+        filename: str | None = None,
+        client_id: Optional[str] = None,
+        content_type: str | None = None,
+        metadata: Optional[dict] = None,
+        encryption_key_id: Optional[str] = None,
+    ) -> dict:
+        """Write raw bytes to disk and return metadata"""
+        unique_filename = filename or f"{uuid.uuid4()}"
+        key = _build_key(tenant_id, document_type, unique_filename, client_id)
+        path = self.path_for(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f"{path}.part"
+            with open(partial, 'wb') as fh:
+                fh.write(encrypt_bytes(content, encryption_key_id) if encryption_key_id else content)
+            os.replace(partial, path)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Upload error: {str(e)}")
+
+        mime_type = content_type or (mimetypes.guess_type(filename)[0] if filename else None) or "application/pdf"
+        return self._result(
+            key, unique_filename, filename or unique_filename, len(content),
+            mime_type, hashlib.sha256(content).hexdigest()
+        )
+
+    def sign(self, key: str, expires: int, method: str = 'get_object') -> str:
+        return sign_url(key, expires, method)
+
+    def verify_signature(self, key: str, expires: int, signature: str, method: str = 'get_object') -> bool:
+        return verify_url_signature(key, expires, signature, method)
+
+    def generate_presigned_url(
+        self,
+        s3_key: str,
+        expiration: int = 3600,
+        method: str = 'get_object'
+    ) -> str:
+        """Generate a signed URL served by the local storage router"""
+        expires = int(time.time()) + expiration
+        query = urlencode({
+            'expires': expires,
+            'method': method,
+            'signature': self.sign(s3_key, expires, method)
+        })
+        return f"{self.url_prefix}/{quote(s3_key)}?{query}"
+
+    def delete_file(self, s3_key: str) -> bool:
+        """Delete file from disk; a missing file counts as deleted, as on S3"""
+        try:
+            os.remove(self.path_for(s3_key))
+            return True
+        except FileNotFoundError:
+            return True
+        except OSError as e:
+            print(f"Failed to delete file {s3_key}: {str(e)}")
+            return False
+
+    def get_file_metadata(self, s3_key: str) -> dict:
+        """Get file metadata from the filesystem"""
+        try:
+            stat = os.stat(self.path_for(s3_key))
+        except OSError as e:
+            raise HTTPException(status_code=404, detail=f"File not found: {str(e)}")
+        return {
+            'content_length': stat.st_size,
+            'content_type': mimetypes.guess_type(s3_key)[0] or 'application/octet-stream',
+            'last_modified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            'etag': self._etag(stat),
+            'metadata': {}
+        }
+
+    def iter_file(self, s3_key: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield the file in chunks sliced straight from a memory map"""
+        path = self.path_for(s3_key)
+        try:
+            fh = open(path, 'rb')
+        except OSError as e:
+            raise HTTPException(status_code=404, detail=f"File not found: {str(e)}")
+        with fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                return
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for offset in range(0, len(mapped), chunk_size):
+                    yield mapped[offset:offset + chunk_size]
+
+    def list_files(self, prefix: str, max_keys: int = 1000) -> list:
+        """List files with given prefix"""
+        # Only the prefix's directory can hold matches, so the walk starts
+        # there instead of at the root of every tenant's files
+        top = os.path.realpath(os.path.join(self.root, prefix.rpartition('/')[0]))
+        if os.path.commonpath([self.root, top]) != self.root:
+            return []
+        files = []
+        for dirpath, dirnames, filenames in os.walk(top):
+            base = os.path.relpath(dirpath, self.root).replace(os.sep, '/')
+            base = '' if base == '.' else base + '/'
+            dirnames[:] = sorted(
+                name for name in dirnames
+                if (base + name).startswith(prefix) or prefix.startswith(base + name + '/')
+            )
+            for name in sorted(filenames):
+                if name.endswith('.part'):
+                    continue
+                path = os.path.join(dirpath, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if not key.startswith(prefix):
+                    continue
+                stat = os.stat(path)
+                files.append({
+                    'key': key,
+                    'size': stat.st_size,
+                    'last_modified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+                    'etag': self._etag(stat)
+                })
+                if len(files) >= max_keys:
+                    return files
+        return files
+
+
+def create_storage_service():
+    """Build the storage backend selected by ``STORAGE_BACKEND`` (s3 or local)"""
+    backend = os.getenv('STORAGE_BACKEND', 's3').lower()
+    if backend == 'local':
+        return LocalStorageService()
+    if backend == 's3':
+        return S3StorageService()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
 # Global storage service instance
-storage_service = S3StorageService()
+storage_service = create_storage_service()
 
 
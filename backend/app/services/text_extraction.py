@@ -0,0 +1,109 @@
+"""Pure-Python text extraction for stored PDFs and plain-text uploads.
+
+Runs inside document pipeline worker processes. PDFs are read page by page
+with ``pypdf`` and extraction stops at the page, time or character budget,
+whichever comes first; the result records which budget cut it short.
+"""
+from __future__ import annotations
+
+import codecs
+import io
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from app.services import storage
+from app.services.encryption import iter_plaintext
+
+EXTRACTION_MAX_PAGES = int(os.getenv('EXTRACTION_MAX_PAGES', 200))
+EXTRACTION_TIME_BUDGET = float(os.getenv('EXTRACTION_TIME_BUDGET', 30))
+EXTRACTION_MAX_CHARS = int(os.getenv('EXTRACTION_MAX_CHARS', 1_000_000))
+
+PDF_MIME_TYPES = ('application/pdf',)
+TEXT_MIME_TYPES = ('text/plain',)
+EXTRACTABLE_MIME_TYPES = PDF_MIME_TYPES + TEXT_MIME_TYPES
+
+
+class _Budget:
+    def __init__(self, max_pages: int, seconds: float, max_chars: int):
+        self.max_pages = max_pages
+        self.deadline = time.monotonic() + seconds
+        self.max_chars = max_chars
+        self.chars = 0
+        self.exceeded: Optional[str] = None
+
+    def take(self, text: str) -> str:
+        """Account for ``text``, trimming it to the character budget"""
+        remaining = self.max_chars - self.chars
+        if len(text) > remaining:
+            text = text[:remaining]
+            self.exceeded = 'chars'
+        self.chars += len(text)
+        return text
+
+    def page_allowed(self, page_number: int) -> bool:
+        if self.exceeded:
+            return False
+        if page_number >= self.max_pages:
+            self.exceeded = 'pages'
+        elif time.monotonic() > self.deadline:
+            self.exceeded = 'time'
+        return self.exceeded is None
+
+
+def _extract_pdf(s3_key: str, key_id: Optional[str], budget: _Budget) -> Dict[str, Any]:
+    from pypdf import PdfReader
+
+    # pypdf needs a seekable stream; uploads are capped at 10MB.
+    data = io.BytesIO()
+    for chunk in iter_plaintext(storage.storage_service, s3_key, key_id):
+        data.write(chunk)
+    reader = PdfReader(data)
+
+    parts: List[str] = []
+    pages_read = 0
+    for page_number, page in enumerate(reader.pages):
+        if not budget.page_allowed(page_number):
+            break
+        parts.append(budget.take(page.extract_text() or ''))
+        pages_read += 1
+    return {'text': '\n\f\n'.join(parts), 'pages': pages_read, 'total_pages': len(reader.pages)}
+
+
+def _extract_text(s3_key: str, key_id: Optional[str], budget: _Budget) -> Dict[str, Any]:
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    parts: List[str] = []
+    for chunk in iter_plaintext(storage.storage_service, s3_key, key_id):
+        parts.append(budget.take(decoder.decode(bytes(chunk))))
+        if budget.exceeded:
+            break
+        if time.monotonic() > budget.deadline:
+            budget.exceeded = 'time'
+            break
+    else:
+        parts.append(budget.take(decoder.decode(b'', final=True)))
+    return {'text': ''.join(parts).lstrip('\ufeff'), 'pages': None, 'total_pages': None}
+
+
+def extract_document_text(
+    s3_key: str,
+    mime_type: Optional[str],
+    max_pages: int = EXTRACTION_MAX_PAGES,
+    time_budget: float = EXTRACTION_TIME_BUDGET,
+    max_chars: int = EXTRACTION_MAX_CHARS,
+    encryption_key_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Extract text from a stored object within the given budgets"""
+    budget = _Budget(max_pages, time_budget, max_chars)
+    started = time.perf_counter()
+    if mime_type in PDF_MIME_TYPES:
+        result = _extract_pdf(s3_key, encryption_key_id, budget)
+    elif mime_type in TEXT_MIME_TYPES:
+        result = _extract_text(s3_key, encryption_key_id, budget)
+    else:
+        raise ValueError(f"Text extraction does not support {mime_type}")
+    # Postgres text columns reject NUL bytes.
+    result['text'] = result['text'].replace('\x00', '')
+    result['budget_exceeded'] = budget.exceeded
+    result['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
@@ -1,6 +1,7 @@
 import os
 import sys
 from pathlib import Path
+import tempfile
 import types
 
 ROOT = Path(__file__).resolve().parent
@@ -10,6 +11,8 @@ if str(APP_DIR) not in sys.path:
 
 os.environ.setdefault('DATABASE_URL', 'sqlite:///./test_app.db')
 os.environ.setdefault('REDIS_URL', 'redis://localhost:6379')
+# The app mounts AuditMiddleware; keep its spill file out of the source tree
+os.environ.setdefault('AUDIT_SPILL_PATH', os.path.join(tempfile.gettempdir(), 'credkit-test-audit-spill.jsonl'))
 
 # Stub external services to avoid optional dependencies during tests
 
@@ -17,6 +20,18 @@ class _DummyS3Client:
     def put_object(self, **kwargs):
         return {'ETag': '"dummy"'}
 
+    def create_multipart_upload(self, **kwargs):
+        return {'UploadId': 'dummy-upload'}
+
+    def upload_part(self, **kwargs):
+        return {'ETag': f'"part-{kwargs.get("PartNumber")}"'}
+
+    def complete_multipart_upload(self, **kwargs):
+        return {'ETag': '"dummy-multipart"'}
+
+    def abort_multipart_upload(self, **kwargs):
+        return None
+
     def generate_presigned_url(self, method, Params=None, ExpiresIn=None):
         key = Params.get('Key') if Params else 'object'
         return f'https://example.com/{key}'
@@ -0,0 +1,96 @@
+"""Measure AuditMiddleware's per-request overhead without a server or database.
+
+Requests are driven straight through the ASGI interface, with and without the
+middleware, and audit events go to a writer that discards them.
+
+Usage: python -m scripts.bench_audit_middleware [--requests 20000] [--body-kb 256]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+from app.middleware.audit import AuditMiddleware
+
+
+class _NullWriter:
+    def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def submit(self, event) -> None:
+        pass
+
+
+def _endpoint(body_kb: int, chunks: int):
+    piece = b"x" * (body_kb * 1024 // chunks)
+
+    async def app(scope, receive, send):
+        while (await receive()).get("more_body"):
+            pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        for index in range(chunks):
+            await send({"type": "http.response.body", "body": piece, "more_body": index < chunks - 1})
+
+    return app
+
+
+def _scope(body_size: int) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/api/v1/documents/upload",
+        "raw_path": b"/api/v1/documents/upload",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-length", str(body_size).encode()), (b"user-agent", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+    }
+
+
+async def _drive(app, requests: int, body: bytes) -> float:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(_scope(len(body)), receive, send)
+    return time.perf_counter() - started
+
+
+def run(requests: int, body_kb: int, chunks: int) -> None:
+    body = b"y" * (body_kb * 1024)
+    endpoint = _endpoint(body_kb, chunks)
+    audited = AuditMiddleware(endpoint, writer=_NullWriter())
+
+    bare = asyncio.run(_drive(endpoint, requests, body))
+    wrapped = asyncio.run(_drive(audited, requests, body))
+    overhead_us = (wrapped - bare) / requests * 1e6
+
+    print(f"requests: {requests}, {body_kb} KiB request and response ({chunks} chunks)")
+    print(f"bare app:          {bare / requests * 1e6:8.1f} us/request")
+    print(f"with audit:        {wrapped / requests * 1e6:8.1f} us/request")
+    print(f"audit overhead:    {overhead_us:8.1f} us/request")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--body-kb", type=int, default=256)
+    parser.add_argument("--chunks", type=int, default=16)
+    args = parser.parse_args()
+    run(args.requests, args.body_kb, args.chunks)
+
+
+if __name__ == "__main__":
+    main()
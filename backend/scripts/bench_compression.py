@@ -0,0 +1,160 @@
+"""Compare response compression settings on client and task list payloads.
+
+For each payload, every gzip level and brotli quality is timed and the CPU
+cost is set against the transfer time it saves on a few link speeds. A
+positive "net" means the client gets the response sooner with compression.
+The last section drives the payloads through CompressionMiddleware over
+ASGI, streamed in chunks the way large list responses are sent.
+
+Usage: python -m scripts.bench_compression [--rows 50 500] [--repeat 20]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+import zlib
+from datetime import date, datetime, timedelta, timezone
+
+from app.middleware.performance import CompressionMiddleware, brotli
+
+FIRST_NAMES = ["James", "Maria", "Robert", "Linda", "Michael", "Patricia", "David", "Jennifer", "Carlos", "Aisha"]
+LAST_NAMES = ["Smith", "Johnson", "Garcia", "Brown", "Davis", "Martinez", "Lopez", "Wilson", "Nguyen", "Patel"]
+TASK_TITLES = [
+    "Review credit report", "Send dispute letter", "Follow up with bureau",
+    "Collect ID documents", "Call client about results", "Upload proof of address",
+]
+
+# Link speeds in megabits per second
+LINKS = {"3G (1.5 Mbit/s)": 1.5, "DSL (10 Mbit/s)": 10, "fibre (100 Mbit/s)": 100}
+
+
+def client_list(rows: int) -> bytes:
+    tenant_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    return json.dumps([
+        {
+            "first_name": (first := random.choice(FIRST_NAMES)),
+            "last_name": (last := random.choice(LAST_NAMES)),
+            "email": f"{first.lower()}.{last.lower()}{random.randint(1, 999)}@example.com",
+            "phone": f"+1555{random.randint(1000000, 9999999)}",
+            "id": str(uuid.uuid4()),
+            "tenant_id": tenant_id,
+            "created_at": (now - timedelta(minutes=random.randint(0, 10 ** 6))).isoformat(),
+        }
+        for _ in range(rows)
+    ]).encode()
+
+
+def task_list(rows: int) -> bytes:
+    tenant_id, user_id = str(uuid.uuid4()), str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    return json.dumps([
+        {
+            "title": random.choice(TASK_TITLES),
+            "description": " ".join(random.choices(TASK_TITLES, k=3)).lower(),
+            "priority": random.choice(["low", "medium", "high", "urgent"]),
+            "status": random.choice(["todo", "in_progress", "done"]),
+            "due_date": (date.today() + timedelta(days=random.randint(0, 60))).isoformat(),
+            "client_id": str(uuid.uuid4()),
+            "assigned_to": user_id,
+            "id": str(uuid.uuid4()),
+            "tenant_id": tenant_id,
+            "created_by": user_id,
+            "created_at": (now - timedelta(days=random.randint(0, 90))).isoformat(),
+            "updated_at": now.isoformat(),
+        }
+        for _ in range(rows)
+    ]).encode()
+
+
+def _codecs():
+    codecs = [(f"gzip-{level}", lambda data, level=level: _gzip(data, level)) for level in (1, 3, 5, 6, 9)]
+    if brotli is not None:
+        codecs += [
+            (f"br-{quality}", lambda data, quality=quality: brotli.compress(data, quality=quality, mode=brotli.MODE_TEXT))
+            for quality in (1, 3, 4, 5, 6, 9, 11)
+        ]
+    return codecs
+
+
+def _gzip(data: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _timed(compress, data: bytes, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = compress(data)
+        best = min(best, time.perf_counter() - started)
+    return output, best
+
+
+def compare_codecs(name: str, data: bytes, repeat: int) -> None:
+    print(f"\n{name}: {len(data)} bytes")
+    print(f"  {'codec':8} {'ratio':>6} {'cpu ms':>7}  " + "  ".join(f"{link:>20}" for link in LINKS))
+    for label, compress in _codecs():
+        output, seconds = _timed(compress, data, repeat)
+        nets = []
+        for mbit in LINKS.values():
+            saved = (len(data) - len(output)) * 8 / (mbit * 1e6)
+            nets.append(f"net {(saved - seconds) * 1e3:+9.2f} ms")
+        print(f"  {label:8} {len(data) / len(output):6.2f} {seconds * 1e3:7.3f}  "
+              + "  ".join(f"{net:>20}" for net in nets))
+
+
+async def _drive(app, data: bytes, accept: bytes, chunk_size: int, requests: int) -> tuple:
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    async def endpoint(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        for index, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": index < len(chunks) - 1})
+
+    sent = 0
+
+    async def send(message):
+        nonlocal sent
+        sent += len(message.get("body", b""))
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    scope = {"type": "http", "method": "GET", "path": "/api/v1/clients/", "query_string": b"",
+             "headers": [(b"accept-encoding", accept)]}
+    wrapped = app(endpoint)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await wrapped(dict(scope), receive, send)
+    return (time.perf_counter() - started) / requests, sent // requests
+
+
+def middleware_stream(name: str, data: bytes, requests: int, chunk_size: int) -> None:
+    print(f"\n{name} through CompressionMiddleware, streamed in {chunk_size} byte chunks")
+    for accept in (b"identity", b"gzip", b"gzip, deflate, br"):
+        seconds, sent = asyncio.run(_drive(CompressionMiddleware, data, accept, chunk_size, requests))
+        print(f"  Accept-Encoding: {accept.decode():18} {seconds * 1e6:9.1f} us/request, {sent} bytes sent")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--chunk-size", type=int, default=16384)
+    args = parser.parse_args()
+    random.seed(7)
+    for rows in args.rows:
+        for name, payload in (("client list", client_list(rows)), ("task list", task_list(rows))):
+            compare_codecs(f"{name}, {rows} rows", payload, args.repeat)
+    for rows in args.rows:
+        middleware_stream(f"client list, {rows} rows", client_list(rows), args.repeat * 10, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Measure the per-request overhead of the full app.middleware stack.
+
+Requests are driven straight through the ASGI interface, once against the
+bare endpoint and once through every middleware in ``app.middleware.performance``
+and ``app.middleware.security``. Cache state lives in an in-process dict
+standing in for Redis, rate limits use the in-process token buckets, and the
+request path is one the cache does not store, so each request walks every
+layer.
+
+Usage: python -m scripts.bench_middleware_stack [--requests 5000] [--body-bytes 512]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import time
+
+from app.middleware.performance import (
+    CacheMiddleware,
+    CompressionMiddleware,
+    PerformanceMiddleware,
+    RateLimitMiddleware,
+)
+from app.middleware.security import (
+    DatabaseConnectionPoolMiddleware,
+    InputValidationMiddleware,
+    IPWhitelistMiddleware,
+    RequestSizeMiddleware,
+    SecurityHeadersMiddleware,
+    WebhookSecurityMiddleware,
+)
+
+
+class _DictRedis:
+    """Just enough of the redis client API for the cache"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+def _endpoint(body_bytes: int, chunks: int):
+    piece = b"x" * (body_bytes // chunks)
+
+    async def app(scope, receive, send):
+        while (await receive()).get("more_body"):
+            pass
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        for index in range(chunks):
+            await send({"type": "http.response.body", "body": piece, "more_body": index < chunks - 1})
+
+    return app
+
+
+def build_stack(app, redis_client=None):
+    """Wrap ``app`` in every middleware, innermost first as listed.
+
+    Compression sits outside the cache, which stores identity bodies and so
+    serves every Accept-Encoding from one entry.
+    """
+    redis_client = redis_client or _DictRedis()
+    app = CacheMiddleware(app, redis_client=redis_client)
+    app = CompressionMiddleware(app)
+    app = DatabaseConnectionPoolMiddleware(app)
+    app = PerformanceMiddleware(app)
+    app = SecurityHeadersMiddleware(app)
+    limiter = app = RateLimitMiddleware(app)
+    limiter.rate_limits["default"] = {"requests": 10 ** 9, "window": 60}
+    app = WebhookSecurityMiddleware(app)
+    app = InputValidationMiddleware(app)
+    app = IPWhitelistMiddleware(app)
+    app = RequestSizeMiddleware(app)
+    return app
+
+
+def _scope() -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/v1/documents/recent",
+        "raw_path": b"/api/v1/documents/recent",
+        "query_string": b"page=2&page_size=50&sort=created_at",
+        "root_path": "",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"accept", b"application/json"),
+            (b"accept-encoding", b"gzip"),
+            (b"user-agent", b"bench"),
+        ],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+        "state": {},
+    }
+
+
+async def _drive(app, requests: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(_scope(), receive, send)
+    return time.perf_counter() - started
+
+
+def run(requests: int, body_bytes: int, chunks: int) -> None:
+    logging.disable(logging.WARNING)
+    endpoint = _endpoint(body_bytes, chunks)
+    stack = build_stack(endpoint)
+
+    bare = asyncio.run(_drive(endpoint, requests))
+    wrapped = asyncio.run(_drive(stack, requests))
+    overhead_us = (wrapped - bare) / requests * 1e6
+
+    print(f"requests: {requests}, {body_bytes} byte response ({chunks} chunks)")
+    print(f"bare app:          {bare / requests * 1e6:8.1f} us/request")
+    print(f"full stack:        {wrapped / requests * 1e6:8.1f} us/request")
+    print(f"stack overhead:    {overhead_us:8.1f} us/request")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--body-bytes", type=int, default=512)
+    parser.add_argument("--chunks", type=int, default=1)
+    args = parser.parse_args()
+    run(args.requests, args.body_bytes, args.chunks)
+
+
+if __name__ == "__main__":
+    main()
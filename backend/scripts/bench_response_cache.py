@@ -0,0 +1,143 @@
+"""Measure CacheMiddleware hit ratios and latency per tier.
+
+Authenticated GETs for ``--keys`` distinct listings are driven straight
+through the ASGI interface, with only the Redis tier (local LRU budget of
+zero), with the per-worker LRU in front, and with the LRU plus version tags
+reused for a second (``RESPONSE_CACHE_VERSION_TTL``). Redis is an in-process
+dict that sleeps ``--redis-rtt-us`` per call to stand in for the network
+round trip.
+
+Usage: python -m scripts.bench_response_cache [--requests 5000] [--keys 200] [--redis-rtt-us 200]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+
+from app import crud  # noqa: F401  (import order: app.security needs crud first)
+from app.middleware.performance import CacheMiddleware
+from app.security import create_access_token
+from app.services.response_cache import ResponseCache
+
+
+class _SlowDictRedis:
+    """Just enough of the redis client API, with a fixed delay per call"""
+
+    def __init__(self, rtt_us: int):
+        self.rtt = rtt_us / 1e6
+        self.data = {}
+
+    def _wait(self):
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    def get(self, key):
+        self._wait()
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False):
+        self._wait()
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def setex(self, key, ttl, value):
+        self._wait()
+        self.data[key] = value
+
+    def incr(self, key):
+        self._wait()
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+def _endpoint(body_bytes: int):
+    body = json.dumps([{"name": "x" * 40}] * (body_bytes // 50)).encode()
+
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+def _scope(token: str, page: int) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/v1/clients/",
+        "raw_path": b"/api/v1/clients/",
+        "query_string": f"offset={page * 50}&limit=50".encode(),
+        "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+    }
+
+
+async def _drive(app, token: str, pages: list) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for page in pages:
+        await app(_scope(token, page), receive, send)
+    return time.perf_counter() - started
+
+
+def _report(label: str, elapsed: float, requests: int, stats: dict) -> None:
+    local, redis = stats["local"], stats["redis"]
+    print(f"{label}: {elapsed / requests * 1e6:8.1f} us/request, overall hit ratio {stats['hit_ratio']:.3f}")
+    print(f"  local LRU: hit ratio {local['hit_ratio']:.3f}, {local['mean_latency_us']:7.1f} us/lookup, "
+          f"{local['entries']} entries, {local['bytes']} bytes")
+    print(f"  redis:     hit ratio {redis['hit_ratio']:.3f}, {redis['mean_latency_us']:7.1f} us/lookup")
+
+
+def run(requests: int, keys: int, rtt_us: int, body_bytes: int) -> None:
+    logging.disable(logging.WARNING)
+    token = create_access_token({"sub": "bench@example.com", "tenant_id": "bench-tenant"})
+    random.seed(7)
+    pages = [random.randrange(keys) for _ in range(requests)]
+    endpoint = _endpoint(body_bytes)
+
+    print(f"requests: {requests}, {keys} distinct listings, ~{body_bytes} byte bodies, "
+          f"simulated Redis RTT {rtt_us} us")
+    configs = (
+        ("redis only", 0, 0.0),
+        ("LRU + redis", 64 * 1024 * 1024, 0.0),
+        ("LRU + redis, versions reused 1s", 64 * 1024 * 1024, 1.0),
+    )
+    for label, max_bytes, version_ttl in configs:
+        cache = ResponseCache(_SlowDictRedis(rtt_us), max_bytes=max_bytes, version_ttl=version_ttl)
+        app = CacheMiddleware(endpoint, cache=cache)
+        elapsed = asyncio.run(_drive(app, token, pages))
+        _report(label, elapsed, requests, cache.stats())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--redis-rtt-us", type=int, default=200)
+    parser.add_argument("--body-bytes", type=int, default=8192)
+    args = parser.parse_args()
+    run(args.requests, args.keys, args.redis_rtt_us, args.body_bytes)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from __future__ import annotations
 import argparse
 import os
 import sys
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 
@@ -58,6 +59,131 @@ def bootstrap_demo(force: bool = False) -> None:
     bootstrap_module.main(force=force)
 
 
+def ingest_credit_reports(
+    batch_size: Optional[int], workers: Optional[int], once: bool, poll_interval: float
+) -> None:
+    """Parse UPLOADED credit reports into normalized snapshots."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    from app.database import SessionLocal
+    from app.services.document_pipeline import (
+        INGESTION_BATCH_SIZE,
+        INGESTION_WORKERS,
+        CreditReportIngestion,
+    )
+
+    pipeline = CreditReportIngestion(
+        SessionLocal,
+        executor_factory=lambda: ProcessPoolExecutor(max_workers=workers or INGESTION_WORKERS),
+        batch_size=batch_size or INGESTION_BATCH_SIZE,
+    )
+    _run_pipeline(pipeline, once, poll_interval)
+
+
+def extract_text(
+    batch_size: Optional[int], workers: Optional[int], once: bool, poll_interval: float
+) -> None:
+    """Fill extracted_text for uploaded PDFs and text files."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    from app.database import SessionLocal
+    from app.services.document_pipeline import (
+        EXTRACTION_BATCH_SIZE,
+        INGESTION_WORKERS,
+        TextExtraction,
+    )
+
+    pipeline = TextExtraction(
+        SessionLocal,
+        executor_factory=lambda: ProcessPoolExecutor(max_workers=workers or INGESTION_WORKERS),
+        batch_size=batch_size or EXTRACTION_BATCH_SIZE,
+    )
+    _run_pipeline(pipeline, once, poll_interval)
+
+
+def partitions(action: str, retention_months: Optional[int], max_months: Optional[int]) -> None:
+    """Maintain monthly partitions of the compliance log tables."""
+    from app.database import engine
+    from app.services import partitioning
+
+    for table in partitioning.PARTITIONED_TABLES:
+        if action == "backfill":
+            # One month per transaction keeps each lock on the default
+            # partition short; rerun to continue after an interruption.
+            # Only months that have ended are carved, as they get no writes.
+            current = partitioning.month_start(datetime.now(timezone.utc))
+            with engine.connect() as conn:
+                months = partitioning.default_partition_months(conn, table, before=current)
+            for month in months[:max_months]:
+                with engine.begin() as conn:
+                    moved = partitioning.carve_month(conn, table, month)
+                print(f"{partitioning.partition_name(table, month)}: moved {moved} rows")
+            continue
+
+        with engine.begin() as conn:
+            created = partitioning.ensure_partitions(conn, table)
+            dropped = partitioning.drop_expired_partitions(
+                conn,
+                table,
+                retention_months=retention_months or partitioning.COMPLIANCE_RETENTION_MONTHS,
+            )
+        print(f"{table}: created {created or 'none'}, dropped {dropped or 'none'}")
+
+
+def compliance_rollups(rebuild_since: Optional[str], once: bool, poll_interval: float) -> None:
+    """Keep the compliance dashboard's daily rollups up to date."""
+    import time
+    from datetime import date
+
+    from app.database import SessionLocal
+    from app.services.compliance_rollups import rebuild_rollups, refresh_rollups
+
+    db = SessionLocal()
+    try:
+        if rebuild_since:
+            written = rebuild_rollups(db, date.fromisoformat(rebuild_since))
+            print(f"rebuilt {written} rollup rows since {rebuild_since}")
+            return
+        while True:
+            watermarks = refresh_rollups(db)
+            if once:
+                print({source: mark.isoformat() for source, mark in watermarks.items()})
+                return
+            time.sleep(poll_interval)
+    finally:
+        db.close()
+
+
+def gdpr_erasure(job_id: Optional[str]) -> None:
+    """Run or resume GDPR erasure jobs."""
+    from app.database import SessionLocal
+    from app.services.gdpr_erasure import erase_subject, pending_erasures
+    from app.services.storage import storage_service
+
+    if job_id:
+        job_ids = [job_id]
+    else:
+        db = SessionLocal()
+        try:
+            job_ids = pending_erasures(db)
+        finally:
+            db.close()
+    for pending in job_ids:
+        result = erase_subject(SessionLocal, storage_service, pending)
+        print(f"{pending}: {result['status']}, erased {result.get('erased', {})}")
+
+
+def _run_pipeline(pipeline, once: bool, poll_interval: float) -> None:
+    if not once:
+        pipeline.run_forever(poll_interval=poll_interval)
+        return
+    try:
+        pipeline.drain()
+    finally:
+        pipeline.executor.shutdown()
+    print(pipeline.metrics.as_dict())
+
+
 def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="CredKit management helper")
     subparsers = parser.add_subparsers(dest="command", required=True)
@@ -97,9 +223,75 @@ def _build_parser() -> argparse.ArgumentParser:
         help="Recreate demo data before bootstrapping",
     )
 
+    ingest_parser = subparsers.add_parser(
+        "ingest-credit-reports",
+        help="Run the credit report ingestion worker",
+    )
+    _add_worker_arguments(ingest_parser)
+
+    extract_parser = subparsers.add_parser(
+        "extract-text",
+        help="Run the document text extraction worker",
+    )
+    _add_worker_arguments(extract_parser)
+
+    partitions_parser = subparsers.add_parser(
+        "partitions",
+        help="Maintain monthly partitions of the audit and compliance logs",
+    )
+    partitions_parser.add_argument(
+        "action",
+        choices=["maintain", "backfill"],
+        help="maintain: create upcoming months and drop expired ones; "
+        "backfill: move pre-partitioning rows into monthly partitions",
+    )
+    partitions_parser.add_argument(
+        "--retention-months",
+        type=int,
+        help="Months of logs to keep (default: COMPLIANCE_RETENTION_MONTHS)",
+    )
+    partitions_parser.add_argument(
+        "--max-months",
+        type=int,
+        help="Backfill at most this many months per table",
+    )
+
+    rollups_parser = subparsers.add_parser(
+        "compliance-rollups",
+        help="Refresh the daily compliance dashboard rollups",
+    )
+    rollups_parser.add_argument(
+        "--rebuild-since",
+        metavar="YYYY-MM-DD",
+        help="Recount every day from this date (e.g. after an audit replay failed to recount its days)",
+    )
+    rollups_parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Refresh once and exit instead of polling",
+    )
+    rollups_parser.add_argument("--poll-interval", type=float, default=60.0)
+
+    erasure_parser = subparsers.add_parser(
+        "gdpr-erasure",
+        help="Resume interrupted or failed GDPR erasure jobs",
+    )
+    erasure_parser.add_argument("--job-id", help="Only this GDPR request (compliance event id)")
+
     return parser
 
 
+def _add_worker_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--batch-size", type=int, help="Documents claimed per batch")
+    parser.add_argument("--workers", type=int, help="Parser processes")
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Drain the queue and exit instead of polling",
+    )
+    parser.add_argument("--poll-interval", type=float, default=5.0)
+
+
 def main(argv: Optional[list[str]] = None) -> None:
     parser = _build_parser()
     args = parser.parse_args(argv)
@@ -120,6 +312,26 @@ def main(argv: Optional[list[str]] = None) -> None:
         bootstrap_demo(force=args.force)
         return
 
+    if args.command == "ingest-credit-reports":
+        ingest_credit_reports(args.batch_size, args.workers, args.once, args.poll_interval)
+        return
+
+    if args.command == "extract-text":
+        extract_text(args.batch_size, args.workers, args.once, args.poll_interval)
+        return
+
+    if args.command == "partitions":
+        partitions(args.action, args.retention_months, args.max_months)
+        return
+
+    if args.command == "compliance-rollups":
+        compliance_rollups(args.rebuild_since, args.once, args.poll_interval)
+        return
+
+    if args.command == "gdpr-erasure":
+        gdpr_erasure(args.job_id)
+        return
+
     parser.print_help()
 
 
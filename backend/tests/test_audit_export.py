@@ -0,0 +1,201 @@
+import base64
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud
+from app.database import Base, get_db
+from app.main import app
+from app.models.audit_log import AuditAction, AuditLog, AuditResourceType
+from app.routers import compliance as compliance_router
+from app.schemas.user import UserCreate
+from app.security import create_access_token
+from app.services.pagination import CountCache
+from app.services.presigned_cache import presigned_url_cache
+from app.services.storage import LocalStorageService
+
+from .utils import db_override, restore_server_defaults, sqlite_database, strip_postgres_casts
+
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_audit_export.db"
+engine, TestingSessionLocal = sqlite_database(SQLALCHEMY_DATABASE_URL)
+
+
+override_get_db = db_override(TestingSessionLocal)
+
+
+@pytest.fixture(scope="module")
+def client():
+    original_defaults = strip_postgres_casts(Base.metadata)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        Base.metadata.drop_all(bind=engine)
+        restore_server_defaults(original_defaults)
+
+
+NOW = datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module")
+def admin(client):
+    db = TestingSessionLocal()
+    try:
+        user = crud.create_user(
+            db,
+            UserCreate(
+                email="auditor@example.com",
+                password="StrongPass!123",
+                first_name="Audit",
+                last_name="Admin",
+                organization_name="Audit Org",
+            ),
+        )
+        user.role = "admin"
+        for index in range(25):
+            db.add(AuditLog(
+                tenant_id=user.tenant_id,
+                action=AuditAction.READ,
+                resource_type=AuditResourceType.CLIENT,
+                resource_id=f"client-{index}",
+                user_email=user.email,
+                description=f"GET /api/v1/clients/client-{index}",
+                event_metadata={"index": index},
+                created_at=NOW - timedelta(hours=index),
+            ))
+        db.commit()
+        token = create_access_token({"sub": user.email, "tenant_id": str(user.tenant_id)})
+        return {"Authorization": f"Bearer {token}"}
+    finally:
+        db.close()
+
+
+def _params(**extra):
+    return {
+        "start_date": (NOW - timedelta(days=30)).isoformat(),
+        "end_date": NOW.isoformat(),
+        **extra,
+    }
+
+
+def test_csv_export_streams_every_row(client: TestClient, admin, monkeypatch):
+    monkeypatch.setattr("app.services.audit_export.AUDIT_EXPORT_BATCH_SIZE", 10)
+    response = client.post("/api/v1/compliance/export-audit-data", params=_params(), headers=admin)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"].endswith('.csv"')
+    lines = response.text.strip().splitlines()
+    assert lines[0].startswith("Timestamp,User Email,Action")
+    assert len(lines) == 26
+    assert "client-0" in lines[1] and "client-24" in lines[-1]
+
+
+def test_gzipped_ndjson_export(client: TestClient, admin):
+    response = client.post(
+        "/api/v1/compliance/export-audit-data",
+        params=_params(format="ndjson", gzip="true"),
+        headers=admin,
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    records = [json.loads(line) for line in gzip.decompress(response.content).splitlines()]
+    assert len(records) == 25
+    assert records[0]["resource_id"] == "client-0"
+    assert records[0]["metadata"] == {"index": 0}
+
+
+def test_background_export_writes_to_storage(client: TestClient, admin, monkeypatch, tmp_path):
+    local = LocalStorageService(root=str(tmp_path))
+    monkeypatch.setattr(compliance_router, "storage_service", local)
+    monkeypatch.setattr(presigned_url_cache, "storage", local)
+
+    response = client.post(
+        "/api/v1/compliance/export-audit-data", params=_params(background="true"), headers=admin
+    )
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    status = client.get(f"/api/v1/compliance/export-audit-data/{job_id}", headers=admin).json()
+    assert status["status"] == "completed"
+    assert status["record_count"] == 25
+    [stored] = local.list_files("")
+    assert stored["key"] == status["s3_key"]
+    content = b"".join(bytes(chunk) for chunk in local.iter_file(stored["key"]))
+    assert len(content.decode().strip().splitlines()) == 26
+
+
+def test_background_export_is_encrypted_and_served_through_signed_url(
+    client: TestClient, admin, monkeypatch, tmp_path
+):
+    monkeypatch.setenv("DOCUMENT_ENCRYPTION_KEY", base64.b64encode(os.urandom(32)).decode())
+    local = LocalStorageService(root=str(tmp_path))
+    monkeypatch.setattr(compliance_router, "storage_service", local)
+
+    response = client.post(
+        "/api/v1/compliance/export-audit-data",
+        params=_params(format="ndjson", background="true"),
+        headers=admin,
+    )
+    job_id = response.json()["job_id"]
+    status = client.get(f"/api/v1/compliance/export-audit-data/{job_id}", headers=admin).json()
+    assert status["status"] == "completed"
+    assert "encryption_key_id" not in status
+    assert status["download_url"].startswith(f"/api/v1/compliance/export-audit-data/{job_id}/download?")
+
+    [stored] = local.list_files("")
+    assert b"client-0" not in b"".join(bytes(chunk) for chunk in local.iter_file(stored["key"]))
+
+    download = client.get(status["download_url"])
+    assert download.status_code == 200
+    assert download.headers["content-type"] == "application/x-ndjson"
+    assert len(download.content.splitlines()) == 25
+    assert client.get(status["download_url"].replace("signature=", "signature=0")).status_code == 403
+
+
+def test_audit_logs_keyset_pages_with_cached_counts(client: TestClient, admin):
+    seen = []
+    cursor = None
+    kinds = []
+    while True:
+        params = {"limit": 10, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/v1/compliance/audit-logs", params=params, headers=admin).json()
+        seen += [log["resource_id"] for log in page["audit_logs"]]
+        kinds.append(page["total_count_type"])
+        assert page["total_count"] == 25
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert seen == [f"client-{index}" for index in range(25)]
+    # sqlite has no planner estimate: the first page counts, later ones reuse it
+    assert kinds == ["exact", "cached", "cached"]
+
+    exact = client.get(
+        "/api/v1/compliance/audit-logs", params={"exact_count": "true"}, headers=admin
+    ).json()
+    assert exact["total_count_type"] == "exact"
+    bad = client.get("/api/v1/compliance/audit-logs", params={"cursor": "nope"}, headers=admin)
+    assert bad.status_code == 400
+
+
+def test_count_cache_expires_and_evicts():
+    now = [0.0]
+    cache = CountCache(ttl=10, max_entries=2, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    now[0] = 10
+    assert cache.get("a") is None
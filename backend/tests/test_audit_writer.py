@@ -0,0 +1,269 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app import models  # noqa: F401  (register every mapper)
+from app.database import Base
+from app.middleware.audit import AuditMiddleware
+from app.models.audit_log import (
+    AuditAction,
+    AuditLog,
+    AuditResourceType,
+    ComplianceDailyRollup,
+    ComplianceRollupWatermark,
+)
+from app.models.tenant import Tenant
+from app.services.audit_writer import AuditLogWriter, _file_lock, audit_event
+
+from .utils import restore_server_defaults, sqlite_database, strip_postgres_casts
+
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_audit_writer.db"
+engine, TestingSessionLocal = sqlite_database(SQLALCHEMY_DATABASE_URL)
+
+
+@pytest.fixture(scope="module")
+def tenant_id():
+    original_defaults = strip_postgres_casts(Base.metadata)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        tenant = Tenant(name="Audit Co")
+        db.add(tenant)
+        db.commit()
+        yield tenant.id
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+        restore_server_defaults(original_defaults)
+
+
+def _event(tenant_id, path="/api/v1/clients/"):
+    return audit_event(
+        tenant_id=tenant_id,
+        action=AuditAction.READ,
+        resource_type=AuditResourceType.CLIENT,
+        request_path=path,
+        event_metadata={"status_code": 200},
+    )
+
+
+def _paths(tenant_id):
+    db = TestingSessionLocal()
+    try:
+        return sorted(
+            path for (path,) in db.query(AuditLog.request_path).filter(AuditLog.tenant_id == tenant_id)
+        )
+    finally:
+        db.close()
+
+
+def _broken_session():
+    raise RuntimeError("database unavailable")
+
+
+def test_events_are_flushed_in_batches(tenant_id, tmp_path):
+    writer = AuditLogWriter(
+        TestingSessionLocal, batch_size=4, flush_interval=0.05, spill_path=str(tmp_path / "spill.jsonl")
+    )
+
+    async def run():
+        for index in range(10):
+            writer.submit(_event(tenant_id, f"/batch/{index:02d}"))
+        writer.submit(_event(None))
+        await writer.stop()
+
+    asyncio.run(run())
+
+    assert _paths(tenant_id) == [f"/batch/{index:02d}" for index in range(10)]
+    stats = writer.stats()
+    assert stats["written"] == 10
+    assert stats["batches"] == 3
+    assert stats["skipped"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_failed_batches_spill_and_replay_once(tenant_id, tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    writer = AuditLogWriter(_broken_session, max_queue=2, flush_interval=0.05, spill_path=str(spill))
+
+    async def outage():
+        for index in range(5):
+            writer.submit(_event(tenant_id, f"/outage/{index}"))
+        await writer.stop()
+
+    asyncio.run(outage())
+    assert writer.stats()["written"] == 0
+    assert writer.stats()["spilled"] == 5
+    spilled = [json.loads(line) for line in spill.read_text().splitlines()]
+    assert len(spilled) == 5
+
+    # One spilled event already made it in (e.g. a timed-out insert that
+    # committed late); replay must not duplicate it.
+    db = TestingSessionLocal()
+    try:
+        db.add(AuditLog(
+            id=uuid.UUID(spilled[0]["id"]),
+            tenant_id=tenant_id,
+            action=AuditAction.READ,
+            resource_type=AuditResourceType.CLIENT,
+            request_path=spilled[0]["request_path"],
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+    recovered = AuditLogWriter(TestingSessionLocal, flush_interval=0.05, spill_path=str(spill))
+
+    async def recovery():
+        recovered.submit(_event(tenant_id, "/outage/after"))
+        await recovered.stop()
+
+    asyncio.run(recovery())
+    outage_paths = [path for path in _paths(tenant_id) if path.startswith("/outage/")]
+    assert outage_paths == sorted([f"/outage/{index}" for index in range(5)] + ["/outage/after"])
+    assert recovered.stats()["replayed"] == 4
+    assert not spill.exists()
+
+
+def test_replay_streams_batches_and_respills_the_unread_rest(tenant_id, tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    events = [_event(tenant_id, f"/partial/{index}") for index in range(5)]
+    spill.write_text("".join(json.dumps(event) + "\n" for event in events))
+    sessions = []
+
+    def flaky_session():
+        sessions.append(1)
+        if len(sessions) > 1:
+            raise RuntimeError("database went away")
+        return TestingSessionLocal()
+
+    writer = AuditLogWriter(flaky_session, batch_size=2, spill_path=str(spill))
+    with pytest.raises(RuntimeError):
+        writer._replay_spill()
+
+    assert [path for path in _paths(tenant_id) if path.startswith("/partial/")] == ["/partial/0", "/partial/1"]
+    assert [json.loads(line)["request_path"] for line in spill.read_text().splitlines()] == [
+        "/partial/2", "/partial/3", "/partial/4"
+    ]
+    assert not (tmp_path / "spill.jsonl.replay").exists()
+
+
+def test_replay_is_left_to_the_worker_holding_the_replay_lock(tenant_id, tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    spill.write_text(json.dumps(_event(tenant_id, "/held/0")) + "\n")
+    writer = AuditLogWriter(TestingSessionLocal, spill_path=str(spill))
+
+    with _file_lock(f"{spill}.replay.lock"):
+        writer._replay_spill()
+        assert spill.exists() and writer.stats()["replayed"] == 0
+
+    writer._replay_spill()
+    assert not spill.exists() and writer.stats()["replayed"] == 1
+
+
+class _RecordingWriter:
+    def __init__(self):
+        self.events = []
+        self.started = self.stopped = False
+
+    def start(self):
+        self.started = True
+
+    async def stop(self):
+        self.stopped = True
+
+    def submit(self, event):
+        self.events.append(event)
+
+
+def test_middleware_hands_events_to_writer():
+    async def endpoint(request):
+        return PlainTextResponse("ok")
+
+    writer = _RecordingWriter()
+    app = Starlette(routes=[Route("/api/v1/clients/{client_id}", endpoint, methods=["GET", "PUT"])])
+    app.add_middleware(AuditMiddleware, writer=writer)
+
+    with TestClient(app) as client:
+        assert writer.started
+        assert client.put("/api/v1/clients/abc", content=b"{}").text == "ok"
+
+    assert writer.stopped
+    [event] = writer.events
+    assert event["action"] == "UPDATE"
+    assert event["resource_type"] == "CLIENT"
+    assert event["resource_id"] == "abc"
+    assert event["event_metadata"]["request_size"] == 2
+
+
+def test_middleware_counts_streamed_bytes_without_buffering():
+    async def upload(request):
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        return PlainTextResponse(str(size))
+
+    async def download(request):
+        async def chunks():
+            for _ in range(3):
+                yield b"x" * 1000
+        return StreamingResponse(chunks())
+
+    writer = _RecordingWriter()
+    app = Starlette(routes=[
+        Route("/api/v1/documents/upload", upload, methods=["POST"]),
+        Route("/api/v1/documents/download", download),
+    ])
+    app.add_middleware(AuditMiddleware, writer=writer)
+
+    def body():
+        yield b"a" * 700
+        yield b"b" * 300
+
+    with TestClient(app) as client:
+        # A generator body is sent chunked, without Content-Length
+        assert client.post("/api/v1/documents/upload", content=body()).text == "1000"
+        assert len(client.get("/api/v1/documents/download").content) == 3000
+
+    upload_event, download_event = writer.events
+    assert upload_event["event_metadata"]["request_size"] == 1000
+    assert download_event["event_metadata"]["response_size"] == 3000
+    assert download_event["event_metadata"]["request_size"] == 0
+
+
+def test_replay_behind_the_rollup_watermark_recounts_those_days(tenant_id, tmp_path):
+    now = datetime.now(timezone.utc)
+    late_day = (now - timedelta(days=3)).date()
+    spill = tmp_path / "spill.jsonl"
+    events = [_event(tenant_id, f"/late/{index}") for index in range(3)]
+    for event in events:
+        event["created_at"] = (now - timedelta(days=3)).isoformat()
+    spill.write_text("".join(json.dumps(event) + "\n" for event in events))
+
+    db = TestingSessionLocal()
+    try:
+        for source in ("audit_logs", "data_access_logs", "compliance_events"):
+            db.add(ComplianceRollupWatermark(source=source, processed_through=now))
+        db.commit()
+
+        AuditLogWriter(TestingSessionLocal, spill_path=str(spill))._replay_spill()
+
+        [rollup] = db.query(ComplianceDailyRollup).filter(
+            ComplianceDailyRollup.tenant_id == tenant_id,
+            ComplianceDailyRollup.day == late_day,
+        ).all()
+        assert rollup.reads == 3
+    finally:
+        db.query(ComplianceDailyRollup).delete()
+        db.query(ComplianceRollupWatermark).delete()
+        db.commit()
+        db.close()
@@ -0,0 +1,158 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud
+from app.database import Base, get_db
+from app.main import app
+from app.models.audit_log import (
+    AuditAction,
+    AuditLog,
+    AuditResourceType,
+    ComplianceDailyRollup,
+    ComplianceEvent,
+    DataAccessLog,
+)
+from app.schemas.user import UserCreate
+from app.security import create_access_token
+from app.services.compliance_rollups import rebuild_rollups, refresh_rollups
+
+from .utils import db_override, restore_server_defaults, sqlite_database, strip_postgres_casts
+
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_compliance_rollups.db"
+engine, TestingSessionLocal = sqlite_database(SQLALCHEMY_DATABASE_URL)
+
+
+override_get_db = db_override(TestingSessionLocal)
+
+
+@pytest.fixture(scope="module")
+def client():
+    original_defaults = strip_postgres_casts(Base.metadata)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        Base.metadata.drop_all(bind=engine)
+        restore_server_defaults(original_defaults)
+
+
+NOW = datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module")
+def admin(client):
+    db = TestingSessionLocal()
+    try:
+        user = crud.create_user(
+            db,
+            UserCreate(
+                email="rollups@example.com",
+                password="StrongPass!123",
+                first_name="Roll",
+                last_name="Up",
+                organization_name="Rollup Org",
+            ),
+        )
+        user.role = "admin"
+        db.commit()
+        token = create_access_token({"sub": user.email, "tenant_id": str(user.tenant_id)})
+        return {"user_id": user.id, "tenant_id": user.tenant_id, "headers": {"Authorization": f"Bearer {token}"}}
+    finally:
+        db.close()
+
+
+def _log(db, admin, action, created_at, user=True):
+    db.add(AuditLog(
+        tenant_id=admin["tenant_id"],
+        user_id=admin["user_id"] if user else None,
+        action=action,
+        resource_type=AuditResourceType.CLIENT,
+        created_at=created_at,
+    ))
+
+
+def test_refresh_counts_each_row_once(admin):
+    db = TestingSessionLocal()
+    try:
+        yesterday = NOW - timedelta(days=1)
+        _log(db, admin, AuditAction.READ, yesterday)
+        _log(db, admin, AuditAction.DOWNLOAD, yesterday)
+        _log(db, admin, AuditAction.UPDATE, yesterday)
+        _log(db, admin, AuditAction.LOGIN, yesterday, user=False)
+        db.add(DataAccessLog(
+            tenant_id=admin["tenant_id"], user_id=admin["user_id"],
+            resource_type=AuditResourceType.CLIENT, resource_id="c1", created_at=yesterday,
+        ))
+        db.add(ComplianceEvent(
+            tenant_id=admin["tenant_id"], user_id=admin["user_id"], event_type="GDPR_REQUEST",
+            title="GDPR ACCESS Request", created_at=yesterday,
+        ))
+        # Still inside the settle window at the first refresh
+        _log(db, admin, AuditAction.READ, NOW - timedelta(seconds=30))
+        db.commit()
+
+        refresh_rollups(db, now=NOW, settle_seconds=60)
+        refresh_rollups(db, now=NOW, settle_seconds=60)
+        rows = {
+            row.user_id: row
+            for row in db.query(ComplianceDailyRollup).filter(ComplianceDailyRollup.day == yesterday.date())
+        }
+        mine = rows[admin["user_id"]]
+        assert (mine.reads, mine.writes, mine.sensitive_accesses, mine.gdpr_requests) == (2, 1, 1, 1)
+        assert rows[None].logins == 1
+        assert db.query(ComplianceDailyRollup).filter(ComplianceDailyRollup.day == NOW.date()).count() == 0
+
+        refresh_rollups(db, now=NOW + timedelta(minutes=5), settle_seconds=60)
+        today = db.query(ComplianceDailyRollup).filter(ComplianceDailyRollup.day == NOW.date()).one()
+        assert today.reads == 1
+
+        # A late row behind the watermark is only picked up by a rebuild
+        _log(db, admin, AuditAction.CREATE, yesterday)
+        db.commit()
+        refresh_rollups(db, now=NOW + timedelta(minutes=10), settle_seconds=60)
+        db.refresh(mine)
+        assert mine.writes == 1
+        rebuild_rollups(db, yesterday.date())
+        mine = db.query(ComplianceDailyRollup).filter(
+            ComplianceDailyRollup.day == yesterday.date(),
+            ComplianceDailyRollup.user_id == admin["user_id"],
+        ).one()
+        assert (mine.reads, mine.writes) == (2, 2)
+    finally:
+        db.close()
+
+
+def test_dashboard_serves_rollups(client, admin):
+    day = (NOW - timedelta(days=1)).date()
+    params = {"start_date": str(day - timedelta(days=2)), "end_date": str(NOW.date())}
+    response = client.get("/api/v1/compliance/dashboard", params=params, headers=admin["headers"])
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["totals"] == {
+        "reads": 3, "writes": 2, "logins": 1, "sensitive_accesses": 1, "gdpr_requests": 1
+    }
+    assert [row["day"] for row in data["daily"]] == [str(day), str(NOW.date())]
+    assert data["users"][0]["user_email"] == "rollups@example.com"
+    assert data["refreshed_through"] is not None
+
+    mine = client.get(
+        "/api/v1/compliance/dashboard",
+        params={**params, "user_id": str(admin["user_id"])},
+        headers=admin["headers"],
+    ).json()
+    assert mine["totals"]["logins"] == 0 and mine["users"] == []
+
+    bad = client.get(
+        "/api/v1/compliance/dashboard",
+        params={"start_date": "2026-01-02", "end_date": "2026-01-01"},
+        headers=admin["headers"],
+    )
+    assert bad.status_code == 400
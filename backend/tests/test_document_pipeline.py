@@ -0,0 +1,308 @@
+import functools
+import io
+import json
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.orm import undefer_group
+
+from app import models  # noqa: F401  (register every mapper)
+from app.database import Base
+from app.models import audit_log  # noqa: F401
+from app.models.document import Document, DocumentStatus, DocumentType
+from app.services import credit_report_parsing, document_pipeline, storage
+from app.services.credit_report_parsing import load_snapshot, parse_credit_report
+from app.services.document_pipeline import CreditReportIngestion, TextExtraction
+from app.services.storage import LocalStorageService
+from app.services.text_extraction import extract_document_text
+
+from .utils import restore_server_defaults, sqlite_database, strip_postgres_casts
+
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_document_pipeline.db"
+engine, TestingSessionLocal = sqlite_database(SQLALCHEMY_DATABASE_URL)
+
+CSV_REPORT = b"""record_type,account_ref,account_number,furnisher,overall_status,bureau,status,balance,credit_limit,late_30,dofd
+tradeline,ACC-1,1234,Capital One,open,EXPERIAN,late,"1,200",1000,2,2015-03-01
+tradeline,ACC-1,1234,Capital One,open,EQUIFAX,current,900,1000,,2015-03-01
+collection,COLL-1,,ABC Collections,,EXPERIAN,collection,,,,2014-01-01
+inquiry,,,Auto Loans LLC,,EXPERIAN,,,,,
+"""
+
+XML_REPORT = b"""<?xml version="1.0"?>
+<CreditReport generated_at="2024-01-01T00:00:00">
+  <Tradeline account_ref="ACC-1" account_number="1234" furnisher="Capital One" overall_status="open">
+    <Bureau name="EXPERIAN" status="late" balance="1200" credit_limit="1000" dofd="2015-03-01">
+      <LateCount days="30">2</LateCount>
+    </Bureau>
+    <Bureau name="EQUIFAX" status="current" balance="900" credit_limit="1000"/>
+  </Tradeline>
+  <Collection account_ref="COLL-1" furnisher="ABC Collections">
+    <Bureau name="EXPERIAN"><status>collection</status><dofd>2014-01-01</dofd></Bureau>
+  </Collection>
+  <Inquiry bureau="EXPERIAN" furnisher="Auto Loans LLC" type="hard" date="2020-02-01"/>
+</CreditReport>
+"""
+
+
+@pytest.fixture(scope="module")
+def database():
+    original_defaults = strip_postgres_casts(Base.metadata)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    try:
+        yield
+    finally:
+        Base.metadata.drop_all(bind=engine)
+        restore_server_defaults(original_defaults)
+
+
+@pytest.fixture
+def local_storage(monkeypatch, tmp_path):
+    service = LocalStorageService(root=str(tmp_path))
+    monkeypatch.setattr(storage, "storage_service", service)
+    return service
+
+
+def _store(service, content: bytes, filename: str) -> str:
+    return service.upload_bytes(
+        content=content, tenant_id="tenant", document_type="credit_report", filename=filename
+    )["s3_key"]
+
+
+@pytest.mark.parametrize("content,filename", [(CSV_REPORT, "report.csv"), (XML_REPORT, "report.xml")])
+def test_streaming_parsers_build_the_same_snapshot(local_storage, content, filename):
+    snapshot = parse_credit_report(_store(local_storage, content, filename), None, filename)
+
+    tradeline = snapshot["tradelines"][0]
+    assert tradeline["account_ref"] == "ACC-1"
+    assert tradeline["furnisher"] == "Capital One"
+    assert tradeline["bureaus"]["EXPERIAN"]["balance"] == 1200
+    assert tradeline["bureaus"]["EXPERIAN"]["late_counts"] == {"30": 2}
+    assert tradeline["bureaus"]["EQUIFAX"]["status"] == "current"
+    assert snapshot["collections"][0]["bureaus"]["EXPERIAN"]["dofd"] == "2014-01-01"
+    assert snapshot["inquiries"][0]["furnisher"] == "Auto Loans LLC"
+
+
+def test_ingestion_marks_documents_processed_or_failed(database, local_storage):
+    tenant_id = uuid.uuid4()
+    uploads = {
+        "report.json": json.dumps({"tradelines": [{"account_ref": "A"}], "inquiries": []}).encode(),
+        "report.csv": CSV_REPORT,
+        "report.xml": XML_REPORT,
+        "broken.xml": b"<CreditReport><Tradeline>",
+    }
+    db = TestingSessionLocal()
+    try:
+        for name, content in uploads.items():
+            db.add(Document(
+                tenant_id=tenant_id,
+                filename=name,
+                original_filename=name,
+                document_type=DocumentType.CREDIT_REPORT,
+                status=DocumentStatus.UPLOADED,
+                s3_key=_store(local_storage, content, name),
+                uploaded_by=uuid.uuid4(),
+            ))
+        db.add(Document(
+            tenant_id=tenant_id,
+            filename="id.pdf",
+            original_filename="id.pdf",
+            document_type=DocumentType.IDENTITY_DOCUMENT,
+            status=DocumentStatus.UPLOADED,
+            s3_key="unused",
+            uploaded_by=uuid.uuid4(),
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+    executor = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("fork"))
+    pipeline = CreditReportIngestion(TestingSessionLocal, executor=executor, batch_size=3)
+    try:
+        assert pipeline.run_batch() == 3
+        assert pipeline.run_batch() == 1
+        assert pipeline.run_batch() == 0
+    finally:
+        executor.shutdown()
+
+    db = TestingSessionLocal()
+    try:
+        documents = {
+            doc.original_filename: doc
+            for doc in db.query(Document).options(undefer_group("heavy")).all()
+        }
+    finally:
+        db.close()
+
+    for name in ("report.json", "report.csv", "report.xml"):
+        assert documents[name].status == DocumentStatus.PROCESSED
+        assert documents[name].processing_metadata["normalized_snapshot"]["tradelines"]
+    assert documents["broken.xml"].status == DocumentStatus.FAILED
+    assert "CreditReportParseError" in documents["broken.xml"].processing_metadata["ingestion"]["error"]
+    assert documents["id.pdf"].status == DocumentStatus.UPLOADED
+
+    metrics = pipeline.metrics.as_dict()
+    assert (metrics["succeeded"], metrics["failed"]) == (3, 1)
+    assert metrics["errors"] == {"CreditReportParseError": 1}
+
+
+def _add_upload(db, service, content: bytes, name: str, mime_type: str) -> None:
+    db.add(Document(
+        tenant_id=uuid.uuid4(),
+        filename=name,
+        original_filename=name,
+        mime_type=mime_type,
+        document_type=DocumentType.SUPPORTING_DOCUMENT,
+        s3_key=_store(service, content, name),
+        uploaded_by=uuid.uuid4(),
+    ))
+
+
+def test_text_extraction_fills_extracted_text_within_budget(database, local_storage, monkeypatch):
+    monkeypatch.setattr(document_pipeline, "EXTRACTION_WRITE_BATCH", 2)
+    db = TestingSessionLocal()
+    try:
+        _add_upload(db, local_storage, "héllo wörld".encode(), "note.txt", "text/plain")
+        _add_upload(db, local_storage, b"x" * 3000, "huge.txt", "text/plain")
+        _add_upload(db, local_storage, b"%PDF-1.4 not really", "broken.pdf", "application/pdf")
+        _add_upload(db, local_storage, b"\x89PNG", "photo.png", "image/png")
+        db.commit()
+    finally:
+        db.close()
+
+    monkeypatch.setattr(
+        document_pipeline,
+        "extract_document_text",
+        functools.partial(extract_document_text, max_chars=1000),
+    )
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pipeline = TextExtraction(TestingSessionLocal, executor=executor)
+        pipeline.drain()
+
+    db = TestingSessionLocal()
+    try:
+        documents = {
+            doc.original_filename: doc
+            for doc in db.query(Document)
+            .options(undefer_group("heavy"))
+            .filter(Document.document_type == DocumentType.SUPPORTING_DOCUMENT)
+        }
+    finally:
+        db.close()
+
+    assert documents["note.txt"].extracted_text == "héllo wörld"
+    assert documents["note.txt"].text_extraction_status == "done"
+    assert len(documents["huge.txt"].extracted_text) == 1000
+    assert documents["huge.txt"].text_extraction_status == "partial"
+    assert documents["broken.pdf"].text_extraction_status == "failed"
+    assert documents["photo.png"].text_extraction_status is None
+    assert pipeline.metrics.as_dict()["succeeded"] == 2
+
+
+def _extract_or_die(s3_key, mime_type, **kwargs):
+    if s3_key.endswith("hostile.txt"):
+        os._exit(1)
+    return extract_document_text(s3_key, mime_type, **kwargs)
+
+
+def test_worker_death_releases_the_batch_and_fails_only_the_culprit(database, local_storage, monkeypatch):
+    monkeypatch.setattr(document_pipeline, "extract_document_text", _extract_or_die)
+    db = TestingSessionLocal()
+    try:
+        for name in ("first.txt", "hostile.txt", "second.txt"):
+            _add_upload(db, local_storage, name.encode(), name, "text/plain")
+        db.commit()
+    finally:
+        db.close()
+
+    def forked_pool():
+        return ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("fork"))
+
+    pipeline = TextExtraction(TestingSessionLocal, executor_factory=forked_pool)
+    try:
+        pipeline.run_batch()
+        db = TestingSessionLocal()
+        try:
+            statuses = dict(db.query(Document.original_filename, Document.text_extraction_status))
+        finally:
+            db.close()
+        # The lost work is released rather than failed
+        assert statuses["hostile.txt"] is None
+        assert "failed" not in (statuses["first.txt"], statuses["second.txt"])
+
+        pipeline.drain()
+    finally:
+        pipeline.executor.shutdown()
+
+    db = TestingSessionLocal()
+    try:
+        statuses = dict(db.query(Document.original_filename, Document.text_extraction_status))
+    finally:
+        db.close()
+    assert statuses["hostile.txt"] == "failed"
+    assert statuses["first.txt"] == statuses["second.txt"] == "done"
+    metrics = pipeline.metrics.as_dict()
+    assert metrics["pool_restarts"] == 2
+    assert metrics["errors"] == {"BrokenProcessPool": 1}
+
+
+def test_text_that_exactly_fills_the_budget_is_complete(local_storage):
+    key = _store(local_storage, b"hello", "exact.txt")
+    assert extract_document_text(key, "text/plain", max_chars=5)["budget_exceeded"] is None
+    key = _store(local_storage, b"hello!", "over.txt")
+    assert extract_document_text(key, "text/plain", max_chars=5)["budget_exceeded"] == "chars"
+
+
+def test_pdf_extraction_reads_pages_up_to_budget(local_storage):
+    pytest.importorskip("pypdf")
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for _ in range(3):
+        writer.add_blank_page(width=72, height=72)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    key = _store(local_storage, buffer.getvalue(), "blank.pdf")
+
+    result = extract_document_text(key, "application/pdf", max_pages=2)
+    assert (result["pages"], result["total_pages"]) == (2, 3)
+    assert result["budget_exceeded"] == "pages"
+
+
+def test_large_snapshots_are_offloaded_and_loaded_lazily(database, local_storage, monkeypatch):
+    monkeypatch.setattr(credit_report_parsing, "SNAPSHOT_INLINE_LIMIT", 64)
+    db = TestingSessionLocal()
+    try:
+        document = Document(
+            tenant_id=uuid.uuid4(),
+            filename="big.csv",
+            original_filename="big.csv",
+            document_type=DocumentType.CREDIT_REPORT,
+            status=DocumentStatus.UPLOADED,
+            s3_key=_store(local_storage, CSV_REPORT, "big.csv"),
+            uploaded_by=uuid.uuid4(),
+        )
+        db.add(document)
+        db.commit()
+        document_id = document.id
+    finally:
+        db.close()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        CreditReportIngestion(TestingSessionLocal, executor=executor).drain()
+
+    db = TestingSessionLocal()
+    try:
+        metadata = db.get(Document, document_id).processing_metadata
+    finally:
+        db.close()
+
+    assert "normalized_snapshot" not in metadata
+    ref = metadata["normalized_snapshot_ref"]
+    assert ref["size"] > 64
+    assert local_storage.list_files(ref["s3_key"])
+    assert load_snapshot(metadata)["tradelines"][0]["account_ref"] == "ACC-1"
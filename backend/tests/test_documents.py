@@ -0,0 +1,380 @@
+import asyncio
+import base64
+import io
+import os
+import time
+import uuid
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.database import Base, get_db
+from app.main import app
+from app.models.document import Document, DocumentStatus, DocumentType
+from app.models.user import User
+from app.routers import documents as documents_router
+from app.schemas.user import UserCreate
+from app.security import create_access_token
+from app.services.document_export import ExportEntry, stream_zip
+from app.services.encryption import tenant_data_key_id
+from app.services.storage import LocalStorageService
+
+from .utils import db_override, restore_server_defaults, sqlite_database, strip_postgres_casts
+
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_documents.db"
+engine, TestingSessionLocal = sqlite_database(SQLALCHEMY_DATABASE_URL)
+
+
+override_get_db = db_override(TestingSessionLocal)
+
+
+@pytest.fixture(scope="module")
+def client():
+    original_defaults = strip_postgres_casts(Base.metadata)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        Base.metadata.drop_all(bind=engine)
+        restore_server_defaults(original_defaults)
+
+
+@pytest.fixture
+def local_storage(monkeypatch, tmp_path):
+    service = LocalStorageService(root=str(tmp_path))
+    monkeypatch.setattr(documents_router, "storage_service", service)
+    return service
+
+
+def _tenant_headers(email: str) -> dict:
+    db = TestingSessionLocal()
+    try:
+        user = crud.create_user(
+            db,
+            UserCreate(
+                email=email,
+                password="StrongPass!123",
+                first_name="Doc",
+                last_name="Owner",
+                organization_name=f"{email} Org",
+            ),
+        )
+        user.role = "admin"
+        db.commit()
+        token = create_access_token({"sub": user.email, "tenant_id": str(user.tenant_id)})
+        return {"Authorization": f"Bearer {token}"}
+    finally:
+        db.close()
+
+
+def _upload(client: TestClient, headers: dict, content: bytes, name: str = "report.pdf"):
+    response = client.post(
+        "/api/v1/documents/upload",
+        files={"file": (name, content, "application/pdf")},
+        data={"document_type": "credit_report"},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_duplicate_uploads_share_one_object(client: TestClient, local_storage):
+    headers = _tenant_headers("dedup@example.com")
+    other_tenant = _tenant_headers("elsewhere@example.com")
+    content = b"%PDF-1.7 same report"
+
+    first = _upload(client, headers, content)
+    second = _upload(client, headers, content, name="again.pdf")
+    _upload(client, headers, b"%PDF-1.7 different report")
+    _upload(client, other_tenant, content)
+
+    assert first["id"] != second["id"]
+    assert second["original_filename"] == "again.pdf"
+    assert first["s3_url"] == second["s3_url"]
+    assert len(local_storage.list_files("")) == 3
+
+    stats = client.get("/api/v1/documents/stats/dedup", headers=headers).json()
+    assert stats["documents"] == 3
+    assert stats["stored_objects"] == 2
+    assert stats["bytes_saved"] == len(content)
+    assert stats["dedup_ratio"] > 1
+
+
+def test_duplicate_upload_is_never_sent_to_storage(client: TestClient, local_storage, monkeypatch):
+    headers = _tenant_headers("dedup-first@example.com")
+    content = b"%PDF-1.7 hashed before upload"
+    first = _upload(client, headers, content)
+
+    calls = []
+    monkeypatch.setattr(local_storage, "upload_file", lambda **kwargs: calls.append("upload"))
+    monkeypatch.setattr(local_storage, "delete_file", lambda key: calls.append("delete"))
+    second = _upload(client, headers, content, name="again.pdf")
+
+    assert calls == []
+    assert second["s3_url"] == first["s3_url"]
+    assert second["file_size"] == len(content)
+    assert second["original_filename"] == "again.pdf"
+
+
+def test_shared_object_is_deleted_with_last_reference(client: TestClient, local_storage):
+    headers = _tenant_headers("refcount@example.com")
+    content = b"%PDF-1.7 refcounted"
+
+    first = _upload(client, headers, content)
+    second = _upload(client, headers, content)
+    assert len(local_storage.list_files("")) == 1
+
+    assert client.delete(f"/api/v1/documents/{first['id']}", headers=headers).status_code == 200
+    assert len(local_storage.list_files("")) == 1
+
+    assert client.delete(f"/api/v1/documents/{second['id']}", headers=headers).status_code == 200
+    assert local_storage.list_files("") == []
+
+
+def test_reference_count_and_reuse_lock_the_shared_rows(client: TestClient, local_storage):
+    headers = _tenant_headers("refcount-lock@example.com")
+    content = b"%PDF-1.7 locked refcount"
+    statements = []
+
+    def record(state):
+        if state.is_select:
+            statements.append(str(state.statement.compile(dialect=postgresql.dialect())))
+
+    event.listen(Session, "do_orm_execute", record)
+    try:
+        first = _upload(client, headers, content)
+        _upload(client, headers, content)
+        assert client.delete(f"/api/v1/documents/{first['id']}", headers=headers).status_code == 200
+    finally:
+        event.remove(Session, "do_orm_execute", record)
+
+    locked = [sql for sql in statements if sql.endswith("FOR UPDATE") and "FROM documents" in sql]
+    # The duplicate lookup on the second upload, and the rows behind the
+    # delete's reference count
+    assert any("content_sha256" in sql for sql in locked)
+    assert any("documents.s3_key = " in sql for sql in locked)
+
+
+def _set_role(email: str, role: str) -> None:
+    db = TestingSessionLocal()
+    try:
+        db.query(User).filter(User.email == email).update({User.role: role})
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_storage_metrics_are_admin_only(client: TestClient):
+    headers = _tenant_headers("storage-metrics@example.com")
+    response = client.get("/api/v1/storage/metrics", headers=headers)
+    assert response.status_code == 200 and "presigned_url_cache" in response.json()
+
+    _set_role("storage-metrics@example.com", "user")
+    assert client.get("/api/v1/storage/metrics", headers=headers).status_code == 403
+
+
+def test_cache_metrics_are_admin_only(client: TestClient):
+    headers = _tenant_headers("cache-metrics@example.com")
+    response = client.get("/api/v1/cache/metrics", headers=headers)
+    assert response.status_code == 200 and "response_cache" in response.json()
+
+    _set_role("cache-metrics@example.com", "user")
+    assert client.get("/api/v1/cache/metrics", headers=headers).status_code == 403
+
+
+def test_export_streams_zip_of_client_documents(client: TestClient, local_storage):
+    headers = _tenant_headers("export@example.com")
+    client_id = str(uuid.uuid4())
+    payloads = {
+        "report.pdf": b"%PDF-1.7 " + b"a" * 5000,
+        "notes.txt": b"plain notes " * 100,
+    }
+    for name, content in payloads.items():
+        response = client.post(
+            "/api/v1/documents/upload",
+            files={"file": (name, content, "application/octet-stream")},
+            data={"document_type": "supporting_document", "client_id": client_id},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+    _upload(client, headers, b"%PDF-1.7 again", name="report.pdf")
+
+    response = client.get("/api/v1/documents/export", params={"client_id": client_id}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.testzip() is None
+        assert {name: archive.read(name) for name in archive.namelist()} == payloads
+
+    missing = client.get("/api/v1/documents/export", headers=headers)
+    assert missing.status_code == 400
+
+
+def test_stream_zip_bounds_concurrency_and_reports_failures():
+    class _SlowStorage:
+        active = 0
+        peak = 0
+
+        def iter_file(self, key, chunk_size):
+            if key == "missing":
+                raise FileNotFoundError(key)
+            _SlowStorage.active += 1
+            _SlowStorage.peak = max(_SlowStorage.peak, _SlowStorage.active)
+            try:
+                for _ in range(3):
+                    time.sleep(0.01)
+                    yield key.encode() * chunk_size
+            finally:
+                _SlowStorage.active -= 1
+
+    entries = [ExportEntry(s3_key=f"k{i}", arcname=f"k{i}.txt") for i in range(6)]
+    entries.append(ExportEntry(s3_key="missing", arcname="missing.txt"))
+
+    async def collect():
+        return b"".join([chunk async for chunk in stream_zip(_SlowStorage(), entries, concurrency=2, chunk_size=8)])
+
+    with zipfile.ZipFile(io.BytesIO(asyncio.run(collect()))) as archive:
+        names = archive.namelist()
+        assert sorted(names) == sorted([f"k{i}.txt" for i in range(6)] + ["_export_errors.txt"])
+        assert archive.read("k3.txt") == b"k3" * 24
+        assert b"missing.txt" in archive.read("_export_errors.txt")
+    assert _SlowStorage.peak <= 2
+
+
+def test_list_is_keyset_paginated_and_skips_heavy_columns(client: TestClient):
+    headers = _tenant_headers("pages@example.com")
+    db = TestingSessionLocal()
+    try:
+        owner = db.query(User).filter(User.email == "pages@example.com").one()
+        base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        for index in range(7):
+            db.add(Document(
+                tenant_id=owner.tenant_id,
+                filename=f"{index}.pdf",
+                original_filename=f"{index}.pdf",
+                file_size=1,
+                mime_type="application/pdf",
+                document_type=DocumentType.CREDIT_REPORT,
+                status=DocumentStatus.PROCESSED,
+                s3_key=f"pages/{index}",
+                s3_url=f"https://example.com/{index}",
+                extracted_text="x" * 1000,
+                processing_metadata={"normalized_snapshot": {"tradelines": []}},
+                uploaded_by=owner.id,
+                # Two pairs share a timestamp to exercise the id tie-breaker.
+                created_at=base + timedelta(minutes=index // 2),
+                updated_at=base,
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+    statements = []
+
+    def _record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 3}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get("/api/v1/documents/", params=params, headers=headers)
+            assert response.status_code == 200
+            seen.extend(doc["original_filename"] for doc in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+
+    # Newest first; order inside a shared timestamp follows the random ids.
+    groups = [set(seen[0:1]), set(seen[1:3]), set(seen[3:5]), set(seen[5:7])]
+    assert len(seen) == 7
+    assert groups == [{"6.pdf"}, {"5.pdf", "4.pdf"}, {"3.pdf", "2.pdf"}, {"1.pdf", "0.pdf"}]
+    document_selects = [s for s in statements if "FROM documents" in s]
+    assert document_selects
+    assert not any("extracted_text" in s or "processing_metadata" in s for s in document_selects)
+
+    listed = client.get("/api/v1/documents/", params={"limit": 1}, headers=headers).json()[0]
+    assert "extracted_text" not in listed
+    detail = client.get(f"/api/v1/documents/{listed['id']}", headers=headers).json()
+    assert detail["extracted_text"] == "x" * 1000
+    assert detail["processing_metadata"]["normalized_snapshot"] == {"tradelines": []}
+
+
+def test_encrypted_upload_downloads_through_content_endpoint(client: TestClient, local_storage, monkeypatch):
+    monkeypatch.setenv("DOCUMENT_ENCRYPTION_KEY", base64.b64encode(os.urandom(32)).decode())
+    headers = _tenant_headers("sealed@example.com")
+    content = b"%PDF-1.7 " + os.urandom(200_000)
+
+    document = _upload(client, headers, content)
+    duplicate = _upload(client, headers, content, name="copy.pdf")
+    assert document["file_size"] == len(content)
+    assert duplicate["s3_url"] == document["s3_url"]
+    [stored] = local_storage.list_files("")
+    assert stored["size"] > len(content)
+    assert content[:64] not in b"".join(bytes(c) for c in local_storage.iter_file(stored["key"]))
+
+    for doc in (document, duplicate):
+        download = client.get(f"/api/v1/documents/{doc['id']}/download", headers=headers).json()
+        assert download["download_url"].startswith(f"/api/v1/documents/{doc['id']}/content?")
+        response = client.get(download["download_url"])
+        assert response.status_code == 200
+        assert response.content == content
+
+    forged = download["download_url"].replace("signature=", "signature=0")
+    assert client.get(forged).status_code == 403
+
+    entry = ExportEntry(
+        s3_key=stored["key"], arcname="report.pdf", encryption_key_id=_encryption_key_id(document["id"])
+    )
+
+    async def collect():
+        return b"".join([chunk async for chunk in stream_zip(local_storage, [entry])])
+
+    with zipfile.ZipFile(io.BytesIO(asyncio.run(collect()))) as archive:
+        assert archive.read("report.pdf") == content
+
+
+def _encryption_key_id(document_id: str) -> str:
+    db = TestingSessionLocal()
+    try:
+        document = db.get(Document, uuid.UUID(document_id))
+        assert document.is_encrypted
+        return document.encryption_key_id
+    finally:
+        db.close()
+
+
+def test_tenant_data_key_is_created_once_and_then_read_without_locking(client: TestClient, monkeypatch):
+    monkeypatch.setenv("DOCUMENT_ENCRYPTION_KEY", base64.b64encode(os.urandom(32)).decode())
+    _tenant_headers("keyed@example.com")
+    db = TestingSessionLocal()
+    commits = []
+    event.listen(db, "after_commit", lambda session: commits.append(1))
+    try:
+        tenant_id = db.query(User.tenant_id).filter(User.email == "keyed@example.com").scalar()
+        key_id = tenant_data_key_id(db, tenant_id)
+        # Created and committed in a session of its own: the caller's
+        # transaction is neither committed nor needed to keep the key
+        assert key_id and commits == []
+        db.rollback()
+        # Later calls (one per upload) are a plain read: no lock, no commit
+        assert tenant_data_key_id(db, tenant_id) == key_id
+        assert commits == []
+    finally:
+        db.close()
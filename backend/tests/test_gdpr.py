@@ -0,0 +1,331 @@
+import base64
+import io
+import json
+import os
+import uuid
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud
+from app.database import Base, get_db
+from app.main import app
+from app.models.audit_log import AuditAction, AuditLog, AuditResourceType, ComplianceEvent
+from app.models.client import Client
+from app.models.dispute import Dispute
+from app.models.document import Document, DocumentType
+from app.models.task import Task
+from app.routers import compliance as compliance_router
+from app.schemas.user import UserCreate
+from app.security import create_access_token
+from app.services import gdpr_erasure, gdpr_export
+from app.services.encryption import tenant_data_key_id
+from app.services.storage import LocalStorageService
+
+from .utils import db_override, restore_server_defaults, sqlite_database, strip_postgres_casts
+
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_gdpr.db"
+engine, TestingSessionLocal = sqlite_database(SQLALCHEMY_DATABASE_URL)
+
+
+override_get_db = db_override(TestingSessionLocal)
+
+
+@pytest.fixture(scope="module")
+def client():
+    original_defaults = strip_postgres_casts(Base.metadata)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        Base.metadata.drop_all(bind=engine)
+        restore_server_defaults(original_defaults)
+
+
+@pytest.fixture
+def local_storage(monkeypatch, tmp_path):
+    service = LocalStorageService(root=str(tmp_path))
+    monkeypatch.setattr(compliance_router, "storage_service", service)
+    return service
+
+
+def _subject(storage, email: str, subject_email: str, documents: int = 2):
+    """An admin's tenant with one client (tasks, documents, audit trail) plus a bystander"""
+    db = TestingSessionLocal()
+    try:
+        user = crud.create_user(
+            db,
+            UserCreate(
+                email=email,
+                password="StrongPass!123",
+                first_name="Privacy",
+                last_name="Officer",
+                organization_name=f"{email} Org",
+            ),
+        )
+        user.role = "admin"
+        subject = Client(tenant_id=user.tenant_id, first_name="Ada", last_name="Subject", email=subject_email)
+        bystander = Client(tenant_id=user.tenant_id, first_name="Bob", last_name="Other", email="bob@example.com")
+        db.add_all([subject, bystander])
+        db.flush()
+        for owner in (subject, bystander):
+            db.add(Task(tenant_id=user.tenant_id, client_id=owner.id, title=f"Call {owner.first_name}", created_by=user.id))
+        # The data key is created in a session of its own, which must see the tenant
+        db.commit()
+        key_id = tenant_data_key_id(db, user.tenant_id)
+        contents = {}
+        for index in range(documents):
+            content = f"statement {index} ".encode() * 500
+            stored = storage.upload_bytes(
+                content=content, tenant_id=str(user.tenant_id), document_type="credit_report",
+                filename="statement.pdf", client_id=f"{subject.id}-{index}", encryption_key_id=key_id,
+            )
+            document = Document(
+                tenant_id=user.tenant_id, client_id=subject.id, filename=stored["filename"],
+                original_filename="statement.pdf", file_size=len(content), mime_type="application/pdf",
+                document_type=DocumentType.CREDIT_REPORT, s3_key=stored["s3_key"], uploaded_by=user.id,
+                is_encrypted=bool(key_id), encryption_key_id=key_id,
+            )
+            db.add(document)
+            db.flush()
+            contents[document.id] = content
+        db.add(AuditLog(
+            tenant_id=user.tenant_id, user_id=user.id, action=AuditAction.READ,
+            resource_type=AuditResourceType.CLIENT, resource_id=str(subject.id),
+        ))
+        db.commit()
+        token = create_access_token({"sub": user.email, "tenant_id": str(user.tenant_id)})
+        return {
+            "headers": {"Authorization": f"Bearer {token}"},
+            "tenant_id": user.tenant_id,
+            "client_id": subject.id,
+            "bystander_id": bystander.id,
+            "documents": contents,
+        }
+    finally:
+        db.close()
+
+
+def _dispute_document(storage, subject, content: bytes):
+    """A document attached to one of the subject's disputes but to no client"""
+    db = TestingSessionLocal()
+    try:
+        dispute = Dispute(tenant_id=subject["tenant_id"], client_id=subject["client_id"], title="Late payment")
+        db.add(dispute)
+        db.flush()
+        stored = storage.upload_bytes(
+            content=content, tenant_id=str(subject["tenant_id"]), document_type="dispute_letter",
+            filename="letter.pdf",
+        )
+        document = Document(
+            tenant_id=subject["tenant_id"], dispute_id=dispute.id, filename=stored["filename"],
+            original_filename="letter.pdf", file_size=len(content), mime_type="application/pdf",
+            document_type=DocumentType.DISPUTE_LETTER, s3_key=stored["s3_key"],
+            uploaded_by=db.query(Document.uploaded_by).filter(Document.client_id == subject["client_id"]).limit(1).scalar(),
+        )
+        db.add(document)
+        db.commit()
+        return document.id
+    finally:
+        db.close()
+
+
+def test_access_request_exports_subject_archive(client, local_storage, monkeypatch):
+    monkeypatch.setenv("DOCUMENT_ENCRYPTION_KEY", base64.b64encode(os.urandom(32)).decode())
+    subject = _subject(local_storage, "dpo@example.com", "Ada@Example.com")
+    letter = b"dispute letter attached to no client"
+    subject["documents"][_dispute_document(local_storage, subject, letter)] = letter
+
+    response = client.post(
+        "/api/v1/compliance/gdpr-request",
+        params={"client_email": "ada@example.com", "request_type": "access"},
+        headers=subject["headers"],
+    )
+    assert response.status_code == 200
+    assert response.json()["status"] == "queued" and response.json()["matched_clients"] == 1
+
+    job = client.get(
+        f"/api/v1/compliance/gdpr-request/{response.json()['job_id']}", headers=subject["headers"]
+    ).json()
+    assert job["status"] == "completed", job
+    assert job["record_counts"]["clients"] == 1 and job["record_counts"]["tasks"] == 1
+    assert job["record_counts"]["audit_logs"] == 1
+    assert job["documents_done"] == job["documents_total"] == 3
+    assert "encryption_key_id" not in job
+    # The archive holds decrypted documents, so it is stored encrypted too
+    assert job["download_url"].startswith(f"/api/v1/compliance/gdpr-request/{job['job_id']}/archive?")
+
+    download = client.get(job["download_url"])
+    assert download.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(download.content)) as archive:
+        names = archive.namelist()
+        assert names[0] == "manifest.json"
+        manifest = json.loads(archive.read("manifest.json"))
+        assert manifest["client_ids"] == [str(subject["client_id"])]
+        tasks = [json.loads(line) for line in archive.read("data/tasks.ndjson").splitlines()]
+        assert [task["client_id"] for task in tasks] == [str(subject["client_id"])]
+        documents = [json.loads(line) for line in archive.read("data/documents.ndjson").splitlines()]
+        assert all("encryption_key_id" not in doc for doc in documents)
+        assert sorted(archive.read(entry["file"]) for entry in manifest["documents"]) == sorted(
+            subject["documents"].values()
+        )
+        assert "_export_errors.txt" not in names
+
+    forged = job["download_url"].replace("signature=", "signature=0")
+    assert client.get(forged).status_code == 403
+
+
+def test_export_fails_when_a_table_cannot_be_read(client, local_storage, monkeypatch):
+    subject = _subject(local_storage, "dpo2@example.com", "grace@example.com", documents=1)
+    original = gdpr_export.subject_queries
+
+    def broken(*args):
+        queries = original(*args)
+        queries["reminders"] = lambda db: 1 / 0
+        return queries
+
+    monkeypatch.setattr(gdpr_export, "subject_queries", broken)
+    response = client.post(
+        "/api/v1/compliance/gdpr-request",
+        params={"client_email": "grace@example.com", "request_type": "portability"},
+        headers=subject["headers"],
+    )
+    job = client.get(
+        f"/api/v1/compliance/gdpr-request/{response.json()['job_id']}", headers=subject["headers"]
+    ).json()
+    assert job["status"] == "failed" and "reminders" in job["error"]
+    assert "download_url" not in job
+
+    unknown = client.post(
+        "/api/v1/compliance/gdpr-request",
+        params={"client_email": "nobody@example.com", "request_type": "access"},
+        headers=subject["headers"],
+    )
+    assert unknown.json()["status"] is None and unknown.json()["matched_clients"] == 0
+    assert client.post(
+        "/api/v1/compliance/gdpr-request",
+        params={"client_email": "grace@example.com", "request_type": "erase"},
+        headers=subject["headers"],
+    ).status_code == 400
+
+
+def _documents(tenant_id):
+    db = TestingSessionLocal()
+    try:
+        return db.query(Document).filter(Document.tenant_id == tenant_id).all()
+    finally:
+        db.close()
+
+
+def test_delete_request_erases_subject_in_batches(client, local_storage, monkeypatch):
+    monkeypatch.setattr(gdpr_erasure, "GDPR_ERASURE_BATCH_SIZE", 1)
+    monkeypatch.setattr(gdpr_erasure, "GDPR_ERASURE_PAUSE", 0)
+    subject = _subject(local_storage, "dpo3@example.com", "erin@example.com", documents=3)
+    db = TestingSessionLocal()
+    try:
+        # The bystander shares one deduplicated object with the subject
+        shared = db.query(Document).filter(Document.client_id == subject["client_id"]).first()
+        db.add(Document(
+            tenant_id=subject["tenant_id"], client_id=subject["bystander_id"], filename=shared.filename,
+            original_filename="copy.pdf", document_type=DocumentType.CREDIT_REPORT,
+            s3_key=shared.s3_key, uploaded_by=shared.uploaded_by,
+        ))
+        db.commit()
+        shared_key = shared.s3_key
+    finally:
+        db.close()
+
+    access = client.post(
+        "/api/v1/compliance/gdpr-request",
+        params={"client_email": "erin@example.com", "request_type": "access"},
+        headers=subject["headers"],
+    ).json()
+    archive_key = client.get(
+        f"/api/v1/compliance/gdpr-request/{access['job_id']}", headers=subject["headers"]
+    ).json()["s3_key"]
+
+    response = client.post(
+        "/api/v1/compliance/gdpr-request",
+        params={"client_email": "erin@example.com", "request_type": "delete"},
+        headers=subject["headers"],
+    )
+    job = client.get(
+        f"/api/v1/compliance/gdpr-request/{response.json()['job_id']}", headers=subject["headers"]
+    ).json()
+    assert job["status"] == "completed", job
+    assert job["erased"]["documents"] == 3 and job["erased"]["tasks"] == 1
+    assert job["erased"]["gdpr_exports"] == 1
+    # Two unshared documents plus the export archive
+    assert job["objects_deleted"] == 3
+
+    remaining = local_storage.list_files("")
+    assert [f["key"] for f in remaining] == [shared_key]
+    assert archive_key not in {f["key"] for f in remaining}
+    assert [doc.client_id for doc in _documents(subject["tenant_id"])] == [subject["bystander_id"]]
+
+    db = TestingSessionLocal()
+    try:
+        assert db.get(Client, subject["client_id"]) is None
+        assert db.get(Client, subject["bystander_id"]) is not None
+        assert db.query(Task).filter(Task.tenant_id == subject["tenant_id"]).count() == 1
+        log = db.query(AuditLog).filter(AuditLog.tenant_id == subject["tenant_id"]).one()
+        assert log.resource_id == gdpr_erasure.ERASED
+        event = db.get(ComplianceEvent, uuid.UUID(response.json()["job_id"]))
+        assert event.client_id is None and event.resolved_at is not None
+        assert "s3_key" not in db.get(ComplianceEvent, uuid.UUID(access["job_id"])).event_data
+    finally:
+        db.close()
+
+
+class _FlakyStorage:
+    def __init__(self, storage, failures):
+        self.storage = storage
+        self.failures = failures
+
+    def delete_file(self, key):
+        if self.failures:
+            self.failures -= 1
+            return False
+        return self.storage.delete_file(key)
+
+
+def test_erasure_resumes_after_failure(client, local_storage):
+    subject = _subject(local_storage, "dpo5@example.com", "gwen@example.com", documents=2)
+    db = TestingSessionLocal()
+    try:
+        job = ComplianceEvent(
+            tenant_id=subject["tenant_id"], event_type="GDPR_REQUEST", title="GDPR DELETE Request",
+            event_data={"request_type": "delete", "status": "queued", "client_ids": [str(subject["client_id"])]},
+        )
+        db.add(job)
+        db.commit()
+        job_id = job.id
+        assert job_id in gdpr_erasure.pending_erasures(db, subject["tenant_id"])
+    finally:
+        db.close()
+
+    with pytest.raises(gdpr_erasure.GDPRErasureError):
+        gdpr_erasure.erase_subject(
+            TestingSessionLocal, _FlakyStorage(local_storage, failures=1), job_id, batch_size=1, pause=0
+        )
+    db = TestingSessionLocal()
+    try:
+        failed = db.get(ComplianceEvent, job_id).event_data
+        assert failed["status"] == "failed" and failed["step"] == "documents"
+        assert "tasks" in failed["steps_done"] and "documents" not in failed["steps_done"]
+        assert db.query(Document).filter(Document.client_id == subject["client_id"]).count() == 2
+        assert job_id in gdpr_erasure.pending_erasures(db, subject["tenant_id"])
+    finally:
+        db.close()
+
+    result = gdpr_erasure.erase_subject(TestingSessionLocal, local_storage, job_id, batch_size=1, pause=0)
+    assert result["status"] == "completed"
+    assert result["erased"]["documents"] == 2 and result["erased"]["tasks"] == 1
+    assert result["erased"]["clients"] == 1
+    assert _documents(subject["tenant_id"]) == []
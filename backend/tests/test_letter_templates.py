@@ -0,0 +1,138 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud
+from app.database import Base, get_db
+from app.main import app
+from app.models.letter_template import LetterTemplate
+from app.schemas.user import UserCreate
+from app.security import create_access_token
+from app.services.letter_templates_seed import SYSTEM_TEMPLATES, seed_system_templates
+
+from .utils import db_override, restore_server_defaults, sqlite_database, strip_postgres_casts
+
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_letter_templates.db"
+engine, TestingSessionLocal = sqlite_database(SQLALCHEMY_DATABASE_URL)
+
+
+override_get_db = db_override(TestingSessionLocal)
+
+
+@pytest.fixture(scope="module")
+def client():
+    original_defaults = strip_postgres_casts(Base.metadata)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        seed_system_templates(db)
+    finally:
+        db.close()
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        Base.metadata.drop_all(bind=engine)
+        restore_server_defaults(original_defaults)
+
+
+def _tenant_headers(email: str) -> dict:
+    db = TestingSessionLocal()
+    try:
+        user = crud.create_user(
+            db,
+            UserCreate(
+                email=email,
+                password="StrongPass!123",
+                first_name="Template",
+                last_name="Owner",
+                organization_name=f"{email} Org",
+            ),
+        )
+        token = create_access_token({"sub": user.email, "tenant_id": str(user.tenant_id)})
+        return {"Authorization": f"Bearer {token}"}
+    finally:
+        db.close()
+
+
+def test_system_templates_are_stored_once_and_shared(client: TestClient):
+    first = _tenant_headers("first@example.com")
+    second = _tenant_headers("second@example.com")
+
+    db = TestingSessionLocal()
+    try:
+        seed_system_templates(db)
+        assert db.query(LetterTemplate).count() == len(SYSTEM_TEMPLATES)
+    finally:
+        db.close()
+
+    for headers in (first, second):
+        response = client.get("/api/v1/letter-templates/", headers=headers)
+        assert response.status_code == 200
+        templates = response.json()
+        assert len(templates) == len(SYSTEM_TEMPLATES)
+        assert all(template["is_system"] for template in templates)
+
+
+def test_editing_system_template_creates_private_copy(client: TestClient):
+    editor = _tenant_headers("editor@example.com")
+    bystander = _tenant_headers("bystander@example.com")
+
+    templates = client.get("/api/v1/letter-templates/", headers=editor).json()
+    system = next(t for t in templates if t["slug"] == "dofd-mismatch")
+
+    response = client.put(
+        f"/api/v1/letter-templates/{system['id']}",
+        json={"subject": "Custom DOFD subject"},
+        headers=editor,
+    )
+    assert response.status_code == 200
+    forked = response.json()
+    assert forked["id"] != system["id"]
+    assert forked["source_template_id"] == system["id"]
+    assert forked["is_system"] is False
+    assert forked["subject"] == "Custom DOFD subject"
+
+    editor_slugs = client.get("/api/v1/letter-templates/", headers=editor).json()
+    matching = [t for t in editor_slugs if t["slug"] == "dofd-mismatch"]
+    assert [t["id"] for t in matching] == [forked["id"]]
+    assert client.get(f"/api/v1/letter-templates/{system['id']}", headers=editor).status_code == 404
+
+    untouched = client.get(f"/api/v1/letter-templates/{system['id']}", headers=bystander)
+    assert untouched.status_code == 200
+    assert untouched.json()["subject"] == system["subject"]
+
+
+def test_archiving_system_template_hides_it_for_one_tenant(client: TestClient):
+    archiver = _tenant_headers("archiver@example.com")
+    bystander = _tenant_headers("watcher@example.com")
+
+    templates = client.get("/api/v1/letter-templates/", headers=archiver).json()
+    system = next(t for t in templates if t["slug"] == "identity-mismatch")
+
+    response = client.delete(f"/api/v1/letter-templates/{system['id']}", headers=archiver)
+    assert response.status_code == 204
+
+    remaining = client.get("/api/v1/letter-templates/", headers=archiver).json()
+    assert "identity-mismatch" not in {t["slug"] for t in remaining}
+
+    others = client.get("/api/v1/letter-templates/", headers=bystander).json()
+    assert "identity-mismatch" in {t["slug"] for t in others}
+
+    duplicate = client.post(
+        "/api/v1/letter-templates/",
+        json={"name": "Clash", "slug": "bureau-reinvestigation", "body": "Hi"},
+        headers=bystander,
+    )
+    assert duplicate.status_code == 400
+
+    # The archived copy still owns its slug for the archiver
+    reused = client.post(
+        "/api/v1/letter-templates/",
+        json={"name": "Again", "slug": "identity-mismatch", "body": "Hi"},
+        headers=archiver,
+    )
+    assert reused.status_code == 400
@@ -0,0 +1,482 @@
+import asyncio
+import zlib
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.testclient import TestClient
+
+from app import crud  # noqa: F401  (import order: app.security needs crud first)
+from app.middleware.performance import (
+    CacheMiddleware,
+    CompressionMiddleware,
+    PerformanceMiddleware,
+    RateLimitMiddleware,
+    negotiate_encoding,
+)
+from app.middleware.security import (
+    InputValidationMiddleware,
+    RequestSizeMiddleware,
+    SecurityHeadersMiddleware,
+    contains_malicious_patterns,
+)
+from app.models.subscription import PlanType
+from app.security import create_access_token
+from app.services import rate_limit
+from app.services.response_cache import CachedResponse, ResponseCache
+
+
+def _auth(tenant_id="tenant-a", email="agent@example.com"):
+    token = create_access_token({"sub": email, "tenant_id": tenant_id})
+    return {"Authorization": f"Bearer {token}"}
+
+
+class _DictRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+def _app():
+    app = FastAPI()
+    calls = {"clients": 0}
+
+    @app.get("/api/v1/clients")
+    async def list_clients():
+        calls["clients"] += 1
+        return {"calls": calls["clients"]}
+
+    @app.post("/api/v1/clients/bulk-update")
+    async def bulk_update_clients():
+        return {"updated": 1}
+
+    @app.put("/api/v1/tags/{tag_id}")
+    async def update_tag(tag_id: str):
+        return {"id": tag_id}
+
+    @app.get("/api/v1/documents/stream")
+    async def stream():
+        async def chunks():
+            for index in range(3):
+                yield f"chunk-{index};".encode()
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    @app.get("/api/v1/reports")
+    async def report():
+        return JSONResponse({"rows": ["x" * 100] * 50})
+
+    @app.post("/api/v1/documents/upload")
+    async def upload(request: Request):
+        return {"size": len(await request.body())}
+
+    return app
+
+
+def _call(app, path, headers=()):
+    """Drive one GET through ``app`` and return the messages it sends"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "headers": [(b"host", b"testserver"), *headers],
+        "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+    }
+    messages = []
+
+    async def main():
+        requested, done = False, asyncio.Event()
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                done.set()
+
+        await app(scope, receive, send)
+
+    asyncio.run(main())
+    return messages
+
+
+def test_headers_are_added_and_streaming_passes_through():
+    app = _app()
+    app.add_middleware(PerformanceMiddleware)
+    app.add_middleware(SecurityHeadersMiddleware)
+
+    start, *body = _call(app, "/api/v1/documents/stream")
+    # Each chunk is forwarded as its own message, not collected first
+    assert [message["body"] for message in body if message["body"]] == [
+        b"chunk-0;", b"chunk-1;", b"chunk-2;"
+    ]
+    headers = [(name.decode(), value.decode()) for name, value in start["headers"]]
+    assert ("x-frame-options", "DENY") in headers
+    assert float(dict(headers)["x-process-time"]) >= 0
+
+    response = TestClient(app).get("/api/v1/reports")
+    assert response.headers["content-security-policy"].startswith("default-src 'self'")
+    # Headers are replaced, never duplicated
+    assert response.headers.get_list("x-content-type-options") == ["nosniff"]
+
+
+def test_blocked_requests_get_json_errors():
+    app = _app()
+    app.add_middleware(InputValidationMiddleware)
+    app.add_middleware(RequestSizeMiddleware, max_size=100)
+    client = TestClient(app)
+
+    response = client.get("/api/v1/reports", params={"q": "1 OR 1=1"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid query parameter"}
+    assert client.get("/api/v1/reports", params={"q": "smith"}).status_code == 200
+
+    assert client.post("/api/v1/documents/upload", content=b"x" * 101).status_code == 413
+    assert client.post("/api/v1/documents/upload", content=b"x" * 100).json() == {"size": 100}
+
+    def chunked():
+        for _ in range(3):
+            yield b"x" * 60
+    # Without Content-Length the limit applies as the body is read
+    assert client.post("/api/v1/documents/upload", content=chunked()).status_code == 413
+
+
+def test_malicious_patterns_scanned_case_insensitively():
+    for text in ["x' UNION SELECT 1", "1 oR 2 = 2", "<ScRiPt>alert(1)</script>", "JavaScript:alert(1)",
+                 "x\" onMouseOver=", "a--", "/*", "\u017felect * FROM users", "1; DROP TABLE clients",
+                 "x'; delete FROM users", "UPDATE users SET role='admin'"]:
+        assert contains_malicious_patterns(text), text
+    # Keywords on their own are ordinary values and path segments
+    for text in ["smith", "maria garcia", "-created_at", "2026-09-01T00:00:00+00:00", "selection", "ordering=1",
+                 "delete", "/api/v1/clients/bulk-update", "Apt #4", "create"]:
+        assert not contains_malicious_patterns(text), text
+
+    app = _app()
+    app.add_middleware(InputValidationMiddleware)
+    client = TestClient(app)
+    # Repeated paths and values are answered from the verdict cache
+    for _ in range(2):
+        assert client.get("/api/v1/reports", params={"limit": "50"}).status_code == 200
+        assert client.get("/api/v1/reports", params={"sort": "1;DROP table"}).status_code == 400
+
+
+def test_cache_with_redis():
+    redis_client = _DictRedis()
+    app = _app()
+    app.add_middleware(CacheMiddleware, redis_client=redis_client)
+    client = TestClient(app)
+
+    first = client.get("/api/v1/clients", headers=_auth())
+    second = client.get("/api/v1/clients", headers=_auth())
+    assert first.headers["x-cache"] == "MISS"
+    assert second.headers["x-cache"] == "HIT"
+    assert first.json() == second.json() == {"calls": 1}
+    # Anonymous requests are never served from or stored in the cache
+    assert "x-cache" not in client.get("/api/v1/clients").headers
+
+
+def test_writes_invalidate_cached_listings_per_tenant():
+    redis_client = _DictRedis()
+    app = _app()
+    app.add_middleware(CacheMiddleware, redis_client=redis_client)
+    client = TestClient(app)
+
+    assert client.get("/api/v1/clients", headers=_auth()).json() == {"calls": 1}
+    assert client.get("/api/v1/clients", headers=_auth("tenant-b")).json() == {"calls": 2}
+
+    # A write bumps only the writing tenant's version
+    assert client.post("/api/v1/clients/bulk-update", headers=_auth()).status_code == 200
+    assert client.get("/api/v1/clients", headers=_auth()).json() == {"calls": 3}
+    assert client.get("/api/v1/clients", headers=_auth("tenant-b")).json() == {"calls": 2}
+
+    # Tag writes stale client listings too
+    client.put("/api/v1/tags/vip", headers=_auth("tenant-b"))
+    assert client.get("/api/v1/clients", headers=_auth("tenant-b")).json() == {"calls": 4}
+
+    # Failed writes change nothing
+    client.post("/api/v1/clients/missing", headers=_auth())
+    assert client.get("/api/v1/clients", headers=_auth()).headers["x-cache"] == "HIT"
+
+
+def test_local_tier_fronts_redis_with_raw_bytes():
+    redis_client = _DictRedis()
+    worker_a, worker_b = _app(), _app()
+    worker_a.add_middleware(CacheMiddleware, redis_client=redis_client)
+    cache_b = ResponseCache(redis_client)
+    now = [0.0]
+    cache_b.versions.clock = lambda: now[0]
+    worker_b.add_middleware(CacheMiddleware, cache=cache_b)
+    client_a, client_b = TestClient(worker_a), TestClient(worker_b)
+
+    assert client_a.get("/api/v1/clients", headers=_auth()).headers["x-cache"] == "MISS"
+    [raw] = [value for key, value in redis_client.data.items() if key.startswith("cache:")]
+    assert raw.startswith(b"200\r\n") and raw.endswith(b'{"calls":1}')
+
+    # Another worker fills its LRU from Redis, then stops asking Redis
+    for _ in range(3):
+        response = client_b.get("/api/v1/clients", headers=_auth())
+        assert response.headers["x-cache"] == "HIT"
+        assert response.json() == {"calls": 1}
+        assert response.headers["content-type"] == "application/json"
+    stats = cache_b.stats()
+    assert stats["redis"]["hits"] == stats["redis"]["lookups"] == 1
+    assert (stats["local"]["hits"], stats["local"]["lookups"]) == (2, 3)
+    assert stats["hit_ratio"] == 1.0
+    assert stats["local"]["mean_latency_us"] > 0
+
+    # A write on worker A reaches worker B once B's version tag is a
+    # RESPONSE_CACHE_VERSION_TTL old
+    client_a.post("/api/v1/clients/bulk-update", headers=_auth())
+    assert client_b.get("/api/v1/clients", headers=_auth()).headers["x-cache"] == "HIT"
+    now[0] += 1
+    assert client_b.get("/api/v1/clients", headers=_auth()).headers["x-cache"] == "MISS"
+    assert client_b.get("/api/v1/clients", headers=_auth()).headers["x-cache"] == "HIT"
+    assert cache_b.stats()["misses"] == 1
+
+
+def test_local_tier_is_bounded_by_bytes():
+    cache = ResponseCache(_DictRedis(), max_bytes=1000)
+    for index in range(10):
+        cache.set(f"key-{index}", CachedResponse(200, [], b"x" * 300))
+    stats = cache.stats()["local"]
+    assert stats["bytes"] <= 1000
+    assert stats["entries"] == 2 and stats["evictions"] == 8
+    # Evicted entries are still in Redis
+    assert cache.get("key-0").body == b"x" * 300
+
+
+def test_token_bucket_bursts_then_refills():
+    now = [0.0]
+    bucket = rate_limit.LocalTokenBucket(clock=lambda: now[0])
+    limit = rate_limit.RateLimit(3, 60)
+
+    assert [bucket.hit("k", limit).allowed for _ in range(4)] == [True, True, True, False]
+    refused = bucket.hit("k", limit)
+    assert refused.remaining == 0 and refused.retry_after == 20.0
+
+    now[0] += 20
+    assert bucket.hit("k", limit).allowed
+    assert not bucket.hit("k", limit).allowed
+    assert bucket.hit("other", limit).remaining == 2
+
+
+def test_tenant_quota_follows_plan(monkeypatch):
+    monkeypatch.setitem(rate_limit.PLAN_RATE_LIMITS, PlanType.STARTER, 2)
+    monkeypatch.setitem(rate_limit.PLAN_RATE_LIMITS, PlanType.ENTERPRISE, 4)
+    lookups = []
+
+    def lookup(tenant_id):
+        lookups.append(tenant_id)
+        return {"tenant-a": PlanType.ENTERPRISE}.get(tenant_id)
+
+    app = _app()
+    app.add_middleware(RateLimitMiddleware, plans=rate_limit.PlanCache(lookup))
+    client = TestClient(app)
+
+    statuses = [client.get("/api/v1/reports", headers=_auth("tenant-a")).status_code for _ in range(5)]
+    assert statuses == [200, 200, 200, 200, 429]
+    # Every user of a tenant shares its bucket; no plan means the default plan
+    assert client.get("/api/v1/reports", headers=_auth("tenant-b", "a@b.com")).status_code == 200
+    assert client.get("/api/v1/reports", headers=_auth("tenant-b", "c@d.com")).status_code == 200
+    response = client.get("/api/v1/reports", headers=_auth("tenant-b"))
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Rate limit exceeded"}
+    assert response.headers["retry-after"] == "30"
+    assert response.headers["x-ratelimit-limit"] == "2"
+    assert response.headers["x-ratelimit-remaining"] == "0"
+    assert lookups == ["tenant-a", "tenant-b"]
+
+    # Anonymous traffic is limited per IP, separately from tenants
+    ok = client.get("/api/v1/reports")
+    assert ok.status_code == 200 and ok.headers["x-ratelimit-limit"] == "100"
+
+
+def test_rate_limiter_falls_back_to_memory_without_redis():
+    class _DownRedis:
+        def register_script(self, script):
+            raise ConnectionError("redis is down")
+
+    limiter = rate_limit.RateLimiter(_DownRedis())
+    app = _app()
+    app.add_middleware(RateLimitMiddleware, limiter=limiter)
+    client = TestClient(app)
+
+    statuses = [client.post("/api/v1/auth/token").status_code for _ in range(6)]
+    assert statuses[-1] == 429
+    assert limiter.metrics["local_fallbacks"] == 6
+
+
+def test_token_bucket_script_runs_on_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    limiter = rate_limit.RateLimiter(fakeredis.FakeRedis())
+    limit = rate_limit.RateLimit(3, 60)
+
+    decisions = [limiter.hit("tenant:a", limit) for _ in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions] == [2, 1, 0, 0]
+    assert 19 < decisions[-1].retry_after <= 20
+    assert limiter.hit("tenant:b", limit).remaining == 2
+    assert limiter.metrics["redis_errors"] == 0
+    # Idle buckets expire once they would have refilled
+    assert 0 < limiter.redis.redis_client.ttl("tenant:a") <= 61
+
+
+def test_rate_limit_redis_is_opt_in(monkeypatch):
+    monkeypatch.delenv("RATE_LIMIT_REDIS", raising=False)
+    assert rate_limit._redis_client_from_env() is None
+
+    monkeypatch.setenv("RATE_LIMIT_REDIS", "true")
+    monkeypatch.setattr(rate_limit.settings, "REDIS_URL", "redis://cache.internal:6380/2")
+    client = rate_limit._redis_client_from_env()
+    assert client.connection_pool.connection_kwargs["host"] == "cache.internal"
+    assert client.connection_pool.connection_kwargs["db"] == 2
+
+
+def test_compression_gzips_large_responses():
+    app = _app()
+    app.add_middleware(CompressionMiddleware)
+    client = TestClient(app)
+
+    response = client.get("/api/v1/reports", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json()["rows"][0] == "x" * 100
+
+    small = client.get("/api/v1/clients", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert small.json() == {"calls": 1}
+
+    response = client.get("/api/v1/reports", headers={"Accept-Encoding": "gzip;q=0.5, br"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json()["rows"][0] == "x" * 100
+
+    identity = client.get("/api/v1/reports", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+
+
+def test_compression_streams_chunks_and_respects_allowlist():
+    app = _app()
+    app.add_middleware(CompressionMiddleware)
+
+    start, *body = _call(app, "/api/v1/documents/stream", headers=[(b"accept-encoding", b"gzip")])
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    # Every chunk is flushed as it arrives instead of being buffered
+    chunks = [message["body"] for message in body]
+    assert len([chunk for chunk in chunks if chunk]) >= 3
+    assert zlib.decompress(b"".join(chunks), 31) == b"chunk-0;chunk-1;chunk-2;"
+
+    app = _app()
+    app.add_middleware(CompressionMiddleware, content_types=("text/",))
+    response = TestClient(app).get("/api/v1/reports", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+
+def test_compression_leaves_range_responses_alone():
+    app = _app()
+
+    @app.get("/api/v1/documents/partial")
+    async def partial():
+        return Response(
+            b"x" * 4096, status_code=206, media_type="application/pdf",
+            headers={"Content-Range": "bytes 0-4095/10000"},
+        )
+
+    @app.get("/api/v1/documents/range")
+    async def whole_range():
+        return Response(
+            b"x" * 4096, media_type="text/plain", headers={"Content-Range": "bytes 0-4095/4096"}
+        )
+
+    app.add_middleware(CompressionMiddleware, content_types=("text/", "application/pdf"))
+    client = TestClient(app)
+    for path in ("/api/v1/documents/partial", "/api/v1/documents/range"):
+        response = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+        assert response.headers["content-length"] == "4096"
+        assert response.content == b"x" * 4096
+
+
+def test_accept_encoding_negotiation():
+    assert negotiate_encoding(b"gzip, deflate, br") == "br"
+    assert negotiate_encoding(b"gzip;q=1.0, br;q=0.5") == "gzip"
+    assert negotiate_encoding(b"*") == "br"
+    assert negotiate_encoding(b"br;q=0, *;q=0.1") == "gzip"
+    assert negotiate_encoding(b"identity") is None
+    assert negotiate_encoding(b"") is None
+
+
+def test_main_app_mounts_the_middleware_stack(monkeypatch):
+    from app.main import app as main_app
+    from app.services.audit_writer import audit_log_writer
+
+    events = []
+    monkeypatch.setattr(audit_log_writer, "submit", events.append)
+    # Outermost first
+    assert [middleware.cls.__name__ for middleware in main_app.user_middleware] == [
+        "CORSMiddleware",
+        "InputValidationMiddleware",
+        "RateLimitMiddleware",
+        "AuditMiddleware",
+        "SecurityHeadersMiddleware",
+        "CompressionMiddleware",
+        "CacheMiddleware",
+    ]
+    assert main_app.user_middleware[2].kwargs["limiter"] is rate_limit.rate_limiter
+    client = TestClient(main_app)
+
+    response = client.get("/api/v1/health")
+    assert response.headers["x-frame-options"] == "DENY"
+    assert "x-ratelimit-limit" in client.get("/openapi.json").headers
+    assert client.get("/api/v1/health", params={"q": "1 OR 1=1"}).status_code == 400
+
+    schema = client.get("/openapi.json", headers={"Accept-Encoding": "br"})
+    assert schema.headers["content-encoding"] == "br"
+
+    client.get("/api/v1/no-such-route", headers=_auth(tenant_id="tenant-mounted"))
+    assert events[-1]["tenant_id"] == "tenant-mounted"
+    assert events[-1]["request_path"] == "/api/v1/no-such-route"
+
+
+def test_main_app_does_not_rate_limit_health_or_metrics(monkeypatch):
+    from app.main import app as main_app
+
+    counted = []
+    original_hit = rate_limit.rate_limiter.hit
+    monkeypatch.setattr(
+        rate_limit.rate_limiter, "hit", lambda key, limit: counted.append(key) or original_hit(key, limit)
+    )
+    client = TestClient(main_app)
+
+    # Far past the anonymous per-IP allowance
+    for _ in range(150):
+        response = client.get("/api/v1/health")
+        assert response.status_code == 200
+        assert "x-ratelimit-limit" not in response.headers
+    assert client.get("/api/v1/cache/metrics").status_code == 401
+    assert client.get("/api/v1/storage/metrics").status_code == 401
+    assert counted == []
+
+    assert "x-ratelimit-limit" in client.get("/api/v1/no-such-route").headers
+    assert len(counted) == 1
@@ -0,0 +1,120 @@
+from datetime import date, datetime, timezone
+
+from sqlalchemy.dialects import postgresql
+
+from app.services.partitioning import (
+    add_months,
+    carve_month,
+    ensure_partitions,
+    expired_months,
+    month_start,
+    partition_month,
+    partition_name,
+    partition_table,
+)
+
+
+def test_month_arithmetic_and_names():
+    assert month_start(datetime(2026, 10, 19, 23, 59, tzinfo=timezone.utc)) == date(2026, 10, 1)
+    assert add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+
+    name = partition_name("audit_logs", date(2026, 3, 1))
+    assert name == "audit_logs_y2026m03"
+    assert partition_month("audit_logs", name) == date(2026, 3, 1)
+    assert partition_month("audit_logs", "audit_logs_default") is None
+    assert partition_month("data_access_logs", name) is None
+
+
+def test_only_whole_months_past_retention_expire():
+    names = [
+        "audit_logs_default",
+        "audit_logs_y2025m08",
+        "audit_logs_y2025m09",
+        "audit_logs_y2025m10",
+        "audit_logs_y2026m10",
+    ]
+    now = datetime(2026, 10, 19, tzinfo=timezone.utc)
+
+    # 12 months back from October 2026 is October 2025: that month still
+    # overlaps the window, September 2025 ended before it.
+    assert expired_months("audit_logs", names, now, retention_months=12) == [
+        date(2025, 8, 1),
+        date(2025, 9, 1),
+    ]
+    assert expired_months("audit_logs", names, now, retention_months=24) == []
+
+
+class _RecordingConnection:
+    """Records SQL; the default partition holds rows for ``default_months``"""
+
+    def __init__(self, default_months=()):
+        self.default_months = default_months
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        self.statements.append(sql)
+        return _Result(sql, self)
+
+
+class _Result:
+    def __init__(self, sql, conn):
+        self.sql, self.conn = sql, conn
+        self.rowcount = 5
+
+    def scalars(self):
+        return []
+
+    def scalar(self):
+        # Only the "does the default hold rows for this month" probe
+        return any(f"'{month.isoformat()} 00:00:00+00'" in self.sql for month in self.conn.default_months)
+
+
+def test_carve_locks_the_default_and_moves_rows_in_one_statement():
+    conn = _RecordingConnection()
+    assert carve_month(conn, "audit_logs", date(2026, 9, 1)) == 5
+
+    lock = next(i for i, sql in enumerate(conn.statements) if sql.startswith("LOCK TABLE audit_logs_default"))
+    moves = [i for i, sql in enumerate(conn.statements) if "audit_logs_default WHERE" in sql]
+    assert len(moves) == 1 and lock < moves[0]
+    assert "DELETE FROM audit_logs_default" in conn.statements[moves[0]]
+    assert "RETURNING *" in conn.statements[moves[0]]
+
+
+def test_live_current_month_is_not_carved():
+    now = datetime(2026, 10, 19, tzinfo=timezone.utc)
+    conn = _RecordingConnection(default_months=[date(2026, 10, 1)])
+    created = ensure_partitions(conn, "audit_logs", now=now, months_ahead=1)
+
+    assert created == ["audit_logs_y2026m11"]
+    assert not any("CREATE TABLE audit_logs_y2026m10" in sql for sql in conn.statements)
+
+
+def test_partitioned_parent_recreates_the_model_indexes():
+    conn = _RecordingConnection()
+    partition_table(conn, "data_access_logs")
+
+    rename = conn.statements.index(
+        "ALTER INDEX IF EXISTS ix_data_access_logs_created_at RENAME TO ix_data_access_logs_default_created_at"
+    )
+    create = conn.statements.index("CREATE INDEX ix_data_access_logs_created_at ON data_access_logs (created_at)")
+    assert rename < create
+    assert "CREATE INDEX ix_data_access_logs_tenant_created ON data_access_logs (tenant_id, created_at)" in conn.statements
+
+
+def test_carve_validates_a_default_constraint_before_attaching():
+    conn = _RecordingConnection()
+    carve_month(conn, "audit_logs", date(2026, 9, 1))
+
+    def position(prefix):
+        return next(i for i, sql in enumerate(conn.statements) if sql.startswith(prefix))
+
+    add = position("ALTER TABLE audit_logs_default ADD CONSTRAINT audit_logs_default_not_y2026m09")
+    validate = position("ALTER TABLE audit_logs_default VALIDATE CONSTRAINT audit_logs_default_not_y2026m09")
+    attach = position("ALTER TABLE audit_logs ATTACH PARTITION audit_logs_y2026m09")
+    drop = position("ALTER TABLE audit_logs_default DROP CONSTRAINT audit_logs_default_not_y2026m09")
+    assert add < validate < attach < drop
+    assert conn.statements[add].endswith(
+        "CHECK (NOT (created_at >= '2026-09-01 00:00:00+00' AND created_at < '2026-10-01 00:00:00+00')) NOT VALID"
+    )
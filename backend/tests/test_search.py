@@ -0,0 +1,145 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud
+from app.database import Base, get_db
+from app.main import app
+from app.schemas.user import UserCreate
+from app.security import create_access_token
+from app.models.document import Document, DocumentType
+from app.models.generated_letter import GeneratedLetter
+
+from .utils import db_override, restore_server_defaults, sqlite_database, strip_postgres_casts
+
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test_search.db"
+engine, TestingSessionLocal = sqlite_database(SQLALCHEMY_DATABASE_URL)
+
+
+override_get_db = db_override(TestingSessionLocal)
+
+
+@pytest.fixture(scope="module")
+def client():
+    original_defaults = strip_postgres_casts(Base.metadata)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        Base.metadata.drop_all(bind=engine)
+        restore_server_defaults(original_defaults)
+
+
+def _tenant(email: str):
+    db = TestingSessionLocal()
+    try:
+        user = crud.create_user(
+            db,
+            UserCreate(
+                email=email,
+                password="StrongPass!123",
+                first_name="Search",
+                last_name="User",
+                organization_name=f"{email} Org",
+            ),
+        )
+        token = create_access_token({"sub": user.email, "tenant_id": str(user.tenant_id)})
+        return user, {"Authorization": f"Bearer {token}"}
+    finally:
+        db.close()
+
+
+def _seed(user, letters, documents):
+    db = TestingSessionLocal()
+    try:
+        for index, body in enumerate(letters):
+            db.add(GeneratedLetter(
+                tenant_id=user.tenant_id,
+                client_id=uuid.uuid4(),
+                case_id=uuid.uuid4(),
+                reference_code=f"REF-{index}",
+                subject=f"Dispute {index}",
+                body=body,
+                render_context={},
+                attachments=[],
+            ))
+        for index, text in enumerate(documents):
+            db.add(Document(
+                tenant_id=user.tenant_id,
+                filename=f"doc-{index}.pdf",
+                original_filename=f"doc-{index}.pdf",
+                document_type=DocumentType.CREDIT_REPORT,
+                s3_key=f"k/{index}",
+                extracted_text=text,
+                uploaded_by=user.id,
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_search_ranks_scopes_and_highlights(client: TestClient):
+    user, headers = _tenant("searcher@example.com")
+    other, other_headers = _tenant("other-searcher@example.com")
+    _seed(
+        user,
+        letters=[
+            "Midland Funding reported this account. Midland Funding must verify it.",
+            "Capital One <b>balance</b> dispute",
+        ],
+        documents=["Collection by Midland Funding LLC", "Nothing relevant here"],
+    )
+    _seed(other, letters=["Midland Funding in another tenant"], documents=[])
+
+    response = client.get("/api/v1/search/", params={"q": "midland funding"}, headers=headers)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [hit["kind"] for hit in results] == ["letter", "document"]
+    assert results[0]["rank"] >= results[1]["rank"]
+    assert "<mark>Midland</mark>" in results[0]["snippet"]
+
+    letters_only = client.get(
+        "/api/v1/search/", params={"q": "balance", "types": "letter"}, headers=headers
+    ).json()["results"]
+    assert letters_only[0]["snippet"].count("&lt;b&gt;") == 1
+
+    others = client.get("/api/v1/search/", params={"q": "midland"}, headers=other_headers).json()
+    assert len(others["results"]) == 1
+
+    bad = client.get("/api/v1/search/", params={"q": "midland", "types": "task"}, headers=headers)
+    assert bad.status_code == 400
+
+
+def test_search_keyset_pagination_walks_every_hit_once(client: TestClient):
+    user, headers = _tenant("pager@example.com")
+    _seed(user, letters=[f"equifax mention {'equifax ' * i}" for i in range(5)], documents=["equifax"] * 2)
+
+    seen, cursor = [], None
+    while True:
+        params = {"q": "equifax", "limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/api/v1/search/", params=params, headers=headers).json()
+        seen.extend(hit["id"] for hit in page["results"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert len(seen) == len(set(seen)) == 7
+    assert client.get("/api/v1/search/", params={"q": "equifax", "cursor": "!!"}, headers=headers).status_code == 400
+
+
+def test_search_covers_only_the_indexed_prefix(client: TestClient, monkeypatch):
+    monkeypatch.setattr("app.services.search.SEARCH_TEXT_CHARS", 40)
+    user, headers = _tenant("prefix@example.com")
+    _seed(user, letters=[], documents=["transunion " + "filler " * 10 + "experian"])
+
+    hits = client.get("/api/v1/search/", params={"q": "transunion"}, headers=headers).json()["results"]
+    assert len(hits) == 1
+    assert client.get("/api/v1/search/", params={"q": "experian"}, headers=headers).json()["results"] == []
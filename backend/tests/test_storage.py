@@ -0,0 +1,293 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from app.services import encryption, storage
+from app.services.encryption import DocumentEncryptionError
+from app.services.presigned_cache import PresignedURLCache
+from app.services.storage import LocalStorageService, S3StorageService, sniff_mime_type
+
+
+class _RecordingS3Client:
+    def __init__(self):
+        self.calls = []
+        self.parts = []
+
+    def put_object(self, **kwargs):
+        self.calls.append("put_object")
+        self.parts.append(kwargs["Body"])
+        return {"ETag": '"single"'}
+
+    def create_multipart_upload(self, **kwargs):
+        self.calls.append("create_multipart_upload")
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, **kwargs):
+        self.calls.append("upload_part")
+        self.parts.append(kwargs["Body"])
+        return {"ETag": f'"part-{kwargs["PartNumber"]}"'}
+
+    def complete_multipart_upload(self, **kwargs):
+        self.calls.append("complete_multipart_upload")
+        assert [p["PartNumber"] for p in kwargs["MultipartUpload"]["Parts"]] == list(
+            range(1, len(self.parts) + 1)
+        )
+        return {"ETag": '"multi"'}
+
+    def abort_multipart_upload(self, **kwargs):
+        self.calls.append("abort_multipart_upload")
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_CHUNK_SIZE", 16)
+    monkeypatch.setattr(storage, "S3_MIN_PART_SIZE", 16)
+    svc = S3StorageService.__new__(S3StorageService)
+    svc.s3_client = _RecordingS3Client()
+    svc.bucket_name = "test-bucket"
+    return svc
+
+
+def _upload(content: bytes, filename: str = "report.pdf") -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename=filename)
+
+
+def test_small_upload_uses_single_put(service):
+    content = b"%PDF-1.7 tiny"
+    result = asyncio.run(service.upload_file(_upload(content), "tenant", "credit_report"))
+
+    assert service.s3_client.calls == ["put_object"]
+    assert result["file_size"] == len(content)
+    assert result["mime_type"] == "application/pdf"
+    assert result["content_sha256"] == hashlib.sha256(content).hexdigest()
+
+
+def test_large_upload_streams_multipart_parts(service):
+    content = b"%PDF-" + bytes(range(60))
+    result = asyncio.run(service.upload_file(_upload(content), "tenant", "credit_report"))
+
+    assert service.s3_client.calls[0] == "create_multipart_upload"
+    assert service.s3_client.calls[-1] == "complete_multipart_upload"
+    assert all(len(part) <= 16 for part in service.s3_client.parts)
+    assert b"".join(service.s3_client.parts) == content
+    assert result["file_size"] == len(content)
+    assert result["content_sha256"] == hashlib.sha256(content).hexdigest()
+    assert result["s3_etag"] == "multi"
+
+
+def test_oversized_upload_is_rejected_and_aborted(service):
+    content = b"x" * 100
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(
+            service.upload_file(_upload(content), "tenant", "other", max_size=40)
+        )
+
+    assert exc.value.status_code == 400
+    assert service.s3_client.calls[-1] == "abort_multipart_upload"
+
+
+def test_sniff_mime_type():
+    assert sniff_mime_type(b"\x89PNG\r\n\x1a\n....") == "image/png"
+    assert sniff_mime_type(b'  {"tradelines": []}') == "application/json"
+    assert sniff_mime_type(b"<?xml version='1.0'?>") == "application/xml"
+    assert sniff_mime_type(b"name,balance\n") is None
+
+
+@pytest.fixture
+def local_service(monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "UPLOAD_CHUNK_SIZE", 16)
+    return LocalStorageService(root=str(tmp_path))
+
+
+def test_local_upload_round_trips_through_mmap(local_service):
+    content = b"%PDF-" + bytes(range(60))
+    result = asyncio.run(
+        local_service.upload_file(_upload(content), "tenant", "credit_report", client_id="c1")
+    )
+
+    assert result["s3_key"].startswith("tenants/tenant/credit_report/clients/c1/")
+    assert result["content_sha256"] == hashlib.sha256(content).hexdigest()
+    assert result["mime_type"] == "application/pdf"
+    chunks = list(local_service.iter_file(result["s3_key"], 16))
+    assert all(type(chunk) is bytes and len(chunk) <= 16 for chunk in chunks)
+    assert b"".join(chunks) == content
+    assert [f["key"] for f in local_service.list_files("tenants/tenant/")] == [result["s3_key"]]
+
+    assert local_service.delete_file(result["s3_key"]) is True
+    assert local_service.list_files("tenants/tenant/") == []
+
+
+def test_local_listing_walks_only_the_prefix_directory(local_service, monkeypatch):
+    keys = [
+        local_service.upload_bytes(
+            content=b"x", tenant_id=tenant, document_type="other", filename="a.txt"
+        )["s3_key"]
+        for tenant in ("alpha", "alps", "beta")
+    ]
+    walked = []
+    real_walk = os.walk
+
+    def recording_walk(top):
+        for dirpath, dirnames, filenames in real_walk(top):
+            walked.append(os.path.relpath(dirpath, local_service.root))
+            yield dirpath, dirnames, filenames
+
+    monkeypatch.setattr(storage.os, "walk", recording_walk)
+
+    assert sorted(f["key"] for f in local_service.list_files("tenants/al")) == keys[:2]
+    assert not any("beta" in path for path in walked)
+    walked.clear()
+    assert [f["key"] for f in local_service.list_files("tenants/beta/other/")] == [keys[2]]
+    assert walked[0] == "tenants/beta/other"
+    assert local_service.list_files("../") == []
+
+
+def test_local_oversized_upload_leaves_nothing_behind(local_service):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(local_service.upload_file(_upload(b"x" * 100), "tenant", "other", max_size=40))
+
+    assert exc.value.status_code == 400
+    assert local_service.list_files("") == []
+
+
+def test_local_signed_urls_and_key_containment(local_service):
+    result = local_service.upload_bytes(
+        content=b"hello", tenant_id="tenant", document_type="other", filename="a.txt"
+    )
+    url = local_service.generate_presigned_url(result["s3_key"], expiration=60)
+    query = dict(part.split("=", 1) for part in url.split("?", 1)[1].split("&"))
+
+    expires = int(query["expires"])
+    assert local_service.verify_signature(result["s3_key"], expires, query["signature"])
+    assert not local_service.verify_signature("tenants/other/a.txt", expires, query["signature"])
+    assert not local_service.verify_signature(result["s3_key"], 1, local_service.sign(result["s3_key"], 1))
+
+    with pytest.raises(HTTPException):
+        local_service.path_for("../outside.txt")
+
+
+class _CountingStorage:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_presigned_url(self, s3_key, expiration=3600, method="get_object"):
+        self.calls += 1
+        return f"https://example.com/{s3_key}?v={self.calls}"
+
+
+class _DictRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value.encode()
+
+
+def test_presigned_urls_are_reused_until_margin():
+    now = [1000.0]
+    backend = _CountingStorage()
+    cache = PresignedURLCache(backend, reuse_margin=0.5, clock=lambda: now[0])
+
+    first, remaining = cache.get_url("a.pdf", expiration=100)
+    now[0] += 40
+    second, remaining = cache.get_url("a.pdf", expiration=100)
+    assert (first, remaining) == (second, 60)
+    assert cache.get_url("a.pdf", expiration=10)[0] != first
+
+    now[0] += 20
+    third, remaining = cache.get_url("a.pdf", expiration=100)
+    assert third != first and remaining == 100
+    assert cache.stats()["local_hits"] == 1
+    assert cache.stats()["misses"] == 3
+
+
+def test_presigned_cache_redis_tier_and_lru_eviction():
+    now = [0.0]
+    redis = _DictRedis()
+    backend = _CountingStorage()
+    warm = PresignedURLCache(backend, max_entries=1, redis_client=redis, clock=lambda: now[0])
+    url, _ = warm.get_url("a.pdf")
+    warm.get_url("b.pdf")
+    assert warm.stats()["evictions"] == 1
+
+    cold = PresignedURLCache(backend, redis_client=redis, clock=lambda: now[0])
+    assert cold.get_url("a.pdf")[0] == url
+    assert cold.stats()["redis_hits"] == 1
+    assert backend.calls == 2
+
+
+@pytest.fixture
+def data_key_id(monkeypatch):
+    monkeypatch.setenv("DOCUMENT_ENCRYPTION_KEY", base64.b64encode(os.urandom(32)).decode())
+    monkeypatch.setattr(encryption, "ENCRYPTION_CHUNK_SIZE", 32)
+    return encryption.generate_data_key()
+
+
+def test_chunked_encryption_round_trips_and_detects_tampering(data_key_id):
+    content = bytes(range(200))
+    sealed = encryption.encrypt_bytes(content, data_key_id)
+    assert len(sealed) == encryption.ciphertext_size(len(content), 32)
+    # Arbitrary read boundaries decrypt the same as one large read
+    pieces = [sealed[i:i + 7] for i in range(0, len(sealed), 7)]
+    assert b"".join(encryption.decrypt_chunks(pieces, data_key_id)) == content
+    assert b"".join(encryption.decrypt_chunks([encryption.encrypt_bytes(b"", data_key_id)], data_key_id)) == b""
+
+    flipped = bytearray(sealed)
+    flipped[40] ^= 1
+    truncated = sealed[:16 + 2 * 48]  # header + two whole chunks
+    for broken in (bytes(flipped), truncated):
+        with pytest.raises(DocumentEncryptionError):
+            b"".join(encryption.decrypt_chunks([broken], data_key_id))
+
+    with pytest.raises(DocumentEncryptionError):
+        b"".join(encryption.decrypt_chunks([sealed], encryption.generate_data_key()))
+
+
+def test_local_encrypted_upload_stores_ciphertext(local_service, data_key_id):
+    content = b"%PDF-" + bytes(range(100))
+    result = asyncio.run(
+        local_service.upload_file(
+            _upload(content), "tenant", "credit_report", encryption_key_id=data_key_id
+        )
+    )
+
+    assert result["file_size"] == len(content)
+    assert result["content_sha256"] == hashlib.sha256(content).hexdigest()
+    assert result["mime_type"] == "application/pdf"
+    stored = b"".join(bytes(chunk) for chunk in local_service.iter_file(result["s3_key"]))
+    assert content[:5] not in stored
+    plaintext = encryption.iter_plaintext(local_service, result["s3_key"], data_key_id)
+    assert b"".join(plaintext) == content
+
+
+def test_s3_encrypted_multipart_upload(service, data_key_id):
+    content = b"%PDF-" + bytes(range(100))
+    asyncio.run(
+        service.upload_file(_upload(content), "tenant", "credit_report", encryption_key_id=data_key_id)
+    )
+
+    assert service.s3_client.calls[-1] == "complete_multipart_upload"
+    sealed = b"".join(service.s3_client.parts)
+    assert b"".join(encryption.decrypt_chunks([sealed], data_key_id)) == content
+
+
+def test_s3_encrypted_parts_meet_the_minimum_part_size(service, data_key_id, monkeypatch):
+    # Sealed chunks of 32 bytes plus overhead never line up with 40 byte parts
+    monkeypatch.setattr(storage, "S3_MIN_PART_SIZE", 40)
+    content = b"%PDF-" + bytes(range(250))
+    asyncio.run(
+        service.upload_file(_upload(content), "tenant", "credit_report", encryption_key_id=data_key_id)
+    )
+
+    parts = service.s3_client.parts
+    assert len(parts) > 2
+    assert all(len(part) >= 40 for part in parts[:-1])
+    assert b"".join(encryption.decrypt_chunks([b"".join(parts)], data_key_id)) == content
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
-from sqlalchemy import MetaData, text
+from typing import Callable, Iterator, List, Tuple
+
+from sqlalchemy import Column, DefaultClause, MetaData, create_engine, text
 from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID as PG_UUID
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session, sessionmaker
 
 
 @compiles(JSONB, 'sqlite')
@@ -20,26 +24,50 @@ def _compile_uuid(_element, _compiler, **_kw):
     return 'CHAR(36)'
 
 
-def strip_postgres_casts(metadata: MetaData) -> None:
-    """Remove Postgres-specific cast syntax from server defaults for SQLite."""
+def sqlite_database(url: str) -> Tuple[Engine, sessionmaker]:
+    """Engine and session factory for a SQLite test database shared across threads."""
+    engine = create_engine(url, connect_args={'check_same_thread': False})
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def db_override(session_factory: Callable[[], Session]) -> Callable[[], Iterator[Session]]:
+    """A ``get_db`` replacement that hands out sessions from ``session_factory``."""
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+    return override_get_db
+
+
+def strip_postgres_casts(metadata: MetaData) -> List[Tuple[Column, DefaultClause]]:
+    """Remove Postgres-specific cast syntax from server defaults for SQLite.
+
+    ``'{}'::jsonb`` becomes ``'{}'``; other defaults (``now()``) are left
+    alone. Returns the replaced defaults for :func:`restore_server_defaults`.
+    """
+    originals = []
     for table in metadata.tables.values():
         for column in table.columns:
             default = column.server_default
             if default is None:
                 continue
-            raw = getattr(default, 'arg', default)
-            raw_text = str(raw).strip()
-            if not raw_text:
-                column.server_default = None
+            raw_text = str(getattr(default, 'arg', default)).strip()
+            if '::' not in raw_text:
                 continue
+            originals.append((column, default))
             if raw_text.startswith('(') and raw_text.endswith(')'):
                 raw_text = raw_text[1:-1].strip()
-            if '::' in raw_text:
-                raw_text = raw_text.split('::', 1)[0].strip()
-            if not raw_text:
-                column.server_default = None
-            else:
-                column.server_default = text(raw_text)
+            raw_text = raw_text.split('::', 1)[0].strip()
+            column.server_default = DefaultClause(text(raw_text)) if raw_text else None
+    return originals
+
+
+def restore_server_defaults(originals: List[Tuple[Column, DefaultClause]]) -> None:
+    """Put back the defaults replaced by :func:`strip_postgres_casts`."""
+    for column, original in originals:
+        column.server_default = original
 
 
-__all__ = ['strip_postgres_casts']
+__all__ = ['db_override', 'restore_server_defaults', 'sqlite_database', 'strip_postgres_casts']